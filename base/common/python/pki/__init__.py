@@ -25,6 +25,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 from functools import wraps
+import concurrent.futures
 import cryptography.x509
 import ldap.dn
 import logging
@@ -37,6 +38,7 @@ import sys
 
 import requests
 import six
+from six.moves.urllib.parse import parse_qsl, urlparse  # pylint: disable=F0401,E0611
 
 
 CONF_DIR = '/etc/pki'
@@ -643,6 +645,173 @@ class PropertyFile(object):
         return None
 
 
+class Record(object):
+    """
+    Compact representation of an entry returned by a REST service.
+
+    Subclasses declare their attributes in __slots__ and map JSON keys
+    to attribute names in json_attribute_names (JSON keys that match an
+    attribute name need no mapping). Values can be converted with the
+    functions in json_converters, keyed by attribute name. JSON keys
+    that are not in the schema are kept in a separate dict and are
+    still accessible as attributes.
+
+    Attributes that have not been set are None. In lazy mode from_json()
+    only keeps a reference to the JSON dict and each attribute is
+    decoded the first time it is accessed.
+    """
+
+    __slots__ = ('_json', '_extra')
+
+    json_attribute_names = {}
+    json_converters = {}
+
+    def __init__(self):
+        object.__setattr__(self, '_json', None)
+        object.__setattr__(self, '_extra', None)
+
+    @classmethod
+    def get_schema(cls):
+        """
+        Return a tuple of a dict that maps JSON keys to attribute names
+        and a dict that maps attribute names to JSON keys.
+        """
+
+        schema = cls.__dict__.get('_json_schema')
+        if schema:
+            return schema
+
+        attributes = {}
+        for c in reversed(cls.__mro__):
+            for name in c.__dict__.get('__slots__', ()):
+                if not name.startswith('_'):
+                    attributes[name] = name
+
+        json_keys = {}
+        for key, name in six.iteritems(cls.json_attribute_names):
+            json_keys[name] = key
+            attributes.pop(name, None)
+        json_keys.update(attributes)
+
+        schema = ({key: name for name, key in six.iteritems(json_keys)}, json_keys)
+
+        # The schema is stored in the class itself so that subclasses
+        # do not share the schema of the parent class.
+        setattr(cls, '_json_schema', schema)
+        return schema
+
+    @classmethod
+    def from_json(cls, json_value, lazy=False):
+        """
+        Return a record from its JSON representation.
+
+        :param json_value: JSON representation of the record
+        :type json_value: dict
+        :param lazy: decode the attributes when they are accessed
+        :type lazy: bool
+        :return: pki.Record
+        """
+        if json_value is None:
+            return None
+
+        record = cls.__new__(cls)
+        set_attribute = object.__setattr__
+
+        if lazy:
+            set_attribute(record, '_json', json_value)
+            set_attribute(record, '_extra', None)
+            return record
+
+        names = cls.get_schema()[0]
+        converters = cls.json_converters
+        extra = {}
+
+        for key, value in six.iteritems(json_value):
+            name = names.get(key)
+
+            if name is None:
+                extra[key] = value
+                continue
+
+            if value is not None and name in converters:
+                value = converters[name](value)
+
+            set_attribute(record, name, value)
+
+        set_attribute(record, '_json', None)
+        set_attribute(record, '_extra', extra)
+        return record
+
+    @classmethod
+    def from_json_list(cls, json_value, lazy=False):
+        """
+        Return a list of records from a JSON list or a single JSON
+        object of a collection.
+        """
+        if json_value is None:
+            return []
+
+        if not isinstance(json_value, list):
+            json_value = [json_value]
+
+        from_json = cls.from_json
+        return [from_json(value, lazy=lazy) for value in json_value]
+
+    def get_extra(self):
+        """
+        Return the JSON attributes that are not in the schema.
+        """
+        extra = self._extra
+
+        if extra is None:
+            extra = {}
+
+            if self._json is not None:
+                names = self.get_schema()[0]
+                for key, value in six.iteritems(self._json):
+                    if key not in names:
+                        extra[key] = value
+
+            object.__setattr__(self, '_extra', extra)
+
+        return extra
+
+    def __getattr__(self, name):
+
+        # This is only called for attributes that have not been set
+        # (or decoded) yet.
+
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        json_keys = self.get_schema()[1]
+
+        if name not in json_keys:
+            extra = self.get_extra()
+            if name in extra:
+                return extra[name]
+            raise AttributeError(
+                '%r object has no attribute %r' % (type(self).__name__, name))
+
+        value = None
+
+        if self._json is not None:
+            value = self._json.get(json_keys[name])
+            if value is not None and name in self.json_converters:
+                value = self.json_converters[name](value)
+
+        object.__setattr__(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+
+        if name in self.get_schema()[1] or hasattr(type(self), name):
+            object.__setattr__(self, name, value)
+            return
+
+        self.get_extra()[name] = value
+
+
 class Link(object):
     """
         Stores the information of the  resteasy's Link object sent by the server
@@ -668,3 +837,87 @@ class Link(object):
         for attr in attr_list:
             setattr(link, attr, attr_list[attr])
         return link
+
+    def get_query_params(self):
+        """
+        Return the query parameters of the link's URL.
+
+        :return: dict
+        """
+        return dict(parse_qsl(urlparse(self.href).query))
+
+
+def parse_links(json_value):
+    """
+    Return the list of Link objects of a collection.
+
+    :param json_value: JSON representation of the collection
+    :type json_value: dict
+    :return: list of pki.Link
+    """
+    links = json_value.get('Link')
+    if links is None:
+        return []
+    if not isinstance(links, list):
+        links = [links]
+    return [Link.from_json(link) for link in links]
+
+
+def get_next_page_params(links):
+    """
+    Return the query parameters of the 'next' link in a collection,
+    or None if this is the last page.
+
+    :param links: links returned with the collection
+    :type links: list of pki.Link
+    :return: dict or None
+    """
+    for link in links:
+        if getattr(link, 'relationship', None) == 'next' and getattr(link, 'href', None):
+            return link.get_query_params()
+    return None
+
+
+def iterate_pages(fetch_page, prefetch=True):
+    """
+    Iterate over the entries of a paged collection by following the
+    'next' links returned by the server. Only the current page (and the
+    prefetched next page) is held in memory.
+
+    :param fetch_page: function that takes a dict of query parameters
+        (empty for the first page, otherwise taken from the 'next' link)
+        and returns an iterable collection with a ``links`` attribute
+    :type fetch_page: callable
+    :param prefetch: retrieve the next page in the background while the
+        current page is being consumed
+    :type prefetch: bool
+    :return: generator of collection entries
+    """
+    executor = None
+    if prefetch:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    try:
+        page = fetch_page({})
+
+        while True:
+            params = get_next_page_params(page.links)
+
+            future = None
+            if params is not None and executor:
+                future = executor.submit(fetch_page, params)
+
+            for entry in page:
+                yield entry
+
+            if params is None:
+                return
+
+            if future:
+                page = future.result()
+            else:
+                page = fetch_page(params)
+
+    finally:
+        if executor:
+            executor.shutdown(wait=False)
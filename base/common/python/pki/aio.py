@@ -0,0 +1,222 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the Lesser GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (C) 2021 Red Hat, Inc.
+# All rights reserved.
+#
+"""
+Asyncio interface for the PKI client library.
+
+python-requests does not provide an asyncio transport, so the coroutines
+in this module run the blocking client calls on a bounded pool of worker
+threads shared by all clients of a connection. The number of requests in
+flight is limited by max_concurrency regardless of how many coroutines
+are waiting, e.g.:
+
+    async with AsyncPKIConnection(protocol='https', port='8443',
+                                  max_concurrency=50) as connection:
+        client = AsyncCertClient(connection)
+        results = await asyncio.gather(*[
+            client.enroll_cert('caUserCert', inputs) for inputs in input_list])
+"""
+
+from __future__ import absolute_import
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+
+import pki.cert
+import pki.client
+import pki.key
+
+DEFAULT_CONCURRENCY = 10
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPKIConnection(object):
+    """
+    Asyncio wrapper for PKIConnection.
+    """
+
+    def __init__(self, connection=None, max_concurrency=DEFAULT_CONCURRENCY,
+                 **kwargs):
+        """
+        :param connection: existing connection to use, otherwise a new
+          connection is created with the remaining keyword arguments
+        :type connection: PKIConnection
+        :param max_concurrency: maximum number of requests in flight
+        :type max_concurrency: int
+        """
+
+        if connection is None:
+            # keep one pooled connection per worker
+            kwargs.setdefault('pool_maxsize', max_concurrency)
+            connection = pki.client.PKIConnection(**kwargs)
+
+        self.connection = connection
+        self.max_concurrency = max_concurrency
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency)
+
+    @property
+    def subsystem(self):
+        return self.connection.subsystem
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run a blocking call on the connection's worker pool.
+        """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            functools.partial(func, *args, **kwargs))
+
+    def authenticate(self, username=None, password=None):
+        self.connection.authenticate(username, password)
+
+    def set_authentication_cert(self, pem_cert_path, pem_key_path=None):
+        self.connection.set_authentication_cert(pem_cert_path, pem_key_path)
+
+    async def get(self, path, headers=None, params=None, payload=None,
+                  timeout=None):
+        return await self.run(
+            self.connection.get, path,
+            headers=headers, params=params, payload=payload,
+            timeout=timeout)
+
+    async def post(self, path, payload, headers=None, params=None):
+        return await self.run(
+            self.connection.post, path, payload,
+            headers=headers, params=params)
+
+    async def put(self, path, payload, headers=None):
+        return await self.run(
+            self.connection.put, path, payload, headers=headers)
+
+    async def delete(self, path, headers=None):
+        return await self.run(
+            self.connection.delete, path, headers=headers)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AsyncCertClient(object):
+    """
+    Asyncio variant of CertClient.
+    """
+
+    def __init__(self, connection):
+        """
+        :param connection: asyncio connection
+        :type connection: AsyncPKIConnection
+        """
+
+        self.connection = connection
+        self.client = pki.cert.CertClient(connection.connection)
+
+        # created on first use to bind to the running event loop
+        self.template_lock = None
+
+    async def get_cert(self, cert_serial_number):
+        """ Return a CertData object for a particular certificate. """
+        return await self.connection.run(
+            self.client.get_cert, cert_serial_number)
+
+    async def list_certs(self, max_results=None, max_time=None, start=None,
+                         size=None, **cert_search_params):
+        """ Return a CertDataInfoCollection object (see CertClient.list_certs()). """
+        return await self.connection.run(
+            self.client.list_certs,
+            max_results=max_results, max_time=max_time,
+            start=start, size=size, **cert_search_params)
+
+    async def revoke_cert(self, cert_serial_number, revocation_reason=None,
+                          invalidity_date=None, comments=None, nonce=None,
+                          authority=None):
+        """ Revoke a certificate (see CertClient.revoke_cert()). """
+        return await self.connection.run(
+            self.client.revoke_cert, cert_serial_number,
+            revocation_reason=revocation_reason,
+            invalidity_date=invalidity_date,
+            comments=comments, nonce=nonce, authority=authority)
+
+    async def enroll_cert(self, profile_id, inputs, authority=None):
+        """
+        Enroll a certificate (see CertClient.enroll_cert()).
+        Returns a list of CertEnrollmentResult objects.
+        """
+
+        # Fetch the enrollment template once, so concurrent enrollments
+        # with the same profile reuse the cached template.
+        if profile_id not in self.client.enrollment_templates:
+
+            if not self.template_lock:
+                self.template_lock = asyncio.Lock()
+
+            async with self.template_lock:
+                if profile_id not in self.client.enrollment_templates:
+                    await self.connection.run(
+                        self.client.get_enrollment_template, profile_id)
+
+        return await self.connection.run(
+            self.client.enroll_cert, profile_id, inputs, authority=authority)
+
+
+class AsyncKeyClient(object):
+    """
+    Asyncio variant of KeyClient.
+
+    The crypto provider is shared by the worker threads, so it must be
+    thread-safe (e.g. CryptographyCryptoProvider).
+    """
+
+    def __init__(self, connection, crypto, transport_cert_nick=None,
+                 info_client=None):
+        """
+        :param connection: asyncio connection
+        :type connection: AsyncPKIConnection
+        """
+
+        self.connection = connection
+        self.client = pki.key.KeyClient(
+            connection.connection, crypto,
+            transport_cert_nick=transport_cert_nick,
+            info_client=info_client)
+
+    async def archive_key(self, client_key_id, data_type, private_data,
+                          key_algorithm=None, key_size=None, realm=None):
+        """ Archive a secret (see KeyClient.archive_key()). """
+        return await self.connection.run(
+            self.client.archive_key, client_key_id, data_type, private_data,
+            key_algorithm=key_algorithm, key_size=key_size, realm=realm)
+
+    async def retrieve_key(self, key_id=None, trans_wrapped_session_key=None,
+                           request_id=None):
+        """ Retrieve a secret (see KeyClient.retrieve_key()). """
+        return await self.connection.run(
+            self.client.retrieve_key, key_id=key_id,
+            trans_wrapped_session_key=trans_wrapped_session_key,
+            request_id=request_id)
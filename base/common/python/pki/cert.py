@@ -21,9 +21,14 @@
 
 from __future__ import absolute_import
 from __future__ import print_function
+import collections
+import concurrent.futures
 import copy
 import json
 import logging
+import math
+import threading
+import time
 
 from six import iteritems
 
@@ -92,12 +97,17 @@ class CertData(object):
         return cert_data
 
 
-class CertDataInfo(object):
+class CertDataInfo(pki.Record):
     """
     Class containing information contained in a CertRecord on the CA.
     This data is returned when searching/listing certificate records.
     """
 
+    __slots__ = (
+        'serial_number', 'subject_dn', 'status', 'type', 'version',
+        'key_algorithm_oid', 'key_length', 'not_valid_before',
+        'not_valid_after', 'issued_on', 'issued_by', 'link')
+
     json_attribute_names = {
         'id': 'serial_number', 'SubjectDN': 'subject_dn', 'Status': 'status',
         'Type': 'type', 'Version': 'version', 'KeyLength': 'key_length',
@@ -106,20 +116,7 @@ class CertDataInfo(object):
         'NotValidAfter': 'not_valid_after', 'IssuedOn': 'issued_on',
         'IssuedBy': 'issued_by'}
 
-    def __init__(self):
-        """ Constructor """
-        self.serial_number = None
-        self.subject_dn = None
-        self.status = None
-        self.type = None
-        self.version = None
-        self.key_algorithm_oid = None
-        self.key_length = None
-        self.not_valid_before = None
-        self.not_valid_after = None
-        self.issued_on = None
-        self.issued_by = None
-        self.link = None
+    json_converters = {'link': pki.Link.from_json}
 
     def __repr__(self):
         obj = {
@@ -131,23 +128,6 @@ class CertDataInfo(object):
             }}
         return str(obj)
 
-    @classmethod
-    def from_json(cls, attr_list):
-        """ Return CertDataInfo object from JSON dict """
-        cert_data_info = cls()
-        for k, v in iteritems(attr_list):
-            if k not in ['Link']:
-                if k in CertDataInfo.json_attribute_names:
-                    setattr(cert_data_info,
-                            CertDataInfo.json_attribute_names[k], v)
-                else:
-                    setattr(cert_data_info, k, v)
-
-        if 'Link' in attr_list:
-            cert_data_info.link = pki.Link.from_json(attr_list['Link'])
-
-        return cert_data_info
-
 
 class CertDataInfoCollection(object):
     """
@@ -165,32 +145,26 @@ class CertDataInfoCollection(object):
         return iter(self.cert_data_info_list)
 
     @classmethod
-    def from_json(cls, json_value):
+    def from_json(cls, json_value, lazy=False):
         """ Populate object from JSON input """
         ret = cls()
-        cert_infos = json_value['entries']
-        if not isinstance(cert_infos, list):
-            ret.cert_data_info_list.append(CertDataInfo.from_json(cert_infos))
-        else:
-            for cert_info in cert_infos:
-                ret.cert_data_info_list.append(
-                    CertDataInfo.from_json(cert_info))
-
-        links = json_value['Link']
-        if not isinstance(links, list):
-            ret.links.append(pki.Link.from_json(links))
-        else:
-            for link in links:
-                ret.links.append(pki.Link.from_json(link))
+        ret.cert_data_info_list = CertDataInfo.from_json_list(
+            json_value['entries'], lazy=lazy)
+        ret.links = pki.parse_links(json_value)
 
         return ret
 
 
-class CertRequestInfo(object):
+class CertRequestInfo(pki.Record):
     """
        An object of this class stores represents a
        certificate request.
     """
+
+    __slots__ = (
+        'request_type', 'request_url', 'request_status', 'operation_result',
+        'cert_id', 'cert_request_type', 'cert_url', 'error_message')
+
     json_attribute_names = {
         'requestType': 'request_type', 'requestURL': 'request_url',
         'requestStatus': 'request_status', 'certId': 'cert_id',
@@ -198,18 +172,6 @@ class CertRequestInfo(object):
         'errorMessage': 'error_message', 'certRequestType': 'cert_request_type'
     }
 
-    def __init__(self):
-        """ Constructor """
-        self.request_id = None
-        self.request_type = None
-        self.request_url = None
-        self.request_status = None
-        self.operation_result = None
-        self.cert_id = None
-        self.cert_request_type = None
-        self.cert_url = None
-        self.error_message = None
-
     def __repr__(self):
         obj = {
             'CertRequestInfo': {
@@ -221,23 +183,11 @@ class CertRequestInfo(object):
         }
         return str(obj)
 
-    @classmethod
-    def from_json(cls, attr_list):
-        cert_request_info = cls()
-
-        for k, v in iteritems(attr_list):
-            if k not in ['Link']:
-                if k in CertRequestInfo.json_attribute_names:
-                    setattr(cert_request_info,
-                            CertRequestInfo.json_attribute_names[k], v)
-                else:
-                    setattr(cert_request_info, k, v)
-
-        cert_request_info.request_id = \
-            str(cert_request_info.request_url)[(str(
-                cert_request_info.request_url).rfind("/") + 1):]
-
-        return cert_request_info
+    @property
+    def request_id(self):
+        """ Return the request ID as parsed from the request URL """
+        request_url = str(self.request_url)
+        return request_url[request_url.rfind("/") + 1:]
 
 
 class CertRequestStatus(object):
@@ -268,6 +218,101 @@ class CertEnrollmentResult(object):
         self.cert = cert
 
 
+class CertEnrollmentBatchResult(object):
+    """
+    Class containing the outcome of one item of a batch enrollment
+    (see CertClient.enroll_many()).
+    """
+
+    def __init__(self, index, inputs, results=None, error=None, latency=None):
+        """ Initializer.
+        :param: index: position of the item in the batch
+        :param: inputs: profile inputs used for the enrollment
+        :param: results: list of CertEnrollmentResult objects (if successful)
+        :param: error: exception raised by the enrollment (if failed)
+        :param: latency: time taken by the enrollment in seconds
+        """
+        self.index = index
+        self.inputs = inputs
+        self.results = results
+        self.error = error
+        self.latency = latency
+
+    def __repr__(self):
+        return str({
+            'CertEnrollmentBatchResult': {
+                'index': self.index,
+                'error': self.error,
+                'latency': self.latency
+            }
+        })
+
+
+class CertEnrollmentStats(object):
+    """
+    Class collecting throughput and latency statistics of a batch
+    enrollment (see CertClient.enroll_many()).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = None
+        self.end_time = None
+        self.count = 0
+        self.errors = 0
+        self.latencies = []
+
+    def start(self):
+        self.start_time = time.time()
+
+    def stop(self):
+        self.end_time = time.time()
+
+    def add(self, result):
+        with self.lock:
+            self.count += 1
+            if result.error:
+                self.errors += 1
+            self.latencies.append(result.latency)
+
+    @property
+    def elapsed(self):
+        """ Elapsed time in seconds """
+        if self.start_time is None:
+            return 0
+        end_time = self.end_time if self.end_time is not None else time.time()
+        return end_time - self.start_time
+
+    @property
+    def throughput(self):
+        """ Enrollments per second """
+        elapsed = self.elapsed
+        return self.count / elapsed if elapsed else 0
+
+    def percentile(self, percent):
+        """ Return the latency (in seconds) at the given percentile """
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        # nearest-rank method
+        rank = int(math.ceil(percent / 100.0 * len(latencies)))
+        return latencies[max(rank, 1) - 1]
+
+    def __repr__(self):
+        return str({
+            'CertEnrollmentStats': {
+                'count': self.count,
+                'errors': self.errors,
+                'elapsed': self.elapsed,
+                'throughput': self.throughput,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99)
+            }
+        })
+
+
 class CertRequestInfoCollection(object):
     """
     Class containing list of CertRequestInfo objects.
@@ -282,24 +327,12 @@ class CertRequestInfoCollection(object):
         return iter(self.cert_request_info_list)
 
     @classmethod
-    def from_json(cls, json_value):
+    def from_json(cls, json_value, lazy=False):
         """ Populate object from JSON input """
         ret = cls()
-        cert_req_infos = json_value['entries']
-        if not isinstance(cert_req_infos, list):
-            ret.cert_request_info_list.append(
-                CertRequestInfo.from_json(cert_req_infos))
-        else:
-            for cert_info in cert_req_infos:
-                ret.cert_request_info_list.append(
-                    CertRequestInfo.from_json(cert_info))
-
-        links = json_value['Link']
-        if not isinstance(links, list):
-            ret.links.append(pki.Link.from_json(links))
-        else:
-            for link in links:
-                ret.links.append(pki.Link.from_json(link))
+        ret.cert_request_info_list = CertRequestInfo.from_json_list(
+            json_value['entries'], lazy=lazy)
+        ret.links = pki.parse_links(json_value)
 
         return ret
 
@@ -657,10 +690,11 @@ class CertClient(object):
 
     @pki.handle_exceptions()
     def list_certs(self, max_results=None, max_time=None, start=None, size=None,
-                   **cert_search_params):
+                   timeout=None, **cert_search_params):
         """ Return a CertDataInfoCollection object with a information about all
             the certificates that satisfy the search criteria.
             If cert_search_request=None, returns all the certificates.
+            The timeout (in seconds) overrides the connection timeout.
         """
         url = self.cert_url + '/search'
         query_params = {"maxResults": max_results, "maxTime": max_time,
@@ -670,9 +704,28 @@ class CertClient(object):
                                     cls=encoder.CustomTypeEncoder,
                                     sort_keys=True)
         response = self.connection.post(url, search_request, self.headers,
-                                        query_params)
+                                        query_params, timeout=timeout)
         return CertDataInfoCollection.from_json(response.json())
 
+    def iterate_certs(self, size=None, max_results=None, max_time=None,
+                      prefetch=True, **cert_search_params):
+        """ Return a generator of CertDataInfo objects for all the
+            certificates that satisfy the search criteria.
+            The results are retrieved page by page (of the given size) by
+            following the links returned by the server, and the next page
+            is retrieved in the background unless prefetch is False.
+        """
+
+        def fetch_page(params):
+            return self.list_certs(
+                max_results=params.get('maxResults', max_results),
+                max_time=params.get('maxTime', max_time),
+                start=params.get('start'),
+                size=params.get('size', size),
+                **cert_search_params)
+
+        return pki.iterate_pages(fetch_page, prefetch=prefetch)
+
     @pki.handle_exceptions()
     def review_cert(self, cert_serial_number):
         """ Reviews a certificate. Returns a CertData object with a nonce.
@@ -822,6 +875,28 @@ class CertClient(object):
                                 query_params)
         return CertRequestInfoCollection.from_json(r.json())
 
+    def iterate_requests(self, request_status=None, request_type=None,
+                         size=None, max_results=None, max_time=None,
+                         prefetch=True):
+        """
+        Return a generator of CertRequestInfo objects for all the
+        certificate requests that satisfy the search criteria.
+        The results are retrieved page by page (of the given size) by
+        following the links returned by the server, and the next page
+        is retrieved in the background unless prefetch is False.
+        """
+
+        def fetch_page(params):
+            return self.list_requests(
+                request_status=params.get('requestState', request_status),
+                request_type=params.get('requestType', request_type),
+                from_request_id=params.get('start'),
+                size=params.get('pageSize', size),
+                max_results=max_results,
+                max_time=max_time)
+
+        return pki.iterate_pages(fetch_page, prefetch=prefetch)
+
     @pki.handle_exceptions()
     def review_request(self, request_id):
         """
@@ -1056,6 +1131,106 @@ class CertClient(object):
 
         return ret
 
+    def enroll_many(self, profile_id, csrs, concurrency=10, authority=None,
+                    stats=None):
+        """
+        Enroll certificates for many requests with the given profile id
+        using a pool of concurrent workers.
+
+        Each item in csrs is either a PKCS #10 request in PEM format or a
+        dictionary with values for the profile attributes (see enroll_cert()).
+        The enrollment template is retrieved once and reused for all items.
+        Each worker submits and approves its enrollment independently, so
+        the requests are pipelined over the pool.
+
+        Returns a generator of CertEnrollmentBatchResult objects in order of
+        completion. A failed enrollment does not stop the batch; its
+        exception is stored in the result instead. If a CertEnrollmentStats
+        object is provided, it is updated with the throughput and latency
+        of the enrollments.
+
+        Requires an agent level authentication.
+        """
+
+        # Validate the arguments when called rather than when the
+        # results are first requested.
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1.")
+
+        # Fetch and cache the enrollment template before starting the
+        # workers.
+        self.get_enrollment_template(profile_id)
+
+        if stats is None:
+            stats = CertEnrollmentStats()
+
+        return self._enroll_many(
+            profile_id, csrs, concurrency, authority, stats)
+
+    def _enroll_many(self, profile_id, csrs, concurrency, authority, stats):
+
+        def enroll(index, inputs):
+            if not isinstance(inputs, dict):
+                inputs = {
+                    'cert_request_type': 'pkcs10',
+                    'cert_request': inputs
+                }
+
+            start_time = time.time()
+            try:
+                results = self.enroll_cert(profile_id, inputs, authority)
+                error = None
+            except Exception as e:  # pylint: disable=broad-except
+                logger.debug('Unable to enroll request #%d: %s', index, e)
+                results = None
+                error = e
+
+            return CertEnrollmentBatchResult(
+                index, inputs,
+                results=results,
+                error=error,
+                latency=time.time() - start_time)
+
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=concurrency)
+
+        # Limit the number of queued items so that the CSRs are consumed
+        # from the iterable as the enrollments complete.
+        pending = collections.deque()
+
+        stats.start()
+        try:
+            for index, inputs in enumerate(csrs):
+
+                pending.append(executor.submit(enroll, index, inputs))
+
+                if len(pending) < 2 * concurrency:
+                    continue
+
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    pending.remove(future)
+                    result = future.result()
+                    stats.add(result)
+                    yield result
+
+            for future in concurrent.futures.as_completed(pending):
+                result = future.result()
+                stats.add(result)
+                yield result
+
+        finally:
+            stats.stop()
+
+            # If the generator is closed early, do not submit the
+            # enrollments that have not started yet.
+            for future in pending:
+                future.cancel()
+
+            executor.shutdown(wait=False)
+
 
 encoder.NOTYPES['CertData'] = CertData
 encoder.NOTYPES['CertSearchRequest'] = CertSearchRequest
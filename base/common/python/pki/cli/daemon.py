@@ -0,0 +1,663 @@
+#
+# Copyright Red Hat, Inc.
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""
+Long-lived JVMs for Java-based CLI commands.
+
+Starting a JVM for every pki or pki-server command is slow. If
+PKI_CLI_DAEMON is true, the commands are sent to a daemon owned by the
+current user which keeps one JVM (org.dogtagpki.cli.CLIDaemon) running
+for each distinct Java command line, working directory, and environment.
+
+The daemon listens on a UNIX socket in a directory that is only
+accessible to the current user, and it also rejects connections from
+other users. The JVMs are stopped after PKI_CLI_DAEMON_IDLE_TIMEOUT
+seconds without commands, and the daemon exits once all JVMs are
+stopped.
+"""
+
+from __future__ import absolute_import
+import argparse
+import base64
+import errno
+import fcntl
+import io
+import json
+import logging
+import os
+import re
+import socket
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DAEMON_CLASS = 'org.dogtagpki.cli.CLIDaemon'
+
+DEFAULT_IDLE_TIMEOUT = 300
+STARTUP_TIMEOUT = 10
+
+SOCKET_NAME = 'cli.sock'
+LOCK_NAME = 'cli.lock'
+LOG_NAME = 'cli.log'
+
+# Environment variables that change between shell commands and do not
+# require a separate JVM.
+VOLATILE_ENV = ['_', 'OLDPWD', 'PWD', 'SHLVL']
+
+# CLIDaemon traps System.exit() with a SecurityManager, which has to be
+# allowed explicitly since Java 18 (JEP 411). Java 11 would take "allow"
+# as a class name, and Java 24 no longer supports it (JEP 486).
+SECURITY_MANAGER_OPTION = '-Djava.security.manager=allow'
+SECURITY_MANAGER_MIN_VERSION = 12
+SECURITY_MANAGER_MAX_VERSION = 23
+
+# major Java versions keyed by launcher and environment
+java_versions = {}
+
+
+def is_enabled():
+    return os.getenv('PKI_CLI_DAEMON', 'false').lower() == 'true'
+
+
+def get_idle_timeout():
+    return int(os.getenv('PKI_CLI_DAEMON_IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT))
+
+
+def get_daemon_dir():
+    """
+    Return the daemon directory of the current user. The directory is
+    created if it does not exist, and it must be owned by the current
+    user and must not be accessible to other users.
+    """
+
+    runtime_dir = os.getenv('XDG_RUNTIME_DIR')
+
+    if runtime_dir:
+        path = os.path.join(runtime_dir, 'pki')
+    else:
+        path = os.path.join(tempfile.gettempdir(), 'pki-%d' % os.getuid())
+
+    try:
+        os.mkdir(path, 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    st = os.lstat(path)
+
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() \
+            or st.st_mode & 0o077:
+        raise Exception('Insecure CLI daemon directory: %s' % path)
+
+    return path
+
+
+def get_java_version(launcher, env=None):
+    """
+    Return the major version of the JVM started by a launcher command
+    (e.g. ['/usr/bin/env', 'java']), or None if it cannot be determined.
+    """
+
+    env = env or {}
+    key = (tuple(launcher), env.get('PATH'), env.get('JAVA_HOME'))
+
+    if key in java_versions:
+        return java_versions[key]
+
+    version = None
+
+    try:
+        result = subprocess.run(
+            launcher + ['-version'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=env or None,
+            timeout=STARTUP_TIMEOUT,
+            check=True)
+
+        # e.g. openjdk version "17.0.2" or java version "1.8.0_292"
+        match = re.search(
+            r'version "(\d+)(?:\.(\d+))?',
+            result.stdout.decode('utf-8', 'replace'))
+
+        if match:
+            version = int(match.group(1))
+            if version == 1:
+                version = int(match.group(2))
+
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning('Unable to determine Java version: %s', e)
+
+    java_versions[key] = version
+
+    return version
+
+
+def get_daemon_cmd(cmd, env=None):
+    """
+    Return the command line that starts CLIDaemon with the options
+    required by its Java version. Raises an exception if CLIDaemon
+    cannot run on that version.
+    """
+
+    launcher = None
+
+    for index, arg in enumerate(cmd):
+        if os.path.basename(arg) == 'java':
+            launcher = cmd[:index + 1]
+            break
+
+    if not launcher:
+        return cmd
+
+    version = get_java_version(launcher, env)
+
+    if version is None or version < SECURITY_MANAGER_MIN_VERSION:
+        return cmd
+
+    if version > SECURITY_MANAGER_MAX_VERSION:
+        raise Exception('CLI daemon is not supported on Java %d' % version)
+
+    index = cmd.index(DAEMON_CLASS)
+    return cmd[:index] + [SECURITY_MANAGER_OPTION] + cmd[index:]
+
+
+def send_message(sock, message):
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(struct.pack('>I', len(data)) + data)
+
+
+def recv_exactly(stream, size):
+
+    chunks = []
+
+    while size:
+        chunk = stream.read(size)
+        if not chunk:
+            raise EOFError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b''.join(chunks)
+
+
+def recv_message(stream):
+    size = struct.unpack('>I', recv_exactly(stream, 4))[0]
+    return json.loads(recv_exactly(stream, size).decode('utf-8'))
+
+
+def encode_bytes(data):
+    if data is None:
+        return None
+    return base64.b64encode(data).decode('ascii')
+
+
+def decode_bytes(data):
+    if data is None:
+        return None
+    return base64.b64decode(data)
+
+
+class JavaProcess(object):
+    """
+    A JVM running org.dogtagpki.cli.CLIDaemon for a particular main class.
+    """
+
+    def __init__(self, cmd, cwd, env, stderr=None):
+
+        self.cmd = cmd
+        self.cwd = cwd
+        self.env = env
+        self.stderr = stderr
+
+        self.lock = threading.Lock()
+        self.process = None
+        self.last_used = time.time()
+
+    def start(self):
+
+        cmd = get_daemon_cmd(self.cmd, self.env)
+
+        logger.info('Starting JVM: %s', ' '.join(cmd))
+
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self.stderr,
+            cwd=self.cwd,
+            env=self.env)
+
+    def is_running(self):
+        return self.process and self.process.poll() is None
+
+    def execute(self, args, input=None):  # pylint: disable=W0622
+        """
+        Execute a command and return a tuple of exit code, standard
+        output, and standard error.
+        """
+
+        with self.lock:
+
+            if not self.is_running():
+                self.start()
+
+            request = [struct.pack('>i', len(args))]
+
+            for arg in args:
+                data = arg.encode('utf-8')
+                request.append(struct.pack('>i', len(data)) + data)
+
+            if input is None:
+                request.append(struct.pack('>i', -1))
+            else:
+                request.append(struct.pack('>i', len(input)) + input)
+
+            try:
+                self.process.stdin.write(b''.join(request))
+                self.process.stdin.flush()
+
+                stream = self.process.stdout
+                code = struct.unpack('>i', recv_exactly(stream, 4))[0]
+                size = struct.unpack('>i', recv_exactly(stream, 4))[0]
+                stdout = recv_exactly(stream, size)
+                size = struct.unpack('>i', recv_exactly(stream, 4))[0]
+                stderr = recv_exactly(stream, size)
+
+            except (EOFError, IOError):
+                # the JVM died while running the command
+                code = self.process.wait()
+                logger.warning('JVM terminated with exit code %s', code)
+                return code or 1, b'', b''
+
+            finally:
+                self.last_used = time.time()
+
+            return code, stdout, stderr
+
+    def stop(self):
+
+        with self.lock:
+
+            if not self.is_running():
+                return
+
+            logger.info('Stopping JVM: %s', ' '.join(self.cmd))
+
+            # closing the standard input stops the daemon
+            self.process.stdin.close()
+
+            try:
+                self.process.wait(timeout=STARTUP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+class CLIDaemon(object):
+    """
+    Server that runs the Java commands of the current user in
+    long-lived JVMs.
+    """
+
+    def __init__(self, daemon_dir, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 stderr=None):
+
+        self.daemon_dir = daemon_dir
+        self.socket_path = os.path.join(daemon_dir, SOCKET_NAME)
+        self.idle_timeout = idle_timeout
+        self.stderr = stderr
+
+        self.lock = threading.Lock()
+        self.processes = {}
+        self.active = 0
+        self.last_used = time.time()
+
+    def get_process(self, cmd, cwd, env, session_args=None):
+        """
+        Return the JVM for the specified command line, working directory,
+        environment, and session arguments (i.e. the options that select
+        the NSS database and its credentials, which cannot change once
+        NSS is initialized in the JVM).
+        """
+
+        key = (
+            tuple(cmd),
+            cwd,
+            tuple(sorted((k, v) for k, v in env.items() if k not in VOLATILE_ENV)),
+            tuple(session_args or []))
+
+        with self.lock:
+
+            process = self.processes.get(key)
+
+            if not process:
+                process = JavaProcess(cmd, cwd, env, stderr=self.stderr)
+                self.processes[key] = process
+
+            # prevent the process from being stopped before it is used
+            process.last_used = time.time()
+
+            return process
+
+    def check_peer(self, conn):
+        """
+        Reject connections from other users.
+        """
+
+        if not hasattr(socket, 'SO_PEERCRED'):
+            return
+
+        creds = conn.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        _, uid, _ = struct.unpack('3i', creds)
+
+        if uid != os.getuid():
+            raise Exception('Connection from another user rejected: %s' % uid)
+
+    def handle(self, conn):
+
+        with self.lock:
+            self.active += 1
+
+        try:
+            self.check_peer(conn)
+
+            stream = conn.makefile('rb')
+            request = recv_message(stream)
+
+            session_args = request.get('session_args', [])
+
+            process = self.get_process(
+                request['cmd'], request['cwd'], request['env'],
+                session_args=session_args)
+
+            code, stdout, stderr = process.execute(
+                session_args + request['args'],
+                decode_bytes(request.get('input')))
+
+            send_message(conn, {
+                'code': code,
+                'stdout': encode_bytes(stdout),
+                'stderr': encode_bytes(stderr)
+            })
+
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error('Unable to handle request: %s', e)
+
+            # let the client run the command without the daemon
+            try:
+                send_message(conn, {'error': str(e)})
+            except socket.error:
+                pass
+
+        finally:
+            conn.close()
+
+            with self.lock:
+                self.active -= 1
+                self.last_used = time.time()
+
+    def stop_idle_processes(self):
+        """
+        Stop the JVMs that have not been used within the idle timeout
+        and return True if the daemon itself is idle.
+        """
+
+        now = time.time()
+        idle_processes = []
+
+        with self.lock:
+
+            for key, process in list(self.processes.items()):
+
+                if process.lock.locked() or \
+                        now - process.last_used < self.idle_timeout:
+                    continue
+
+                idle_processes.append(process)
+                del self.processes[key]
+
+            idle = not self.active and not self.processes and \
+                now - self.last_used >= self.idle_timeout
+
+        # stopping a JVM might take a while, so don't block new requests
+        for process in idle_processes:
+            process.stop()
+
+        return idle
+
+    def serve(self):
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            sock.bind(self.socket_path)
+            os.chmod(self.socket_path, 0o600)
+            sock.listen(16)
+            sock.settimeout(1)
+
+            logger.info('Listening on %s', self.socket_path)
+
+            while True:
+
+                try:
+                    conn, _ = sock.accept()
+
+                except socket.timeout:
+                    if self.stop_idle_processes():
+                        logger.info('Daemon idle, exiting')
+                        return
+                    continue
+
+                conn.settimeout(None)
+
+                thread = threading.Thread(target=self.handle, args=(conn,))
+                thread.daemon = True
+                thread.start()
+
+        finally:
+            sock.close()
+
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+            with self.lock:
+                for process in self.processes.values():
+                    process.stop()
+                self.processes.clear()
+
+
+def connect(daemon_dir):
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.connect(os.path.join(daemon_dir, SOCKET_NAME))
+    except socket.error:
+        sock.close()
+        raise
+
+    return sock
+
+
+def start_daemon(daemon_dir):
+    """
+    Start the daemon in the background and wait until it accepts
+    connections.
+    """
+
+    logger.info('Starting CLI daemon')
+
+    cmd = [
+        sys.executable, '-m', 'pki.cli.daemon',
+        '--idle-timeout', str(get_idle_timeout())
+    ]
+
+    if logger.isEnabledFor(logging.DEBUG):
+        cmd.append('--debug')
+
+    with open(os.devnull, 'rb') as devnull:
+        subprocess.Popen(
+            cmd,
+            stdin=devnull,
+            stdout=devnull,
+            stderr=devnull,
+            close_fds=True,
+            start_new_session=True)
+
+    delay = 0.01
+    deadline = time.time() + STARTUP_TIMEOUT
+
+    while True:
+        try:
+            return connect(daemon_dir)
+
+        except socket.error:
+            if time.time() >= deadline:
+                raise Exception(
+                    'CLI daemon did not start within %d seconds'
+                    % STARTUP_TIMEOUT)
+
+        time.sleep(delay)
+        delay = min(delay * 2, 1)
+
+
+def run(cmd, main_class, args, input=None,  # pylint: disable=W0622
+        capture_output=False, check=False, session_args=None):
+    """
+    Run a Java command in a long-lived JVM and return a
+    subprocess.CompletedProcess like subprocess.run().
+
+    :param cmd: Java command line without the main class
+    :type cmd: list
+    :param main_class: Name of the CLI main class
+    :type main_class: str
+    :param args: Command arguments
+    :type args: list
+    :param input: Standard input of the command
+    :type input: bytes
+    :param capture_output: Return the standard output instead of
+        writing it into sys.stdout
+    :type capture_output: bool
+    :param check: Raise CalledProcessError if the command fails
+    :type check: bool
+    :param session_args: Options that select the NSS database and its
+        credentials (e.g. -d, -c, -C, -f, --token). Commands with
+        different session arguments run in different JVMs.
+    :type session_args: list
+    """
+
+    full_cmd = cmd + [main_class] + (session_args or []) + args
+
+    daemon_dir = get_daemon_dir()
+
+    try:
+        sock = connect(daemon_dir)
+    except socket.error:
+        sock = start_daemon(daemon_dir)
+
+    try:
+        send_message(sock, {
+            'cmd': cmd + [DAEMON_CLASS, main_class],
+            'cwd': os.getcwd(),
+            'env': dict(os.environ),
+            'session_args': session_args or [],
+            'args': args,
+            'input': encode_bytes(input)
+        })
+
+        response = recv_message(sock.makefile('rb'))
+
+    finally:
+        sock.close()
+
+    if 'error' in response:
+        logger.info('Unable to run command in CLI daemon: %s', response['error'])
+
+        return subprocess.run(
+            full_cmd,
+            input=input,
+            stdout=subprocess.PIPE if capture_output else None,
+            check=check)
+
+    code = response['code']
+    stdout = decode_bytes(response['stdout'])
+    stderr = decode_bytes(response['stderr'])
+
+    write_output(sys.stderr, stderr)
+
+    if not capture_output:
+        write_output(sys.stdout, stdout)
+        stdout = None
+
+    if check and code:
+        raise subprocess.CalledProcessError(code, full_cmd, output=stdout)
+
+    return subprocess.CompletedProcess(full_cmd, code, stdout=stdout)
+
+
+def write_output(stream, data):
+
+    if not data:
+        return
+
+    if hasattr(stream, 'buffer'):
+        stream.flush()
+        stream.buffer.write(data)
+        stream.buffer.flush()
+
+    elif isinstance(stream, io.TextIOBase):
+        stream.write(data.decode('utf-8'))
+
+    else:
+        stream.write(data)
+
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(description='PKI CLI daemon')
+    parser.add_argument(
+        '--idle-timeout', type=int, default=DEFAULT_IDLE_TIMEOUT,
+        help='Seconds without commands before stopping')
+    parser.add_argument('--debug', action='store_true')
+    options = parser.parse_args(argv)
+
+    daemon_dir = get_daemon_dir()
+    log_file = os.path.join(daemon_dir, LOG_NAME)
+
+    logging.basicConfig(
+        filename=log_file,
+        format='%(asctime)s %(levelname)s: %(message)s',
+        level=logging.DEBUG if options.debug else logging.INFO)
+
+    with open(os.path.join(daemon_dir, LOCK_NAME), 'w') as lock_file:
+
+        # only one daemon per user
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            logger.info('CLI daemon already running')
+            return
+
+        with open(log_file, 'ab') as stderr:
+            daemon = CLIDaemon(
+                daemon_dir,
+                idle_timeout=options.idle_timeout,
+                stderr=stderr)
+            daemon.serve()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -27,6 +27,7 @@ import subprocess
 import sys
 
 import pki.cli
+import pki.cli.daemon
 import pki.cli.password
 import pki.cli.pkcs12
 import pki.nssdb
@@ -114,37 +115,59 @@ class PKICLI(pki.cli.CLI):
 
         cmd.extend([
             '-cp', pki_lib + '/*',
-            '-Djava.util.logging.config.file=' + logging_config,
-            'com.netscape.cmstools.cli.MainCLI'
+            '-Djava.util.logging.config.file=' + logging_config
         ])
 
+        main_class = 'com.netscape.cmstools.cli.MainCLI'
+
         # restore options for Java commands
 
+        # options that select the NSS database and log into its token
+        # cannot change within a JVM, so they are passed separately
+        session_args = []
+
         if self.database:
-            cmd.extend(['-d', self.database])
+            session_args.extend(['-d', self.database])
 
         if self.password:
-            cmd.extend(['-c', self.password])
+            session_args.extend(['-c', self.password])
 
         if self.password_file:
-            cmd.extend(['-C', self.password_file])
+            session_args.extend(['-C', self.password_file])
 
         if self.password_conf:
-            cmd.extend(['-f', self.password_conf])
+            session_args.extend(['-f', self.password_conf])
 
         if pki.nssdb.normalize_token(self.token):
-            cmd.extend(['--token', self.token])
+            session_args.extend(['--token', self.token])
+
+        java_args = []
 
         if self.ignore_banner:
-            cmd.extend(['--ignore-banner'])
+            java_args.extend(['--ignore-banner'])
 
         if logger.isEnabledFor(logging.DEBUG):
-            cmd.extend(['--debug'])
+            java_args.extend(['--debug'])
 
         elif logger.isEnabledFor(logging.INFO):
-            cmd.extend(['-v'])
+            java_args.extend(['-v'])
+
+        java_args.extend(args)
+
+        if pki.cli.daemon.is_enabled():
+            logger.info('Java command: %s', ' '.join(java_args))
+
+            result = pki.cli.daemon.run(
+                cmd, main_class, java_args, capture_output=True,
+                session_args=session_args)
+
+            pki.cli.daemon.write_output(stdout, result.stdout)
+            result.check_returncode()
+            return
 
-        cmd.extend(args)
+        cmd.append(main_class)
+        cmd.extend(session_args)
+        cmd.extend(java_args)
 
         logger.info('Java command: %s', ' '.join(cmd))
 
@@ -27,15 +27,20 @@ import inspect
 import logging
 import os
 import ssl
+import threading
 import warnings
 
 import requests
 from requests import adapters
 from requests.adapters import DEFAULT_POOLBLOCK, DEFAULT_POOLSIZE, DEFAULT_RETRIES
 try:
+    from requests.packages.urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
     from requests.packages.urllib3.exceptions import InsecureRequestWarning
+    from requests.packages.urllib3.util.retry import Retry
 except ImportError:
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
     from urllib3.exceptions import InsecureRequestWarning
+    from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +61,104 @@ def catch_insecure_warning(func):
     return wrapper
 
 
+class PoolStats(object):
+    """
+    Connection pool usage counters. A hit is a request served by an
+    existing (kept-alive) connection, a miss is a request that required
+    a new connection.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.misses = 0
+
+    @property
+    def hits(self):
+        return self.requests - self.misses
+
+    def add_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def add_miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.misses = 0
+
+    def __repr__(self):
+        return 'PoolStats(hits=%d, misses=%d)' % (self.hits, self.misses)
+
+
+class CountingConnectionPoolMixin(object):
+    """
+    Connection pool that records hits and misses in a PoolStats object.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.stats = kwargs.pop('stats')
+        super(CountingConnectionPoolMixin, self).__init__(*args, **kwargs)
+
+    def _get_conn(self, timeout=None):
+        conn = super(CountingConnectionPoolMixin, self)._get_conn(timeout=timeout)
+
+        self.stats.add_request()
+
+        # new and dropped connections have no socket and will be
+        # (re)connected before sending the request
+        if conn.sock is None:
+            self.stats.add_miss()
+
+        return conn
+
+
+class CountingHTTPConnectionPool(CountingConnectionPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class CountingHTTPSConnectionPool(CountingConnectionPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class SessionCachingSSLContext(ssl.SSLContext):
+    """
+    SSL context that remembers the last TLS session of each server and
+    offers it on the next connection to the same server so the full
+    handshake can be skipped.
+    """
+
+    def __init__(self, *args, **kwargs):  # pylint: disable=unused-argument
+        # the protocol is handled by ssl.SSLContext.__new__()
+        super(SessionCachingSSLContext, self).__init__()
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+
+    def wrap_socket(self, sock, *args, **kwargs):
+
+        hostname = kwargs.get('server_hostname')
+
+        if hostname and kwargs.get('session') is None:
+            with self.sessions_lock:
+                kwargs['session'] = self.sessions.get(hostname)
+
+        ssl_sock = super(SessionCachingSSLContext, self).wrap_socket(sock, *args, **kwargs)
+
+        if hostname:
+            if ssl_sock.session_reused:
+                logger.debug('Resumed TLS session with %s', hostname)
+
+            session = ssl_sock.session
+            if session:
+                with self.sessions_lock:
+                    self.sessions[hostname] = session
+
+        return ssl_sock
+
+
 class SSLContextAdapter(adapters.HTTPAdapter):
     """
     Custom SSLContext Adapter for requests
@@ -64,10 +167,14 @@ class SSLContextAdapter(adapters.HTTPAdapter):
     def __init__(self, pool_connections=DEFAULT_POOLSIZE,
                  pool_maxsize=DEFAULT_POOLSIZE, max_retries=DEFAULT_RETRIES,
                  pool_block=DEFAULT_POOLBLOCK, verify=True,
-                 cert_paths=None):
+                 cert_paths=None, session_resumption=False,
+                 pool_stats=None):
         self.verify = verify
         self.cafiles = []
         self.capaths = []
+        self.session_resumption = session_resumption
+        self.pool_stats = pool_stats
+        self.ssl_context = None
 
         cert_paths = cert_paths or []
 
@@ -94,7 +201,33 @@ class SSLContextAdapter(adapters.HTTPAdapter):
 
     def init_poolmanager(self, connections, maxsize,
                          block=adapters.DEFAULT_POOLBLOCK, **pool_kwargs):
-        context = ssl.SSLContext(
+
+        # The SSL context is created once per adapter and reused by all
+        # connection pools, including after the pool manager is rebuilt.
+        if not self.ssl_context:
+            self.ssl_context = self.create_ssl_context()
+
+        pool_kwargs['ssl_context'] = self.ssl_context
+        super().init_poolmanager(
+            connections, maxsize, block, **pool_kwargs
+        )
+
+        if self.pool_stats is not None:
+            self.poolmanager.pool_classes_by_scheme = {
+                'http': functools.partial(
+                    CountingHTTPConnectionPool, stats=self.pool_stats),
+                'https': functools.partial(
+                    CountingHTTPSConnectionPool, stats=self.pool_stats),
+            }
+
+    def create_ssl_context(self):
+
+        if self.session_resumption:
+            context_class = SessionCachingSSLContext
+        else:
+            context_class = ssl.SSLContext
+
+        context = context_class(
             ssl.PROTOCOL_TLS  # pylint: disable=no-member
         )
 
@@ -119,10 +252,7 @@ class SSLContextAdapter(adapters.HTTPAdapter):
             # Enable certificate verification
             context.verify_mode = ssl.VerifyMode.CERT_REQUIRED  # pylint: disable=no-member
 
-        pool_kwargs['ssl_context'] = context
-        return super().init_poolmanager(
-            connections, maxsize, block, **pool_kwargs
-        )
+        return context
 
 
 class PKIConnection:
@@ -133,7 +263,15 @@ class PKIConnection:
 
     def __init__(self, protocol='http', hostname='localhost', port='8080',
                  subsystem=None, accept='application/json',
-                 trust_env=None, verify=True, cert_paths=None):
+                 trust_env=None, verify=True, cert_paths=None,
+                 pool_connections=DEFAULT_POOLSIZE,
+                 pool_maxsize=DEFAULT_POOLSIZE,
+                 pool_block=DEFAULT_POOLBLOCK,
+                 max_retries=DEFAULT_RETRIES,
+                 backoff_factor=None,
+                 keep_alive=True,
+                 session_resumption=False,
+                 timeout=None):
         """
         Set the parameters for a python-requests based connection to a
         Dogtag subsystem.
@@ -158,6 +296,29 @@ class PKIConnection:
         :param cert_paths: paths to CA certificates / directories in OpenSSL
           format. (default: None)
         :type cert_paths: None, str, list
+        :param pool_connections: number of per-host connection pools to
+          keep (default: 10)
+        :type pool_connections: int
+        :param pool_maxsize: maximum number of connections kept per host
+          (default: 10)
+        :type pool_maxsize: int
+        :param pool_block: wait for a free connection instead of opening
+          an extra one when the pool is exhausted (default: no)
+        :type pool_block: bool
+        :param max_retries: number of retries for failed connections, or
+          a urllib3 Retry object (default: 0)
+        :type max_retries: int, Retry
+        :param backoff_factor: backoff factor between retries in seconds
+          (default: None, i.e. retry immediately)
+        :type backoff_factor: float
+        :param keep_alive: keep connections open for reuse (default: yes)
+        :type keep_alive: bool
+        :param session_resumption: resume TLS sessions on new connections
+          to a known server (default: no)
+        :type session_resumption: bool
+        :param timeout: default connect and read timeout of the requests
+          in seconds (default: None, i.e. wait forever)
+        :type timeout: float, tuple
         :return: PKIConnection object.
         """
 
@@ -165,6 +326,7 @@ class PKIConnection:
         self.hostname = hostname
         self.port = port
         self.subsystem = subsystem
+        self.timeout = timeout
 
         self.rootURI = self.protocol + '://' + self.hostname + ':' + self.port
 
@@ -177,14 +339,45 @@ class PKIConnection:
         else:
             self.serverURI = self.rootURI
 
+        if backoff_factor is not None and not isinstance(max_retries, Retry):
+            # POST requests are not retried by Retry to avoid duplicate
+            # enrollments or archivals.
+            max_retries = Retry(
+                total=max_retries,
+                backoff_factor=backoff_factor,
+                raise_on_status=False)
+
+        # Connection pool hits and misses of this connection.
+        self.pool_stats = PoolStats()
+
+        adapter = SSLContextAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=max_retries,
+            pool_block=pool_block,
+            verify=verify,
+            cert_paths=cert_paths,
+            session_resumption=session_resumption,
+            pool_stats=self.pool_stats)
+
         self.session = requests.Session()
-        self.session.mount("https://", SSLContextAdapter(verify=verify, cert_paths=cert_paths))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         self.session.trust_env = trust_env
         self.session.verify = verify
 
         if accept:
             self.session.headers.update({'Accept': accept})
 
+        if not keep_alive:
+            self.session.headers.update({'Connection': 'close'})
+
+    def close(self):
+        """
+        Close the connections kept in the pool.
+        """
+        self.session.close()
+
     def authenticate(self, username=None, password=None):
         """
         Set the parameters used for authentication if username/password is to
@@ -256,14 +449,14 @@ class PKIConnection:
             headers=headers,
             params=params,
             data=payload,
-            timeout=timeout,
+            timeout=timeout or self.timeout,
         )
         r.raise_for_status()
         return r
 
     @catch_insecure_warning
     def post(self, path, payload, headers=None, params=None,
-             use_root_uri=False):
+             use_root_uri=False, timeout=None):
         """
         Uses python-requests to issue a POST request to the server.
 
@@ -277,6 +470,9 @@ class PKIConnection:
         :type params: dict or bytes
         :param use_root_uri: use root URI instead of subsystem URI as base
         :type use_root_uri: boolean
+        :param timeout: connect and read timeout of the request
+            (default: connection timeout)
+        :type timeout: float, tuple
         :returns: request.response -- response from the server
         :raises: Exception from python-requests in case the POST was not
             successful, or returns an error code.
@@ -294,7 +490,8 @@ class PKIConnection:
             target_path,
             data=payload,
             headers=headers,
-            params=params)
+            params=params,
+            timeout=timeout or self.timeout)
         r.raise_for_status()
         return r
 
@@ -324,7 +521,8 @@ class PKIConnection:
         else:
             target_path = self.serverURI + path
 
-        r = self.session.put(target_path, payload, headers=headers)
+        r = self.session.put(target_path, payload, headers=headers,
+                             timeout=self.timeout)
         r.raise_for_status()
         return r
 
@@ -352,7 +550,8 @@ class PKIConnection:
         else:
             target_path = self.serverURI + path
 
-        r = self.session.delete(target_path, headers=headers)
+        r = self.session.delete(target_path, headers=headers,
+                                timeout=self.timeout)
         r.raise_for_status()
         return r
 
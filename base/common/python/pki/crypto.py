@@ -23,6 +23,7 @@ Module containing crypto classes.
 """
 from __future__ import absolute_import
 import abc
+import functools
 import os
 import shutil
 import subprocess
@@ -94,6 +95,43 @@ class CryptoProvider(six.with_metaclass(abc.ABCMeta, object)):
                        nonce_iv=None):
         """ encrypt data using a symmetric key (wrapping key)"""
 
+    def symmetric_wrap_many(self, data_list, wrapping_key, mechanism=None,
+                            nonce_ivs=None):
+        """ encrypt many payloads with the same symmetric key (wrapping key)
+
+        Each payload is encrypted with its own nonce IV, which is generated
+        if nonce_ivs is not provided. Returns a list of (nonce_iv,
+        wrapped_data) tuples in the same order as data_list.
+        """
+        data_list = list(data_list)
+        self.check_nonce_ivs(data_list, nonce_ivs)
+
+        results = []
+
+        for index, data in enumerate(data_list):
+
+            if nonce_ivs is None:
+                nonce_iv = self.generate_nonce_iv()
+            else:
+                nonce_iv = nonce_ivs[index]
+
+            kwargs = {'nonce_iv': nonce_iv}
+            if mechanism is not None:
+                kwargs['mechanism'] = mechanism
+
+            results.append(
+                (nonce_iv, self.symmetric_wrap(data, wrapping_key, **kwargs)))
+
+        return results
+
+    @staticmethod
+    def check_nonce_ivs(data_list, nonce_ivs):
+
+        if nonce_ivs is not None and len(nonce_ivs) != len(data_list):
+            raise ValueError(
+                'Number of nonce IVs (%d) does not match number of payloads (%d)'
+                % (len(nonce_ivs), len(data_list)))
+
     @abc.abstractmethod
     def symmetric_unwrap(self, data, wrapping_key, mechanism=None,
                          nonce_iv=None):
@@ -175,11 +213,19 @@ class NSSCryptoProvider(CryptoProvider):
 
         self.nonce_iv = "e4:bb:3b:d3:c3:71:2e:58"
 
+        # certs and public keys loaded from the NSS database
+        self.certs = {}
+        self.public_keys = {}
+
+    # best slot for each mechanism, valid until NSS is initialized again
+    best_slots = {}
+
     def initialize(self):
         """
         Initialize the nss db. Must be done before any crypto operations
         """
         nss.nss_init(self.certdb_dir)
+        NSSCryptoProvider.best_slots.clear()
 
     def get_supported_algorithm_keyset(self):
         """ returns highest supported algorithm keyset """
@@ -223,11 +269,31 @@ class NSSCryptoProvider(CryptoProvider):
         else:
             return None
 
+    @classmethod
+    def get_best_slot(cls, mechanism):
+        """ Return the best slot for a mechanism, looked up once. """
+        slot = cls.best_slots.get(mechanism)
+        if slot is None:
+            slot = nss.get_best_slot(mechanism)
+            cls.best_slots[mechanism] = slot
+        return slot
+
+    @classmethod
+    def create_context(cls, mechanism, operation, sym_key, nonce_iv):
+        """ Set up a context to either wrap or unwrap with a symmetric key. """
+        iv_param = None
+        if nonce_iv:
+            iv_si = nss.SecItem(nonce_iv)
+            iv_param = nss.param_from_iv(mechanism, iv_si)
+
+        return nss.create_context_by_sym_key(mechanism, operation,
+                                             sym_key, iv_param)
+
     @classmethod
     def setup_contexts(cls, mechanism, sym_key, nonce_iv):
         """ Set up contexts to do wrapping/unwrapping by symmetric keys. """
         # Get a PK11 slot based on the cipher
-        slot = nss.get_best_slot(mechanism)
+        slot = cls.get_best_slot(mechanism)
 
         if sym_key is None:
             sym_key = slot.key_gen(mechanism,
@@ -264,7 +330,7 @@ class NSSCryptoProvider(CryptoProvider):
         is provided, then the function will either use 0 (for fixed length keys)
         or the maximum available length for that algorithm and the token.
         """
-        slot = nss.get_best_slot(mechanism)
+        slot = self.get_best_slot(mechanism)
         if size == 0:
             size = slot.get_best_key_length(mechanism)
         return slot.key_gen(mechanism, None, size)
@@ -288,9 +354,9 @@ class NSSCryptoProvider(CryptoProvider):
         if nonce_iv is None:
             nonce_iv = nss.read_hex(self.nonce_iv)
 
-        encoding_ctx, _decoding_ctx = self.setup_contexts(mechanism,
-                                                          wrapping_key,
-                                                          nonce_iv)
+        # only the encoding context is needed
+        encoding_ctx = self.create_context(mechanism, nss.CKA_ENCRYPT,
+                                           wrapping_key, nonce_iv)
         wrapped_data = encoding_ctx.cipher_op(data) +\
             encoding_ctx.digest_final()
         return wrapped_data
@@ -308,9 +374,9 @@ class NSSCryptoProvider(CryptoProvider):
         if nonce_iv is None:
             nonce_iv = nss.read_hex(self.nonce_iv)
 
-        _encoding_ctx, decoding_ctx = self.setup_contexts(mechanism,
-                                                          wrapping_key,
-                                                          nonce_iv)
+        # only the decoding context is needed
+        decoding_ctx = self.create_context(mechanism, nss.CKA_DECRYPT,
+                                           wrapping_key, nonce_iv)
         unwrapped_data = decoding_ctx.cipher_op(data) \
             + decoding_ctx.digest_final()
         return unwrapped_data
@@ -324,7 +390,13 @@ class NSSCryptoProvider(CryptoProvider):
 
         Wrap (encrypt) data using the supplied asymmetric key
         """
-        public_key = wrapping_cert.subject_public_key_info.public_key
+        # The public key is extracted from the cert once and reused.
+        cert_der = bytes(wrapping_cert.der_data)
+        public_key = self.public_keys.get(cert_der)
+        if public_key is None:
+            public_key = wrapping_cert.subject_public_key_info.public_key
+            self.public_keys[cert_der] = public_key
+
         return nss.pub_wrap_sym_key(mechanism, public_key, data)
 
     def key_unwrap(self, mechanism, data, wrapping_key, nonce_iv):
@@ -352,8 +424,13 @@ class NSSCryptoProvider(CryptoProvider):
         :param cert_nick       Nickname for the certificate to be returned
 
         Searches NSS database and returns SecItem object for this certificate.
+        The certificate is looked up once per nickname.
         """
-        return nss.find_cert_from_nickname(cert_nick)
+        cert = self.certs.get(cert_nick)
+        if cert is None:
+            cert = nss.find_cert_from_nickname(cert_nick)
+            self.certs[cert_nick] = cert
+        return cert
 
 
 class CryptographyCryptoProvider(CryptoProvider):
@@ -381,6 +458,9 @@ class CryptographyCryptoProvider(CryptoProvider):
 
         self.certs[transport_cert_nick] = transport_cert
 
+        # public keys of the wrapping certs
+        self.public_keys = {}
+
         # default to AES
         self.encrypt_alg = algorithms.AES
         self.encrypt_mode = modes.CBC
@@ -431,6 +511,20 @@ class CryptographyCryptoProvider(CryptoProvider):
         """
         return self.generate_symmetric_key()
 
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def get_padding(block_size):
+        return padding.PKCS7(block_size)
+
+    def create_cipher(self, wrapping_key, nonce_iv):
+        """
+        Create a cipher for a key and IV. Cipher contexts cannot be reset
+        to a new IV, so a cipher is created for each operation.
+        """
+        return Cipher(self.encrypt_alg(bytes(wrapping_key)),
+                      self.encrypt_mode(nonce_iv),
+                      backend=self.backend)
+
     def symmetric_wrap(self, data, wrapping_key, mechanism=None,
                        nonce_iv=None):
         """
@@ -448,20 +542,67 @@ class CryptographyCryptoProvider(CryptoProvider):
             raise ValueError("Wrapping key must be provided")
 
         if self.encrypt_mode.name == "CBC":
-            padder = padding.PKCS7(self.encrypt_alg.block_size).padder()
+            padder = self.get_padding(self.encrypt_alg.block_size).padder()
             padded_data = padder.update(data) + padder.finalize()
             data = padded_data
         else:
             raise ValueError('Only CBC mode is currently supported')
 
-        cipher = Cipher(self.encrypt_alg(wrapping_key),
-                        self.encrypt_mode(nonce_iv),
-                        backend=self.backend)
+        cipher = self.create_cipher(wrapping_key, nonce_iv)
 
         encryptor = cipher.encryptor()
         ct = encryptor.update(data) + encryptor.finalize()
         return ct
 
+    def symmetric_wrap_many(self, data_list, wrapping_key, mechanism=None,
+                            nonce_ivs=None):
+        """
+        :param data_list       List of data to be wrapped
+        :param wrapping_key    Symmetric key to wrap data
+        :param mechanism       Mechanism to use for wrapping key
+        :param nonce_ivs       List of nonces for initialization vectors
+
+        Wrap (encrypt) many payloads using the supplied symmetric key.
+        The nonce IVs are generated if not provided. Returns a list of
+        (nonce_iv, wrapped_data) tuples.
+        """
+
+        if wrapping_key is None:
+            raise ValueError("Wrapping key must be provided")
+
+        if self.encrypt_mode.name != "CBC":
+            raise ValueError('Only CBC mode is currently supported')
+
+        data_list = list(data_list)
+        self.check_nonce_ivs(data_list, nonce_ivs)
+
+        block_size = self.encrypt_alg.block_size
+        pkcs7 = self.get_padding(block_size)
+        algorithm = self.encrypt_alg(bytes(wrapping_key))
+
+        if nonce_ivs is None:
+            # generate all IVs with a single call
+            iv_size = block_size // 8
+            random = os.urandom(iv_size * len(data_list))
+            nonce_ivs = [random[i:i + iv_size]
+                         for i in range(0, len(random), iv_size)]
+
+        results = []
+
+        for data, nonce_iv in zip(data_list, nonce_ivs):
+
+            padder = pkcs7.padder()
+            data = padder.update(data) + padder.finalize()
+
+            encryptor = Cipher(algorithm,
+                               self.encrypt_mode(nonce_iv),
+                               backend=self.backend).encryptor()
+
+            results.append(
+                (nonce_iv, encryptor.update(data) + encryptor.finalize()))
+
+        return results
+
     def symmetric_unwrap(self, data, wrapping_key,
                          mechanism=None, nonce_iv=None):
         """
@@ -479,15 +620,13 @@ class CryptographyCryptoProvider(CryptoProvider):
         if wrapping_key is None:
             raise ValueError("Wrapping key must be provided")
 
-        cipher = Cipher(self.encrypt_alg(wrapping_key),
-                        self.encrypt_mode(nonce_iv),
-                        backend=self.backend)
+        cipher = self.create_cipher(wrapping_key, nonce_iv)
 
         decryptor = cipher.decryptor()
         unwrapped = decryptor.update(data) + decryptor.finalize()
 
         if self.encrypt_mode.name == 'CBC':
-            unpadder = padding.PKCS7(self.encrypt_alg.block_size).unpadder()
+            unpadder = self.get_padding(self.encrypt_alg.block_size).unpadder()
             unpadded = unpadder.update(unwrapped) + unpadder.finalize()
             unwrapped = unpadded
         else:
@@ -504,7 +643,12 @@ class CryptographyCryptoProvider(CryptoProvider):
 
         Wrap (encrypt) data using the supplied asymmetric key
         """
-        public_key = wrapping_cert.public_key()
+        # The public key is parsed from the cert once and reused.
+        public_key = self.public_keys.get(wrapping_cert)
+        if public_key is None:
+            public_key = wrapping_cert.public_key()
+            self.public_keys[wrapping_cert] = public_key
+
         return public_key.encrypt(
             data,
             PKCS1v15()
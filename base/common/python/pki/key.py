@@ -26,8 +26,12 @@ KeyRequestClient REST API on a DRM
 from __future__ import absolute_import
 from __future__ import print_function
 import base64
+import collections
+import concurrent.futures
 import json
+import logging
 import os
+import time
 import warnings
 
 from six import iteritems
@@ -39,6 +43,8 @@ import pki.encoder as encoder
 from pki.info import Version
 import pki.util
 
+logger = logging.getLogger(__name__)
+
 
 # should be moved to request.py
 # pylint: disable=R0903
@@ -124,42 +130,23 @@ class Key(object):
         self.data = None
 
 
-class KeyInfo(object):
+class KeyInfo(pki.Record):
     """
     This is the object that contains information stored
     in the database record for an archived secret.  It does not
     contain the secret itself.
     """
 
+    __slots__ = (
+        'client_key_id', 'key_url', 'algorithm', 'status', 'owner_name',
+        'size', 'public_key', 'realm')
+
     json_attribute_names = {
         'clientKeyID': 'client_key_id', 'keyURL': 'key_url',
         'ownerName': 'owner_name', 'publicKey': 'public_key'
     }
 
-    # pylint: disable=C0103
-    def __init__(self):
-        """ Constructor """
-        self.client_key_id = None
-        self.key_url = None
-        self.algorithm = None
-        self.status = None
-        self.owner_name = None
-        self.size = None
-        self.public_key = None
-        self.realm = None
-
-    @classmethod
-    def from_json(cls, attr_list):
-        """ Return KeyInfo from JSON dict """
-        key_info = cls()
-        for k, v in iteritems(attr_list):
-            if k in KeyInfo.json_attribute_names:
-                setattr(key_info, KeyInfo.json_attribute_names[k], v)
-            else:
-                setattr(key_info, k, v)
-        if key_info.public_key is not None:
-            key_info.public_key = encoder.decode_cert(key_info.public_key)
-        return key_info
+    json_converters = {'public_key': encoder.decode_cert}
 
     def get_key_id(self):
         """ Return the key ID as parsed from key URL """
@@ -181,52 +168,32 @@ class KeyInfoCollection(object):
         self.key_infos = []
         self.links = []
 
+    def __iter__(self):
+        return iter(self.key_infos)
+
     @classmethod
-    def from_json(cls, json_value):
+    def from_json(cls, json_value, lazy=False):
         """ Return a KeyInfoCollection object from its JSON representation """
         ret = cls()
-        infos = json_value['entries']
-        if not isinstance(infos, list):
-            ret.key_infos.append(KeyInfo.from_json(infos))
-        else:
-            for info in infos:
-                ret.key_infos.append(KeyInfo.from_json(info))
+        ret.key_infos = KeyInfo.from_json_list(json_value['entries'], lazy=lazy)
+        ret.links = pki.parse_links(json_value)
         return ret
 
 
-class KeyRequestInfo(object):
+class KeyRequestInfo(pki.Record):
     """
     This class represents data about key requests (archival, recovery,
     key generation etc.) in the DRM.
     """
 
+    __slots__ = (
+        'request_url', 'request_type', 'key_url', 'request_status', 'realm')
+
     json_attribute_names = {
         'requestURL': 'request_url', 'requestType': 'request_type',
         'keyURL': 'key_url', 'requestStatus': 'request_status'
     }
 
-    # pylint: disable=C0103
-    def __init__(self):
-        """ Constructor """
-        self.request_url = None
-        self.request_type = None
-        self.key_url = None
-        self.request_status = None
-        self.realm = None
-
-    @classmethod
-    def from_json(cls, attr_list):
-        """ Return a KeyRequestInfo object from a JSON dict. """
-        key_request_info = cls()
-        for k, v in iteritems(attr_list):
-            if k in KeyRequestInfo.json_attribute_names:
-                setattr(key_request_info,
-                        KeyRequestInfo.json_attribute_names[k], v)
-            else:
-                setattr(key_request_info, k, v)
-
-        return key_request_info
-
     def get_request_id(self):
         """ Return the request ID by parsing the request URL. """
         if self.request_url is not None:
@@ -255,18 +222,18 @@ class KeyRequestInfoCollection(object):
         self.key_requests = []
         self.links = []
 
+    def __iter__(self):
+        return iter(self.key_requests)
+
     @classmethod
-    def from_json(cls, json_value):
+    def from_json(cls, json_value, lazy=False):
         """
         Return a KeyRequestInfoCollection object from its JSON representation.
         """
         ret = cls()
-        infos = json_value['entries']
-        if not isinstance(infos, list):
-            ret.key_requests.append(KeyRequestInfo.from_json(infos))
-        else:
-            for info in infos:
-                ret.key_requests.append(KeyRequestInfo.from_json(info))
+        ret.key_requests = KeyRequestInfo.from_json_list(
+            json_value['entries'], lazy=lazy)
+        ret.links = pki.parse_links(json_value)
         return ret
 
 
@@ -457,6 +424,109 @@ class AsymKeyGenerationRequest(pki.ResourceMessage):
             self.add_attribute("realm", realm)
 
 
+class KeyBatchResult(object):
+    """
+    Class containing the outcome of one item of a batch archival or
+    retrieval (see KeyClient.archive_keys() and KeyClient.retrieve_keys()).
+    """
+
+    def __init__(self, index, item_id, response=None, key=None, error=None,
+                 latency=None):
+        """ Initializer.
+        :param: index: position of the item in the batch
+        :param: item_id: client key ID (archival) or key ID (retrieval)
+        :param: response: KeyRequestResponse object (archival)
+        :param: key: Key object with the unwrapped secret (retrieval)
+        :param: error: exception raised by the operation (if failed)
+        :param: latency: time taken by the operation in seconds
+        """
+        self.index = index
+        self.item_id = item_id
+        self.response = response
+        self.key = key
+        self.error = error
+        self.latency = latency
+
+    @property
+    def status(self):
+        return 'failed' if self.error else 'complete'
+
+    def __repr__(self):
+        return str({
+            'KeyBatchResult': {
+                'index': self.index,
+                'item_id': self.item_id,
+                'status': self.status,
+                'error': self.error,
+                'latency': self.latency
+            }
+        })
+
+
+class KeyBatchCheckpoint(object):
+    """
+    Append-only record of the completed items of a batch archival or
+    retrieval. An interrupted batch can be resumed with the same
+    checkpoint file, in which case the completed items are skipped.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.completed = set()
+        self.file = None
+
+    def open(self):
+
+        if os.path.exists(self.filename):
+            with open(self.filename, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # incomplete record from an interrupted batch
+                        continue
+
+                    if record.get('status') == 'complete':
+                        self.completed.add(record['id'])
+
+        self.file = open(self.filename, 'a')
+
+    def is_completed(self, item_id):
+        return item_id in self.completed
+
+    def add(self, result):
+
+        record = {
+            'id': result.item_id,
+            'status': result.status
+        }
+
+        if result.response and result.response.request_info:
+            record['request_id'] = result.response.get_request_id()
+            record['key_id'] = result.response.get_key_id()
+
+        if result.error:
+            record['error'] = str(result.error)
+
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+        if not result.error:
+            self.completed.add(result.item_id)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
 class KeyClient(object):
     """
     Class that encapsulates and mirrors the functions in the KeyResource
@@ -596,6 +666,54 @@ class KeyClient(object):
                                        params=query_params)
         return KeyRequestInfoCollection.from_json(response.json())
 
+    def iterate_keys(self, client_key_id=None, status=None, size=None,
+                     max_results=None, max_time=None, realm=None,
+                     prefetch=True):
+        """ Return a generator of KeyInfo objects for all archived secrets
+            that satisfy the search criteria.
+
+            The results are retrieved page by page (of the given size) by
+            following the links returned by the server, and the next page
+            is retrieved in the background unless prefetch is False.
+        """
+
+        def fetch_page(params):
+            return self.list_keys(
+                client_key_id=client_key_id,
+                status=status,
+                max_results=params.get('maxResults', max_results),
+                max_time=params.get('maxTime', max_time),
+                start=params.get('start'),
+                size=params.get('size', size),
+                realm=realm)
+
+        return pki.iterate_pages(fetch_page, prefetch=prefetch)
+
+    def iterate_requests(self, request_state=None, request_type=None,
+                         client_key_id=None, page_size=None,
+                         max_results=None, max_time=None, realm=None,
+                         prefetch=True):
+        """ Return a generator of KeyRequestInfo objects for all key
+            requests that satisfy the search criteria.
+
+            The results are retrieved page by page (of the given size) by
+            following the links returned by the server, and the next page
+            is retrieved in the background unless prefetch is False.
+        """
+
+        def fetch_page(params):
+            return self.list_requests(
+                request_state=params.get('requestState', request_state),
+                request_type=params.get('requestType', request_type),
+                client_key_id=client_key_id,
+                start=params.get('start'),
+                page_size=params.get('pageSize', page_size),
+                max_results=max_results,
+                max_time=max_time,
+                realm=params.get('realm', realm))
+
+        return pki.iterate_pages(fetch_page, prefetch=prefetch)
+
     @pki.handle_exceptions()
     def get_request_info(self, request_id):
         """ Return a KeyRequestInfo object for a specific request. """
@@ -796,6 +914,26 @@ class KeyClient(object):
             KeyRequestInfo object with details about the archival request and
             key archived.
         """
+        session_key = self.crypto.generate_session_key()
+
+        wrapped_session_key = self.crypto.asymmetric_wrap(
+            session_key,
+            self.transport_cert)
+
+        return self.wrap_and_archive_key(
+            client_key_id,
+            data_type,
+            private_data,
+            session_key,
+            wrapped_session_key,
+            key_algorithm=key_algorithm,
+            key_size=key_size,
+            realm=realm)
+
+    @staticmethod
+    def check_archival_params(client_key_id, data_type, private_data,
+                              key_algorithm=None, key_size=None):
+
         if (client_key_id is None) or (data_type is None):
             raise TypeError("Client Key ID and data type must be specified")
 
@@ -808,12 +946,19 @@ class KeyClient(object):
         if private_data is None:
             raise TypeError("No data provided to be archived")
 
-        nonce_iv = self.crypto.generate_nonce_iv()
-        session_key = self.crypto.generate_session_key()
+    def wrap_and_archive_key(self, client_key_id, data_type, private_data,
+                             session_key, wrapped_session_key,
+                             key_algorithm=None, key_size=None, realm=None):
+        """ Archive a secret wrapped with an existing session key.
 
-        wrapped_session_key = self.crypto.asymmetric_wrap(
-            session_key,
-            self.transport_cert)
+            Refer to archive_key() comments for a description of the
+            parameters. wrapped_session_key is session_key wrapped with
+            the DRM transport certificate.
+        """
+        self.check_archival_params(
+            client_key_id, data_type, private_data, key_algorithm, key_size)
+
+        nonce_iv = self.crypto.generate_nonce_iv()
 
         encrypted_data = self.crypto.symmetric_wrap(
             private_data,
@@ -831,6 +976,180 @@ class KeyClient(object):
             key_size=key_size,
             realm=realm)
 
+    def run_batch(self, items, get_item_id, process, concurrency=10,
+                  batch_size=100, checkpoint_file=None):
+        """
+        Process many items with a pool of concurrent workers.
+
+        Wrapping a session key with the transport certificate is the most
+        expensive client-side step, so a session key is generated and
+        wrapped once for every batch_size items, and shared by the items
+        of that batch. Each item is processed with
+        process(item, session_key, wrapped_session_key), which returns a
+        (response, key) tuple.
+
+        Returns a generator of KeyBatchResult objects in order of
+        completion. A failed item does not stop the batch; its exception
+        is stored in the result instead.
+
+        If checkpoint_file is specified, the status of each item is
+        appended to the file as it completes, and the items that were
+        completed by a previous run with the same file are skipped.
+
+        The crypto provider is shared by the workers, so it must be
+        thread-safe (e.g. CryptographyCryptoProvider).
+        """
+
+        # Validate the arguments when called rather than when the
+        # results are first requested.
+        if concurrency < 1:
+            raise ValueError("Concurrency must be at least 1.")
+
+        if batch_size < 1:
+            raise ValueError("Batch size must be at least 1.")
+
+        return self._run_batch(
+            items, get_item_id, process, concurrency, batch_size,
+            checkpoint_file)
+
+    def _run_batch(self, items, get_item_id, process, concurrency,
+                   batch_size, checkpoint_file):
+
+        checkpoint = None
+        if checkpoint_file:
+            checkpoint = KeyBatchCheckpoint(checkpoint_file)
+            checkpoint.open()
+
+        def run(index, item_id, item, session_keys):
+            start_time = time.time()
+            try:
+                response, key = process(item, *session_keys)
+                error = None
+            except Exception as e:  # pylint: disable=broad-except
+                logger.debug('Unable to process item #%d: %s', index, e)
+                response = None
+                key = None
+                error = e
+
+            return KeyBatchResult(
+                index, item_id,
+                response=response,
+                key=key,
+                error=error,
+                latency=time.time() - start_time)
+
+        def complete(future):
+            result = future.result()
+            if checkpoint:
+                checkpoint.add(result)
+            return result
+
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=concurrency)
+
+        # Limit the number of queued items so that the items are consumed
+        # from the iterable as the requests complete.
+        pending = collections.deque()
+
+        session_keys = None
+        count = 0
+
+        try:
+            for index, item in enumerate(items):
+
+                item_id = get_item_id(item)
+
+                if item_id is None:
+                    # an item without ID cannot be tracked in the checkpoint
+                    yield KeyBatchResult(
+                        index, None,
+                        error=TypeError('Missing ID in item #%d' % index))
+                    continue
+
+                if checkpoint and checkpoint.is_completed(item_id):
+                    logger.debug('Skipping completed item #%d: %s', index, item_id)
+                    continue
+
+                if count % batch_size == 0:
+                    session_key = self.crypto.generate_session_key()
+                    wrapped_session_key = self.crypto.asymmetric_wrap(
+                        session_key,
+                        self.transport_cert)
+                    session_keys = (session_key, wrapped_session_key)
+
+                count += 1
+
+                pending.append(executor.submit(
+                    run, index, item_id, item, session_keys))
+
+                if len(pending) < 2 * concurrency:
+                    continue
+
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    pending.remove(future)
+                    yield complete(future)
+
+            while pending:
+
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    pending.remove(future)
+                    yield complete(future)
+
+        finally:
+            # If the batch is interrupted, cancel the queued items and
+            # record the items that are already running.
+            for future in pending:
+                if not future.cancel():
+                    complete(future)
+
+            executor.shutdown(wait=False)
+
+            if checkpoint:
+                checkpoint.close()
+
+    def archive_keys(self, items, concurrency=10, batch_size=100,
+                     checkpoint_file=None):
+        """ Archive many secrets on the DRM.
+
+            Each item is a dictionary with the archive_key() parameters:
+            client_key_id, data_type, private_data, and optionally
+            key_algorithm, key_size and realm.
+
+            The secrets are archived concurrently and share one transport
+            wrapped session key per batch (see run_batch()).
+
+            Returns a generator of KeyBatchResult objects containing the
+            KeyRequestResponse of each archival.
+        """
+
+        def archive(item, session_key, wrapped_session_key):
+
+            response = self.wrap_and_archive_key(
+                item.get('client_key_id'),
+                item.get('data_type'),
+                item.get('private_data'),
+                session_key,
+                wrapped_session_key,
+                key_algorithm=item.get('key_algorithm'),
+                key_size=item.get('key_size'),
+                realm=item.get('realm'))
+
+            return response, None
+
+        return self.run_batch(
+            items,
+            lambda item: item.get('client_key_id'),
+            archive,
+            concurrency=concurrency,
+            batch_size=batch_size,
+            checkpoint_file=checkpoint_file)
+
     @pki.handle_exceptions()
     def archive_encrypted_data(self,
                                client_key_id,
@@ -1094,6 +1413,42 @@ class KeyClient(object):
             session_key,
             nonce_iv=key.nonce_data)
 
+    def retrieve_keys(self, key_ids, concurrency=10, batch_size=100,
+                      checkpoint_file=None):
+        """ Retrieve many secrets (passphrases or symmetric keys) from the DRM.
+
+            The secrets are retrieved concurrently and the DRM wraps them
+            with one session key per batch (see run_batch()). The secrets
+            must be retrievable synchronously (see retrieve_key()).
+
+            Returns a generator of KeyBatchResult objects containing a Key
+            object with the unwrapped secret in its data attribute.
+        """
+
+        def retrieve(key_id, session_key, wrapped_session_key):
+
+            request = KeyRecoveryRequest(
+                key_id=key_id,
+                trans_wrapped_session_key=base64.b64encode(
+                    wrapped_session_key).decode('ascii'),
+                payload_encryption_oid=self.encrypt_alg_oid,
+                payload_wrapping_name=self.wrap_name
+            )
+
+            key = self.retrieve_key_data(request)
+            if key.encrypted_data is not None:
+                self.process_returned_key(key, session_key)
+
+            return None, key
+
+        return self.run_batch(
+            key_ids,
+            lambda key_id: key_id,
+            retrieve,
+            concurrency=concurrency,
+            batch_size=batch_size,
+            checkpoint_file=checkpoint_file)
+
     @pki.handle_exceptions()
     def retrieve_key_by_passphrase(self, key_id=None, request_id=None,
                                    passphrase=None,
@@ -23,6 +23,7 @@
 from __future__ import absolute_import
 import base64
 import binascii
+import json
 import logging
 import os
 import re
@@ -59,6 +60,11 @@ PKCS7_FOOTER = '-----END PKCS7-----'
 INTERNAL_TOKEN_NAME = 'internal'
 INTERNAL_TOKEN_FULL_NAME = 'Internal Key Storage Token'
 
+CERT_INFO_CACHE_FILE = 'cert-info-cache.json'
+
+# certutil -L entry, e.g. "ca_signing     CTu,Cu,Cu"
+TRUST_TABLE_ENTRY = re.compile(r'^(.*\S)\s+(\S*,\S*,\S*)$')
+
 logger = logging.LoggerAdapter(
     logging.getLogger(__name__),
     extra={'indent': ''})
@@ -175,6 +181,161 @@ def normalize_token(token):
     return token
 
 
+def get_database_dir(directory):
+    """
+    Strip the optional database type prefix (e.g. 'sql:', 'dbm:')
+    from an NSS database location.
+    """
+    for prefix in ('sql:', 'dbm:'):
+        if directory.startswith(prefix):
+            return directory[len(prefix):]
+
+    return directory
+
+
+class CertInfoCache(object):
+    """
+    On-disk cache of certificate metadata stored in the internal token
+    of an NSS database. The cache is stamped with the modification time
+    and size of the certificate database file (cert9.db or cert8.db), so
+    any change to the database invalidates all entries at once.
+
+    The parsed certificates are kept in memory until the database
+    changes, so repeated lookups do not parse the PEM data again.
+    """
+
+    def __init__(self, directory, filename=CERT_INFO_CACHE_FILE):
+
+        self.directory = get_database_dir(directory)
+        self.cache_file = os.path.join(self.directory, filename)
+
+        self.stamp = None
+        self.certs = {}
+        self.objects = {}
+
+    def get_stamp(self):
+
+        for filename in ('cert9.db', 'cert8.db'):
+            try:
+                st = os.stat(os.path.join(self.directory, filename))
+            except OSError:
+                continue
+            return [filename, st.st_mtime_ns, st.st_size]
+
+        return None
+
+    def load(self):
+        """
+        Load the cache file if the certificate database has changed
+        since the last load. Returns the current database stamp.
+        """
+
+        stamp = self.get_stamp()
+
+        if stamp == self.stamp:
+            return stamp
+
+        self.stamp = stamp
+        self.certs = {}
+        self.objects = {}
+
+        if not stamp:
+            return stamp
+
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return stamp
+
+        if data.get('stamp') == stamp:
+            logger.debug('Loading cert info cache: %s', self.cache_file)
+            self.certs = data.get('certs', {})
+
+        return stamp
+
+    def get(self, nickname):
+
+        self.load()
+        return self.certs.get(nickname)
+
+    def get_object(self, nickname):
+        """
+        Return the parsed certificate of a cached entry.
+        """
+
+        info = self.get(nickname)
+
+        if not info:
+            return None
+
+        cert_obj = self.objects.get(nickname)
+
+        if cert_obj:
+            return cert_obj
+
+        cert_obj = x509.load_pem_x509_certificate(
+            info['data'].encode('ascii'), backend=default_backend())
+        self.objects[nickname] = cert_obj
+
+        return cert_obj
+
+    def put(self, nickname, info, stamp, cert_obj=None):
+        """
+        Store cert info retrieved while the database had the specified
+        stamp. The info is discarded if the database has changed since.
+        """
+
+        if not stamp or self.load() != stamp:
+            return
+
+        self.certs[nickname] = info
+
+        if cert_obj:
+            self.objects[nickname] = cert_obj
+
+        self.store()
+
+    def store(self):
+
+        data = {
+            'stamp': self.stamp,
+            'certs': self.certs
+        }
+
+        tmp_file = None
+
+        try:
+            # use a unique temp file so concurrent processes do not
+            # overwrite each other's partial data
+            fd, tmp_file = tempfile.mkstemp(
+                dir=self.directory,
+                prefix=os.path.basename(self.cache_file) + '.')
+
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+
+            os.replace(tmp_file, self.cache_file)
+            tmp_file = None
+
+        except (IOError, OSError) as e:
+            # the cache is an optimization only, ignore read-only databases
+            logger.debug('Unable to store cert info cache: %s', e)
+
+        finally:
+            if tmp_file and os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def clear(self):
+
+        self.stamp = None
+        self.certs = {}
+        self.objects = {}
+
+        if os.path.exists(self.cache_file):
+            os.remove(self.cache_file)
+
+
 class NSSDatabase(object):
 
     def __init__(self, directory=None,
@@ -184,7 +345,8 @@ class NSSDatabase(object):
                  internal_password=None,
                  internal_password_file=None,
                  passwords=None,
-                 password_conf=None):
+                 password_conf=None,
+                 cache=False):
 
         if not directory:
             directory = os.path.join(
@@ -193,6 +355,9 @@ class NSSDatabase(object):
         self.directory = directory
         self.token = normalize_token(token)
 
+        # cache cert metadata if enabled by the caller
+        self.cert_info_cache = CertInfoCache(directory) if cache else None
+
         self.tmpdir = tempfile.mkdtemp()
 
         if password:
@@ -1326,16 +1491,143 @@ class NSSDatabase(object):
 
     def get_cert_info(self, nickname, token=None):
 
+        cache = self.get_cert_info_cache(token)
+        stamp = None
+
+        if cache:
+            stamp = cache.load()
+            cert = self.__load_cached_cert_info(cache, nickname)
+
+            if cert:
+                return cert
+
         cert_pem = self.get_cert(nickname=nickname, token=token)
 
         if not cert_pem:
             return None
 
+        trust_flags = self.get_trust(nickname=nickname, token=token)
+
+        return self.__create_cert_info(
+            cert_pem, trust_flags,
+            cache=cache, nickname=nickname, stamp=stamp)
+
+    def list_certs(self, token=None):
+        """
+        List all certificates in a token with their trust flags.
+
+        The trust table is retrieved with a single certutil -L call and
+        the certificates that are not available in the cert info cache
+        are exported with a single certutil batch call, so the cost does
+        not depend on the number of certificates.
+
+        :param token: Token name
+        :type token: str
+        :return: List of cert info (see get_cert_info()) with additional
+                 nickname and token attributes
+        :rtype: list
+        """
+
+        token = self.get_effective_token(token)
+
+        cache = self.get_cert_info_cache(token)
+        stamp = None
+
+        if cache:
+            stamp = cache.load()
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            password_file = self.get_password_file(tmpdir, token)
+
+            trust_table = self.__get_trust_table(token, password_file)
+
+            certs = {}
+            missing = []
+            shared = set()
+
+            for nickname, _ in trust_table:
+
+                if nickname in certs or nickname in missing:
+                    shared.add(nickname)
+                    continue
+
+                cert = None
+                if cache:
+                    cert = self.__load_cached_cert_info(cache, nickname)
+
+                if cert:
+                    certs[nickname] = cert
+                else:
+                    missing.append(nickname)
+
+            cert_pems = self.__export_certs(
+                tmpdir, missing, token, password_file, shared=shared)
+
+            trust_flags = dict(trust_table)
+
+            for nickname in missing:
+
+                cert_pem = cert_pems.get(nickname)
+
+                if not cert_pem:
+                    # cert disappeared after the trust table was retrieved
+                    continue
+
+                certs[nickname] = self.__create_cert_info(
+                    cert_pem, trust_flags[nickname],
+                    cache=cache, nickname=nickname, stamp=stamp)
+
+        finally:
+            shutil.rmtree(tmpdir)
+
+        results = []
+
+        for nickname, _ in trust_table:
+
+            cert = certs.pop(nickname, None)
+
+            if not cert:
+                continue
+
+            cert['nickname'] = nickname
+            cert['token'] = token
+
+            results.append(cert)
+
+        return results
+
+    def get_cert_info_cache(self, token=None):
+
+        # Certs stored in HSM can change without touching the internal
+        # cert database, so only internal certs are cached.
+        if self.get_effective_token(token):
+            return None
+
+        return self.cert_info_cache
+
+    def __load_cached_cert_info(self, cache, nickname):
+
+        info = cache.get(nickname)
+
+        if not info:
+            return None
+
+        logger.debug('Cert info cache hit: %s', nickname)
+
+        cert = dict(info)
+        del cert['data']
+        cert['object'] = cache.get_object(nickname)
+
+        return cert
+
+    def __create_cert_info(self, cert_pem, trust_flags,
+                           cache=None, nickname=None, stamp=None):
+
         cert_obj = x509.load_pem_x509_certificate(
             cert_pem, backend=default_backend())
 
         cert = {}
-        cert['object'] = cert_obj
 
         cert['serial_number'] = cert_obj.serial_number
 
@@ -1344,10 +1636,154 @@ class NSSDatabase(object):
 
         cert['not_before'] = self.convert_time_to_millis(cert_obj.not_valid_before)
         cert['not_after'] = self.convert_time_to_millis(cert_obj.not_valid_after)
-        cert['trust_flags'] = self.get_trust(nickname=nickname, token=token)
+        cert['trust_flags'] = trust_flags
+
+        if cache:
+            info = dict(cert)
+            info['data'] = cert_pem.decode('ascii')
+            cache.put(nickname, info, stamp, cert_obj=cert_obj)
+
+        cert['object'] = cert_obj
 
         return cert
 
+    def __get_trust_table(self, token, password_file):
+        """
+        Return a list of (nickname, trust flags) tuples for all certs
+        in the token as listed by certutil -L.
+        """
+
+        cmd = [
+            'certutil',
+            '-L',
+            '-d', self.directory
+        ]
+
+        if token:
+            cmd.extend(['-h', token])
+
+        if password_file:
+            cmd.extend(['-f', password_file])
+
+        logger.debug('Command: %s', ' '.join(map(str, cmd)))
+
+        output = subprocess.check_output(cmd)
+
+        trust_table = []
+        prefix = token + ':' if token else None
+
+        for line in output.decode().splitlines():
+
+            match = TRUST_TABLE_ENTRY.match(line)
+            if not match:
+                continue
+
+            nickname = match.group(1)
+            if prefix and nickname.startswith(prefix):
+                nickname = nickname[len(prefix):]
+
+            trust_table.append((nickname, match.group(2)))
+
+        return trust_table
+
+    def __export_certs(self, tmpdir, nicknames, token, password_file,
+                       shared=()):
+        """
+        Export certs in PEM format with a single certutil batch call.
+        Returns a dict of nickname to PEM data.
+
+        The batch output does not identify the nickname of each cert,
+        so the certs are matched to the nicknames by position. If the
+        output cannot be matched reliably, the certs are exported one
+        by one instead. Nicknames shared by multiple certs (see shared)
+        are always exported one by one.
+        """
+
+        results = self.__export_certs_individually(
+            [nickname for nickname in nicknames if nickname in shared],
+            token)
+
+        nicknames = [nickname for nickname in nicknames if nickname not in shared]
+
+        if not nicknames:
+            return results
+
+        fullnames = []
+
+        for nickname in nicknames:
+            if token:
+                fullnames.append(token + ':' + nickname)
+            else:
+                fullnames.append(nickname)
+
+        if any('"' in fullname for fullname in fullnames):
+            # nickname cannot be quoted in the batch file
+            results.update(self.__export_certs_individually(nicknames, token))
+            return results
+
+        batch_file = os.path.join(tmpdir, 'batch.txt')
+        with open(batch_file, 'w') as f:
+            for fullname in fullnames:
+                f.write('-L -n "%s" -a\n' % fullname)
+
+        cmd = [
+            'certutil',
+            '-B',
+            '-d', self.directory
+        ]
+
+        if token:
+            cmd.extend(['-h', token])
+
+        if password_file:
+            cmd.extend(['-f', password_file])
+
+        cmd.extend(['-i', batch_file])
+
+        logger.debug('Command: %s', ' '.join(map(str, cmd)))
+
+        p = subprocess.Popen(cmd,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+
+        output, error = p.communicate()
+
+        cert_pems = re.findall(
+            CERT_HEADER + r'.*?' + CERT_FOOTER,
+            output.decode('ascii'),
+            re.DOTALL)
+
+        # Each nickname should produce exactly one distinct cert. If
+        # certutil failed (e.g. a cert was removed or a nickname became
+        # shared after the trust table was retrieved) the output cannot
+        # be matched reliably, so export the certs one by one.
+        if p.returncode != 0 or error.strip():
+            logger.debug('Unable to export certs in batch: %s', error.strip())
+            cert_pems = None
+
+        elif len(cert_pems) != len(nicknames) or \
+                len(set(cert_pems)) != len(cert_pems):
+            logger.debug('Unable to match batch output to nicknames')
+            cert_pems = None
+
+        if cert_pems is None:
+            results.update(self.__export_certs_individually(nicknames, token))
+            return results
+
+        for nickname, cert_pem in zip(nicknames, cert_pems):
+            results[nickname] = (cert_pem + '\n').encode('ascii')
+
+        return results
+
+    def __export_certs_individually(self, nicknames, token):
+
+        results = {}
+
+        for nickname in nicknames:
+            results[nickname] = self.get_cert(nickname=nickname, token=token)
+
+        return results
+
     @staticmethod
     def convert_time_to_millis(date):
         epoch = datetime.datetime.utcfromtimestamp(0)
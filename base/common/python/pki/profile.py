@@ -30,20 +30,17 @@ import pki.account as account
 import pki.encoder as encoder
 
 
-class ProfileDataInfo(object):
+class ProfileDataInfo(pki.Record):
     """Stores information about a profile"""
 
+    __slots__ = (
+        'profile_id', 'profile_name', 'profile_description', 'profile_url')
+
     json_attribute_names = {
         'profileId': 'profile_id', 'profileName': 'profile_name',
         'profileDescription': 'profile_description', 'profileURL': 'profile_url'
     }
 
-    def __init__(self):
-        self.profile_id = None
-        self.profile_name = None
-        self.profile_description = None
-        self.profile_url = None
-
     def __repr__(self):
         attributes = {
             "ProfileDataInfo": {
@@ -55,21 +52,6 @@ class ProfileDataInfo(object):
         }
         return str(attributes)
 
-    @classmethod
-    def from_json(cls, attr_list):
-        if attr_list is None:
-            return None
-
-        profile_data_info = cls()
-        for k, v in iteritems(attr_list):
-            if k in ProfileDataInfo.json_attribute_names:
-                setattr(profile_data_info,
-                        ProfileDataInfo.json_attribute_names[k], v)
-            else:
-                setattr(profile_data_info, k, v)
-
-        return profile_data_info
-
 
 class ProfileDataInfoCollection(object):
     """
@@ -85,16 +67,10 @@ class ProfileDataInfoCollection(object):
         return iter(self.profile_data_list)
 
     @classmethod
-    def from_json(cls, attr_list):
+    def from_json(cls, attr_list, lazy=False):
         ret = cls()
-        profile_data_infos = attr_list['entries']
-        if not isinstance(profile_data_infos, list):
-            ret.profile_data_list.append(
-                ProfileDataInfo.from_json(profile_data_infos))
-        else:
-            for profile_info in profile_data_infos:
-                ret.profile_data_list.append(
-                    ProfileDataInfo.from_json(profile_info))
+        ret.profile_data_list = ProfileDataInfo.from_json_list(
+            attr_list['entries'], lazy=lazy)
 
         links = attr_list['Link']
         if not isinstance(links, list):
@@ -26,12 +26,17 @@ import logging
 import xml.etree.ElementTree as ETree
 import os
 
+import pki
 import pki.encoder
 
 SYSTEM_TYPE = "Fedora/RHEL"
 if os.path.exists("/etc/debian_version"):
     SYSTEM_TYPE = "debian"
 
+# Status codes of the admin servlets
+ADMIN_SUCCESS = '0'
+ADMIN_AUTH_FAILURE = '2'
+
 logger = logging.getLogger(__name__)
 
 
@@ -458,6 +463,97 @@ class SystemStatusClient(object):
         return response.text
 
 
+class CloneSetupClient(object):
+    """
+    Client used to get the number ranges and the configuration
+    properties of a master subsystem while setting up a clone.
+    The requests are authenticated with the install token of the
+    security domain session.
+    """
+
+    def __init__(self, connection, subsystem):
+
+        self.connection = connection
+        self.subsystem = subsystem
+
+        self.update_number_range_url = '/%s/admin/%s/updateNumberRange' % (
+            subsystem, subsystem)
+        self.get_config_entries_url = '/%s/admin/%s/getConfigEntries' % (
+            subsystem, subsystem)
+
+    @staticmethod
+    def parse_response(response):
+
+        root = ETree.fromstring(response.text)
+
+        status = root.findtext('Status')
+        logger.debug('Status: %s', status)
+
+        if status == ADMIN_AUTH_FAILURE:
+            raise pki.UnauthorizedException('Authentication failed')
+
+        if status != ADMIN_SUCCESS:
+            raise pki.PKIException(root.findtext('Error'))
+
+        return root
+
+    def request_range(self, range_type, session_id):
+        """
+        Request a range of numbers (request, serialNo, or replicaId)
+        from the master subsystem.
+
+        :return: dict with begin and end attributes
+        """
+
+        logger.info('Requesting %s range', range_type)
+
+        data = {
+            'type': range_type,
+            'xmlOutput': 'true',
+            'sessionID': session_id
+        }
+
+        response = self.connection.post(self.update_number_range_url, data)
+        root = self.parse_response(response)
+
+        return {
+            'begin': root.findtext('beginNumber'),
+            'end': root.findtext('endNumber')
+        }
+
+    def get_config(self, names, substores, session_id):
+        """
+        Get the specified configuration properties and the properties
+        in the specified substores of the master subsystem.
+
+        :return: dict with properties attribute
+        """
+
+        logger.info('Getting configuration properties')
+
+        data = {
+            'op': 'get',
+            'names': ','.join(names),
+            'substores': ','.join(substores),
+            'xmlOutput': 'true',
+            'sessionID': session_id
+        }
+
+        response = self.connection.post(self.get_config_entries_url, data)
+        root = self.parse_response(response)
+
+        properties = {}
+        for element in root.iter():
+            name = element.findtext('name')
+            if name is None:
+                continue
+            properties[name] = element.findtext('value') or ''
+
+        return {
+            'properties': properties
+        }
+
+
 pki.encoder.NOTYPES['DomainInfo'] = DomainInfo
 pki.encoder.NOTYPES['SecurityDomainSubsystem'] = SecurityDomainSubsystem
 pki.encoder.NOTYPES['SecurityDomainHost'] = SecurityDomainHost
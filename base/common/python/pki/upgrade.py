@@ -20,11 +20,17 @@
 #
 
 from __future__ import absolute_import
+import errno
+import fcntl
 import functools
+import json
 import logging
 import os
 import pathlib
 import re
+import shutil
+import stat
+import threading
 
 import pki
 import pki.util
@@ -38,6 +44,20 @@ SYSTEM_TRACKER = pki.CONF_DIR + '/pki.version'
 
 logger = logging.getLogger(__name__)
 
+# Linux ioctl to clone file content (reflink) on copy-on-write filesystems
+FICLONE = 0x40049409
+
+COMPARE_BUFFER_SIZE = 64 * 1024
+
+# errors indicating that a reflink or a hard link cannot be created
+LINK_ERRORS = (
+    errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL,
+    errno.EPERM, errno.EMLINK, errno.ENOSYS)
+
+# scriptlet classes compiled in this process keyed by file path
+scriptlet_classes = {}
+scriptlet_classes_lock = threading.Lock()
+
 
 class PKIUpgradeTracker(object):
 
@@ -193,8 +213,8 @@ class PKIUpgradeScriptlet(object):
         # Callback method to upgrade the system.
         pass
 
-    def backup(self, path):
-        self.upgrader.backup(self, path)
+    def backup(self, path, replaced=False):
+        self.upgrader.backup(self, path, replaced=replaced)
 
     def __eq__(self, other):
         return self.version == other.version and self.index == other.index
@@ -209,6 +229,62 @@ class PKIUpgradeScriptlet(object):
     __hash__ = None
 
 
+def reflink(source, dest):
+    """
+    Clone a file without copying its content. Returns False if the
+    filesystem does not support reflinks.
+    """
+
+    try:
+        with open(source, 'rb') as src, open(dest, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+    except (IOError, OSError) as e:
+        if e.errno not in LINK_ERRORS:
+            raise
+
+        if os.path.exists(dest):
+            os.remove(dest)
+
+        return False
+
+    return True
+
+
+def hardlink(source, dest):
+    """
+    Create a hard link. Returns False if the link cannot be created,
+    e.g. the files are on different filesystems.
+    """
+
+    try:
+        os.link(source, dest)
+
+    except OSError as e:
+        if e.errno not in LINK_ERRORS:
+            raise
+        return False
+
+    return True
+
+
+def same_content(file1, file2):
+    """
+    Compare the content of two files byte by byte.
+    """
+
+    with open(file1, 'rb') as f1, open(file2, 'rb') as f2:
+        while True:
+            data1 = f1.read(COMPARE_BUFFER_SIZE)
+            data2 = f2.read(COMPARE_BUFFER_SIZE)
+
+            if data1 != data2:
+                return False
+
+            if not data1:
+                return True
+
+
 class PKIUpgrader(object):
 
     def __init__(self, upgrade_dir=UPGRADE_DIR):
@@ -216,6 +292,11 @@ class PKIUpgrader(object):
         self.upgrade_dir = upgrade_dir
         self.tracker = None
 
+        # files backed up in this upgrade run keyed by the identity
+        # of the original file, so that unchanged files backed up by
+        # multiple scriptlets are stored only once
+        self.backup_files = {}
+
     def version_dir(self, version):
 
         return os.path.join(self.upgrade_dir, str(version))
@@ -299,15 +380,9 @@ class PKIUpgrader(object):
             index = int(match.group(1))
             classname = match.group(2)
 
-            # load scriptlet class
-            variables = {}
-            absname = os.path.join(version_dir, filename)
-            with open(absname, 'r') as f:
-                bytecode = compile(f.read(), absname, 'exec')
-            exec(bytecode, variables)  # pylint: disable=W0122
-
             # create scriptlet object
-            scriptlet = variables[classname]()
+            absname = os.path.join(version_dir, filename)
+            scriptlet = self.load_scriptlet_class(absname, classname)()
 
             scriptlet.version = version
             scriptlet.index = index
@@ -322,6 +397,28 @@ class PKIUpgrader(object):
 
         return scriptlets
 
+    def load_scriptlet_class(self, filename, classname):
+        """
+        Load scriptlet class from a file. The file is compiled only once
+        per process so that the class can be reused for each upgrade.
+        """
+
+        with scriptlet_classes_lock:
+
+            scriptlet_class = scriptlet_classes.get(filename)
+            if scriptlet_class:
+                return scriptlet_class
+
+            variables = {}
+            with open(filename, 'r') as f:
+                bytecode = compile(f.read(), filename, 'exec')
+            exec(bytecode, variables)  # pylint: disable=W0122
+
+            scriptlet_class = variables[classname]
+            scriptlet_classes[filename] = scriptlet_class
+
+            return scriptlet_class
+
     def get_tracker(self):
 
         if self.tracker:
@@ -386,7 +483,82 @@ class PKIUpgrader(object):
         with open(filename, 'a') as f:
             f.write(path + '\n')
 
-    def backup(self, scriptlet, path):
+    def add_manifest_entry(self, scriptlet, path, st):
+        """
+        Record the attributes of a backed up path in the manifest,
+        so the path can be restored exactly as it was.
+        """
+
+        entry = {
+            'path': path,
+            'mode': stat.S_IMODE(st.st_mode),
+            'uid': st.st_uid,
+            'gid': st.st_gid,
+            'atime': st.st_atime,
+            'mtime': st.st_mtime
+        }
+
+        if stat.S_ISLNK(st.st_mode):
+            entry['type'] = 'link'
+            entry['target'] = os.readlink(path)
+
+        elif stat.S_ISDIR(st.st_mode):
+            entry['type'] = 'dir'
+
+        else:
+            entry['type'] = 'file'
+
+        manifest = scriptlet.get_backup_dir() + '/manifest'
+
+        with open(manifest, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def backup_file(self, source, dest, replaced=False):
+        """
+        Back up a file by reusing an earlier backup of the same file in this
+        run or by cloning it, and copying it only if neither is possible.
+
+        If replaced is True the scriptlet replaces the file (i.e. writes a
+        new file and renames it over the original) instead of modifying it
+        in place, so the original can be hard linked as well. Files that
+        might be written in place (pki.util.store_properties() does so if
+        the file cannot be replaced) must not be hard linked since the
+        backup would change along with the original.
+        """
+
+        st = os.lstat(source)
+
+        if stat.S_ISLNK(st.st_mode):
+            self.copyfile(source, dest)
+            return
+
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+        # an earlier backup can only be shared if it is a separate copy
+        # (a backup of a replaced file is the original file itself) and
+        # the file has not been modified since, which the key cannot tell
+        # if the size and the timestamp did not change
+        backup_file = self.backup_files.get(key)
+        if backup_file and os.path.exists(backup_file) and \
+                not os.path.samefile(backup_file, source) and \
+                same_content(backup_file, source) and \
+                hardlink(backup_file, dest):
+            logger.debug('Command: ln %s %s', backup_file, dest)
+            return
+
+        if reflink(source, dest):
+            logger.debug('Command: cp --reflink %s %s', source, dest)
+            shutil.copystat(source, dest)
+
+        elif replaced and hardlink(source, dest):
+            logger.debug('Command: ln %s %s', source, dest)
+
+        else:
+            self.copyfile(source, dest)
+
+        self.backup_files[key] = dest
+
+    def backup(self, scriptlet, path, replaced=False):
 
         backup_dir = scriptlet.get_backup_dir()
 
@@ -415,9 +587,10 @@ class PKIUpgrader(object):
         if os.path.isfile(path):
 
             # backup file
-            if not os.path.exists(dest):
+            if not os.path.lexists(dest):
                 logger.info('Saving %s', path)
-                self.copyfile(path, dest)
+                self.backup_file(path, dest, replaced=replaced)
+                self.add_manifest_entry(scriptlet, path, os.lstat(path))
 
             return
 
@@ -431,14 +604,16 @@ class PKIUpgrader(object):
             if not os.path.exists(destpath):
                 logger.info('Saving %s', sourcepath)
                 self.copydirs(sourcepath, destpath, force=True)
+                self.add_manifest_entry(scriptlet, sourcepath, os.lstat(sourcepath))
 
             for filename in filenames:
                 sourcefile = os.path.join(sourcepath, filename)
                 targetfile = os.path.join(destpath, filename)
 
-                if not os.path.exists(targetfile):
+                if not os.path.lexists(targetfile):
                     logger.info('Saving %s', sourcefile)
-                    self.copyfile(sourcefile, targetfile)
+                    self.backup_file(sourcefile, targetfile, replaced=replaced)
+                    self.add_manifest_entry(scriptlet, sourcefile, os.lstat(sourcefile))
 
     def upgrade_version(self, version):
 
@@ -456,7 +631,18 @@ class PKIUpgrader(object):
                         version, scriptlet.index, scriptlet.message)
 
             self.init_scriptlet(scriptlet)
-            self.run_scriptlet(scriptlet)
+
+            try:
+                self.run_scriptlet(scriptlet)
+
+            except Exception:
+                # restore the files changed by the failed scriptlet, the
+                # tracker still points to the last completed scriptlet
+                logger.error('Upgrade script %s-%s failed, reverting changes',
+                             version, scriptlet.index)
+                self.revert_scriptlet(scriptlet)
+                raise
+
             self.update_tracker(scriptlet)
 
     def init_scriptlet(self, scriptlet):
@@ -491,7 +677,12 @@ class PKIUpgrader(object):
             return
 
         oldfiles = backup_dir + '/oldfiles'
-        if os.path.exists(oldfiles):
+        manifest = backup_dir + '/manifest'
+
+        if os.path.exists(manifest):
+            self.restore_files(oldfiles, manifest)
+
+        elif os.path.exists(oldfiles):
 
             # restore all backed up files
             for sourcepath, _, filenames in os.walk(oldfiles):
@@ -537,6 +728,56 @@ class PKIUpgrader(object):
                 else:
                     pki.util.rmtree(path)
 
+    def restore_files(self, oldfiles, manifest):
+        """
+        Restore backed up files with their original attributes
+        as recorded in the manifest.
+        """
+
+        with open(manifest, 'r') as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+
+        for entry in entries:
+
+            path = entry['path']
+            backup_file = oldfiles + path
+
+            if entry['type'] == 'dir':
+                if not os.path.isdir(path):
+                    logger.info('Restoring %s', path)
+                    os.makedirs(path)
+
+            elif entry['type'] == 'link':
+                logger.info('Restoring %s', path)
+                if os.path.lexists(path):
+                    os.remove(path)
+                os.symlink(entry['target'], path)
+                os.lchown(path, entry['uid'], entry['gid'])
+                continue
+
+            elif os.path.exists(path) and os.path.samefile(backup_file, path):
+                # hard linked file has not been replaced
+                logger.debug('File unchanged: %s', path)
+
+            else:
+                logger.info('Restoring %s', path)
+
+                parent = os.path.dirname(path)
+                if not os.path.isdir(parent):
+                    os.makedirs(parent)
+
+                # remove the current file first so that the restored
+                # file does not share content with the backup
+                if os.path.lexists(path):
+                    os.remove(path)
+
+                if not reflink(backup_file, path):
+                    shutil.copyfile(backup_file, path)
+
+            os.chown(path, entry['uid'], entry['gid'])
+            os.chmod(path, entry['mode'])
+            os.utime(path, (entry['atime'], entry['mtime']))
+
     def revert_version(self, version):
 
         scriptlets = self.scriptlets(version)
@@ -24,15 +24,19 @@ Module containing utility functions and classes for the Dogtag python code
 
 
 from __future__ import absolute_import
+import bisect
+import errno
 import fileinput
 import functools
 import getpass
+import hashlib
 import io
 import logging
 import operator
 import os
 import re
 import shutil
+import tempfile
 from shutil import Error
 try:
     from shutil import WindowsError  # pylint: disable=E0611
@@ -354,70 +358,337 @@ def customize_file(input_file, output_file, params):
             outfile.write(line)
 
 
+class PropertiesSnapshot(object):
+    """
+    Parsed content of a properties file.
+
+    The snapshot keeps the original lines and the location of each
+    property so that the file can be updated without rewriting the
+    lines that did not change.
+    """
+
+    def __init__(self, stamp, digest, lines, values, spans):
+        self.stamp = stamp
+        # digest of the file content, since the stamp might not detect
+        # changes made within the timestamp granularity
+        self.digest = digest
+        self.lines = lines
+        self.values = values
+        # property name -> list of (first line, last line + 1)
+        self.spans = spans
+
+
+# properties snapshots keyed by file path
+properties_snapshots = {}
+
+
+def get_properties_stamp(filename):
+    """
+    Return a value identifying the current version of a file,
+    or None if the file does not exist.
+    """
+
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def get_properties_digest(content):
+    """
+    Return the digest of the content of a properties file.
+    """
+
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def read_properties_digest(filename):
+    """
+    Return the digest of the current content of a properties file,
+    or None if the file does not exist.
+    """
+
+    try:
+        with io.open(filename) as f:
+            return get_properties_digest(f.read())
+    except (IOError, OSError):
+        return None
+
+
+def parse_properties(filename, lines):
+
+    values = {}
+    spans = {}
+
+    name = None
+    start = None
+    multi_line = False
+
+    for index, line in enumerate(lines):
+
+        if multi_line:
+            # append line to previous property
+
+            value = values[name]
+            value = value + line
+
+        else:
+            # parse line for new property
+
+            line = line.lstrip()
+            if not line or line.startswith('#'):
+                continue
+
+            parts = line.split('=', 1)
+            if len(parts) < 2:
+                raise Exception('Missing delimiter in %s line %d' %
+                                (filename, index + 1))
+
+            name = parts[0].rstrip()
+            value = parts[1].lstrip()
+            start = index
+
+        # check if the value is multi-line
+        if value.endswith('\\'):
+            value = value[:-1]
+            multi_line = True
+
+        else:
+            value = value.rstrip()
+            multi_line = False
+            spans.setdefault(name, []).append((start, index + 1))
+
+        # store value in properties
+        values[name] = value
+
+    if multi_line:
+        # the last property continues until the end of file
+        spans.setdefault(name, []).append((start, len(lines)))
+
+    return values, spans
+
+
+def load_properties_snapshot(filename):
+    """
+    Return the snapshot of a properties file. The file is parsed
+    only if it has changed since the last time it was loaded or
+    stored in this process.
+    """
+
+    path = os.path.realpath(filename)
+    stamp = get_properties_stamp(path)
+
+    snapshot = properties_snapshots.get(path)
+    if snapshot and stamp and snapshot.stamp == stamp:
+        return snapshot
+
+    with io.open(path) as f:
+        content = f.read()
+
+    lines = content.splitlines()
+    values, spans = parse_properties(filename, lines)
+
+    snapshot = PropertiesSnapshot(
+        stamp, get_properties_digest(content), lines, values, spans)
+    properties_snapshots[path] = snapshot
+
+    return snapshot
+
+
 def load_properties(filename, properties):
 
-    with open(filename) as f:
+    snapshot = load_properties_snapshot(filename)
+    properties.update(snapshot.values)
 
-        lines = f.read().splitlines()
-        name = None
-        multi_line = False
 
-        for index, line in enumerate(lines):
+def format_property(name, value):
 
-            if multi_line:
-                # append line to previous property
+    if value is None:
+        # write None as empty value
+        return u'{0}='.format(name)
 
-                value = properties[name]
-                value = value + line
+    if isinstance(value, six.string_types):
+        return u'{0}={1}'.format(name, value)
 
-            else:
-                # parse line for new property
+    if isinstance(value, six.integer_types):
+        return u'{0}={1:d}'.format(name, value)
 
-                line = line.lstrip()
-                if not line or line.startswith('#'):
-                    continue
+    raise TypeError((name, value, type(value)))
 
-                parts = line.split('=', 1)
-                if len(parts) < 2:
-                    raise Exception('Missing delimiter in %s line %d' %
-                                    (filename, index + 1))
 
-                name = parts[0].rstrip()
-                value = parts[1].lstrip()
+def update_properties_lines(snapshot, properties):
+    """
+    Return the lines of the snapshot updated with the given properties
+    while preserving the order of the existing properties and comments,
+    or None if none of the properties has changed.
+    """
 
-            # check if the value is multi-line
-            if value.endswith('\\'):
-                value = value[:-1]
-                multi_line = True
+    missing = object()
 
-            else:
-                value = value.rstrip()
-                multi_line = False
+    changed = {}
+    for name, value in properties.items():
+        if snapshot.values.get(name, missing) != value:
+            changed[name] = format_property(name, value)
+
+    removed = [name for name in snapshot.values if name not in properties]
+
+    if not changed and not removed:
+        return None
+
+    # line index -> replacement line, or None to remove the line
+    replacements = {}
+
+    for name in removed:
+        for first, last in snapshot.spans[name]:
+            for index in range(first, last):
+                replacements[index] = None
+
+    added = []
+    for name in sorted(changed):
+
+        spans = snapshot.spans.get(name)
+        if not spans:
+            added.append(name)
+            continue
+
+        # replace the last (i.e. effective) definition, remove the others
+        for first, last in spans:
+            for index in range(first, last):
+                replacements[index] = None
+
+        first, _ = spans[-1]
+        replacements[first] = changed[name]
+
+    # existing properties in file order
+    entries = sorted(
+        (spans[-1][0], spans[-1][1], name)
+        for name, spans in snapshot.spans.items()
+        if name in properties)
+    names = [name for _, _, name in entries]
+    is_sorted = names == sorted(names)
+
+    # line index -> new lines to insert before that line
+    insertions = {}
+
+    for name in added:
+
+        if is_sorted:
+            # keep sorted file sorted
+            i = bisect.bisect(names, name)
+        else:
+            i = len(names)
+
+        if not entries:
+            index = len(snapshot.lines)
+        elif i == 0:
+            index = entries[0][0]
+        else:
+            index = entries[i - 1][1]
+
+        insertions.setdefault(index, []).append(changed[name])
+
+    lines = []
+    for index in range(len(snapshot.lines) + 1):
+
+        lines.extend(insertions.get(index, []))
+
+        if index == len(snapshot.lines):
+            break
 
-            # store value in properties
-            properties[name] = value
+        line = replacements.get(index, snapshot.lines[index])
+        if line is not None:
+            lines.append(line)
+
+    return lines
 
 
 def store_properties(filename, properties):
+    """
+    Store properties into a file.
 
-    sorted_props = sorted(properties.items(), key=operator.itemgetter(0))
+    If the file has not changed since it was loaded with
+    load_properties() only the lines of the modified properties
+    will be updated, otherwise the file will be rewritten with
+    the properties sorted by name.
 
-    with io.open(filename, 'w') as f:
+    The new content is written into a temporary file which then
+    replaces the original file, so readers never see a partially
+    written file.
+    """
 
-        for name, value in sorted_props:
+    path = os.path.realpath(filename)
+    stamp = get_properties_stamp(path)
 
-            if value is None:
-                # write None as empty value
-                f.write(u'{0}=\n'.format(name))
+    snapshot = properties_snapshots.get(path)
 
-            elif isinstance(value, six.string_types):
-                f.write(u'{0}={1}\n'.format(name, value))
+    if snapshot and stamp and snapshot.stamp == stamp and \
+            read_properties_digest(path) == snapshot.digest:
+        lines = update_properties_lines(snapshot, properties)
+        if lines is None:
+            logger.debug('No changes in %s', filename)
+            return
 
-            elif isinstance(value, six.integer_types):
-                f.write(u'{0}={1:d}\n'.format(name, value))
+    else:
+        sorted_props = sorted(properties.items(), key=operator.itemgetter(0))
+        lines = [format_property(name, value) for name, value in sorted_props]
 
-            else:
-                raise TypeError((name, value, type(value)))
+    content = u''.join(line + u'\n' for line in lines)
+
+    replace_file(path, content)
+
+    values, spans = parse_properties(filename, lines)
+    properties_snapshots[path] = PropertiesSnapshot(
+        get_properties_stamp(path), get_properties_digest(content),
+        lines, values, spans)
+
+
+def replace_file(filename, content):
+    """
+    Replace the content of a file atomically while keeping its
+    permissions and ownership.
+
+    If the file cannot be replaced (e.g. it belongs to another user
+    or the directory is read-only) the file is updated in place instead.
+    """
+
+    try:
+        st = os.stat(filename)
+    except OSError:
+        st = None
+
+    tmp_file = None
+
+    try:
+        fd, tmp_file = tempfile.mkstemp(
+            dir=os.path.dirname(filename),
+            prefix='.' + os.path.basename(filename) + '.')
+
+        with io.open(fd, 'w') as f:
+            f.write(content)
+
+        if st:
+            os.chmod(tmp_file, st.st_mode & 0o7777)
+
+            if (st.st_uid, st.st_gid) != (os.getuid(), os.getgid()):
+                os.chown(tmp_file, st.st_uid, st.st_gid)
+
+        os.replace(tmp_file, filename)
+        tmp_file = None
+
+    except OSError as e:
+        if e.errno not in (errno.EPERM, errno.EACCES):
+            raise
+
+        logger.debug('Unable to replace %s: %s', filename, e)
+
+        with io.open(filename, 'w') as f:
+            f.write(content)
+
+    finally:
+        if tmp_file and os.path.exists(tmp_file):
+            os.remove(tmp_file)
 
 
 def set_property(properties, name, value):
@@ -0,0 +1,302 @@
+//
+// Copyright Red Hat, Inc.
+//
+// SPDX-License-Identifier: GPL-2.0-or-later
+//
+package org.dogtagpki.cli;
+
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.DataInputStream;
+import java.io.DataOutputStream;
+import java.io.EOFException;
+import java.io.FileDescriptor;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.InputStream;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+import java.util.LinkedHashMap;
+import java.util.Map;
+import java.util.logging.ConsoleHandler;
+import java.util.logging.Handler;
+import java.util.logging.LogRecord;
+import java.util.logging.StreamHandler;
+
+import org.slf4j.Logger;
+import org.slf4j.LoggerFactory;
+
+/**
+ * Runs the commands of a CLI main class in a long-lived JVM so that
+ * each command does not have to pay for the JVM startup.
+ *
+ * The requests are read from the standard input and the responses are
+ * written to the standard output of this process, so only the process
+ * that started the daemon (see pki.cli.daemon) can submit commands.
+ * The commands are executed one at a time.
+ *
+ * Request:
+ * - int: number of arguments
+ * - for each argument: int length, UTF-8 bytes
+ * - int length (-1 if none), bytes: standard input of the command
+ *
+ * Response:
+ * - int: exit code
+ * - int length, bytes: standard output of the command
+ * - int length, bytes: standard error of the command
+ *
+ * System.exit() is trapped with a SecurityManager, so on Java 18 to 23
+ * the JVM has to be started with -Djava.security.manager=allow.
+ */
+public class CLIDaemon {
+
+    public static Logger logger = LoggerFactory.getLogger(CLIDaemon.class);
+
+    // loggers configured by PKILogger.setLevel()
+    public static final String[] LOGGER_NAMES = { "org.dogtagpki", "com.netscape", "netscape" };
+
+    static volatile boolean running;
+    static volatile Integer exitStatus;
+
+    Method main;
+    Map<String, java.util.logging.Level> levels = new LinkedHashMap<>();
+
+    public CLIDaemon(String className) throws Exception {
+
+        Class<?> mainClass = Class.forName(className);
+        main = mainClass.getMethod("main", String[].class);
+
+        for (String name : LOGGER_NAMES) {
+            levels.put(name, java.util.logging.Logger.getLogger(name).getLevel());
+        }
+    }
+
+    static class ExitException extends SecurityException {
+
+        private static final long serialVersionUID = 1L;
+
+        public ExitException(int status) {
+            super("System.exit(" + status + ")");
+        }
+    }
+
+    /**
+     * Turn System.exit() calls from the commands into exceptions so that
+     * the exit code is returned to the client and the JVM keeps running.
+     */
+    public static void trapExit() {
+
+        System.setSecurityManager(new SecurityManager() {
+
+            @Override
+            public void checkPermission(Permission perm) {
+            }
+
+            @Override
+            public void checkPermission(Permission perm, Object context) {
+            }
+
+            @Override
+            public void checkExit(int status) {
+
+                if (!running) {
+                    return;
+                }
+
+                // keep the first exit status in case a command catches
+                // the exception and calls System.exit() again
+                if (exitStatus == null) {
+                    exitStatus = status;
+                }
+
+                throw new ExitException(status);
+            }
+        });
+    }
+
+    /**
+     * Replace the console handlers of the root logger, which write into
+     * the standard error of the JVM, with handlers that write into the
+     * standard error of the command. Returns the replaced handlers.
+     */
+    public static Map<Handler, Handler> redirectConsoleHandlers(PrintStream err) throws Exception {
+
+        java.util.logging.Logger rootLogger = java.util.logging.Logger.getLogger("");
+        Map<Handler, Handler> handlers = new LinkedHashMap<>();
+
+        for (Handler handler : rootLogger.getHandlers()) {
+
+            if (!(handler instanceof ConsoleHandler)) {
+                continue;
+            }
+
+            StreamHandler commandHandler = new StreamHandler(err, handler.getFormatter()) {
+                @Override
+                public synchronized void publish(LogRecord record) {
+                    super.publish(record);
+                    flush();
+                }
+            };
+
+            commandHandler.setEncoding(handler.getEncoding());
+            commandHandler.setLevel(handler.getLevel());
+            commandHandler.setFilter(handler.getFilter());
+
+            rootLogger.removeHandler(handler);
+            rootLogger.addHandler(commandHandler);
+
+            handlers.put(handler, commandHandler);
+        }
+
+        return handlers;
+    }
+
+    public static void restoreConsoleHandlers(Map<Handler, Handler> handlers) {
+
+        java.util.logging.Logger rootLogger = java.util.logging.Logger.getLogger("");
+
+        for (Map.Entry<Handler, Handler> entry : handlers.entrySet()) {
+
+            // don't close the handler since that would close the stream
+            Handler commandHandler = entry.getValue();
+            commandHandler.flush();
+
+            rootLogger.removeHandler(commandHandler);
+            rootLogger.addHandler(entry.getKey());
+        }
+    }
+
+    public int execute(String[] args, byte[] input, PrintStream out, PrintStream err) throws Exception {
+
+        PrintStream stdout = System.out;
+        PrintStream stderr = System.err;
+        InputStream stdin = System.in;
+
+        System.setOut(out);
+        System.setErr(err);
+        System.setIn(new ByteArrayInputStream(input == null ? new byte[0] : input));
+
+        Map<Handler, Handler> handlers = new LinkedHashMap<>();
+
+        exitStatus = null;
+        running = true;
+
+        try {
+            handlers = redirectConsoleHandlers(err);
+
+            main.invoke(null, (Object) args);
+
+        } catch (InvocationTargetException e) {
+            Throwable t = e.getCause();
+
+            if (exitStatus == null) {
+                t.printStackTrace(err);
+                return 1;
+            }
+
+        } finally {
+            running = false;
+
+            restoreConsoleHandlers(handlers);
+
+            out.flush();
+            err.flush();
+
+            System.setOut(stdout);
+            System.setErr(stderr);
+            System.setIn(stdin);
+
+            // restore the log levels changed by --debug or -v
+            for (Map.Entry<String, java.util.logging.Level> entry : levels.entrySet()) {
+                java.util.logging.Logger.getLogger(entry.getKey()).setLevel(entry.getValue());
+            }
+        }
+
+        return exitStatus == null ? 0 : exitStatus;
+    }
+
+    public static byte[] readBytes(DataInputStream in) throws Exception {
+
+        int length = in.readInt();
+        if (length < 0) {
+            return null;
+        }
+
+        byte[] bytes = new byte[length];
+        in.readFully(bytes);
+
+        return bytes;
+    }
+
+    public static void writeBytes(DataOutputStream out, byte[] bytes) throws Exception {
+        out.writeInt(bytes.length);
+        out.write(bytes);
+    }
+
+    public void run(DataInputStream in, DataOutputStream out) throws Exception {
+
+        while (true) {
+
+            int count;
+            try {
+                count = in.readInt();
+
+            } catch (EOFException e) {
+                logger.info("CLIDaemon: Client disconnected");
+                return;
+            }
+
+            String[] args = new String[count];
+            for (int i = 0; i < count; i++) {
+                args[i] = new String(readBytes(in), StandardCharsets.UTF_8);
+            }
+
+            byte[] input = readBytes(in);
+
+            ByteArrayOutputStream stdout = new ByteArrayOutputStream();
+            ByteArrayOutputStream stderr = new ByteArrayOutputStream();
+
+            int code = execute(
+                    args,
+                    input,
+                    new PrintStream(stdout, true, StandardCharsets.UTF_8.name()),
+                    new PrintStream(stderr, true, StandardCharsets.UTF_8.name()));
+
+            out.writeInt(code);
+            writeBytes(out, stdout.toByteArray());
+            writeBytes(out, stderr.toByteArray());
+            out.flush();
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+
+        if (args.length != 1) {
+            System.err.println("Usage: CLIDaemon <main class>");
+            System.exit(1);
+        }
+
+        CLIDaemon daemon = new CLIDaemon(args[0]);
+
+        // Use the original file descriptors for the protocol and keep
+        // any stray output of the commands away from them.
+        DataInputStream in = new DataInputStream(
+                new BufferedInputStream(new FileInputStream(FileDescriptor.in)));
+        DataOutputStream out = new DataOutputStream(
+                new BufferedOutputStream(new FileOutputStream(FileDescriptor.out)));
+
+        System.setOut(System.err);
+
+        trapExit();
+
+        daemon.run(in, out);
+
+        // commands might have left non-daemon threads behind
+        System.exit(0);
+    }
+}
@@ -100,7 +100,7 @@ class CASystemCertExpiryCheck(CertsPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         ca = self.instance.get_subsystem('ca')
 
@@ -108,7 +108,12 @@ class CASystemCertExpiryCheck(CertsPlugin):
             logger.info("No CA configured, skipping CA System Cert Expiry check")
             return
 
-        certs = ca.find_system_certs()
+        # Load all system certs with their expiry dates from NSSDB at once
+        certs, error = self.context.load_system_certs(self, ca)
+
+        if error:
+            yield error
+            return
 
         for cert in certs:
             yield check_cert_expiry_date(class_instance=self, cert=cert)
@@ -128,7 +133,7 @@ class KRASystemCertExpiryCheck(CertsPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         kra = self.instance.get_subsystem('kra')
 
@@ -136,7 +141,12 @@ class KRASystemCertExpiryCheck(CertsPlugin):
             logger.info("No KRA configured, skipping KRA System Cert Expiry check")
             return
 
-        certs = kra.find_system_certs()
+        # Load all system certs with their expiry dates from NSSDB at once
+        certs, error = self.context.load_system_certs(self, kra)
+
+        if error:
+            yield error
+            return
 
         for cert in certs:
             yield check_cert_expiry_date(class_instance=self, cert=cert)
@@ -156,7 +166,7 @@ class OCSPSystemCertExpiryCheck(CertsPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         ocsp = self.instance.get_subsystem('ocsp')
 
@@ -164,7 +174,12 @@ class OCSPSystemCertExpiryCheck(CertsPlugin):
             logger.info("No OCSP configured, skipping OCSP System Cert Expiry check")
             return
 
-        certs = ocsp.find_system_certs()
+        # Load all system certs with their expiry dates from NSSDB at once
+        certs, error = self.context.load_system_certs(self, ocsp)
+
+        if error:
+            yield error
+            return
 
         for cert in certs:
             yield check_cert_expiry_date(class_instance=self, cert=cert)
@@ -184,7 +199,7 @@ class TKSSystemCertExpiryCheck(CertsPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         tks = self.instance.get_subsystem('tks')
 
@@ -192,7 +207,12 @@ class TKSSystemCertExpiryCheck(CertsPlugin):
             logger.info("No TKS configured, skipping TKS System Cert Expiry check")
             return
 
-        certs = tks.find_system_certs()
+        # Load all system certs with their expiry dates from NSSDB at once
+        certs, error = self.context.load_system_certs(self, tks)
+
+        if error:
+            yield error
+            return
 
         for cert in certs:
             yield check_cert_expiry_date(class_instance=self, cert=cert)
@@ -212,7 +232,7 @@ class TPSSystemCertExpiryCheck(CertsPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         tps = self.instance.get_subsystem('tps')
 
@@ -220,7 +240,12 @@ class TPSSystemCertExpiryCheck(CertsPlugin):
             logger.info("No TPS configured, skipping TPS System Cert Expiry check")
             return
 
-        certs = tps.find_system_certs()
+        # Load all system certs with their expiry dates from NSSDB at once
+        certs, error = self.context.load_system_certs(self, tps)
+
+        if error:
+            yield error
+            return
 
         for cert in certs:
             yield check_cert_expiry_date(class_instance=self, cert=cert)
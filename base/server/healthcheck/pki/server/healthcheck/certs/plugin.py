@@ -7,8 +7,8 @@
 #
 
 from ipahealthcheck.core.plugin import Plugin, Registry
-from pki.server.instance import PKIInstance
 
+from pki.server.healthcheck.core.context import get_context
 from pki.server.healthcheck.core.main import merge_dogtag_config
 
 import logging
@@ -23,7 +23,8 @@ class CertsPlugin(Plugin):
         # pylint: disable=redefined-outer-name
         super(CertsPlugin, self).__init__(registry)
 
-        self.instance = PKIInstance(self.config.instance_name)
+        self.context = get_context(self.config)
+        self.instance = self.context.instance
 
 
 class CertsRegistry(Registry):
@@ -6,7 +6,6 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 #
 import logging
-from contextlib import contextmanager
 
 from pki.server.healthcheck.certs.plugin import CertsPlugin, registry
 from ipahealthcheck.core.plugin import Result, duration
@@ -15,6 +14,48 @@ from ipahealthcheck.core import constants
 logger = logging.getLogger(__name__)
 
 
+def check_system_cert_trust(class_instance, subsystem, expected_trust):
+    """
+    Compare the NSS trust of the subsystem's system certs to the
+    expected values
+
+    :param class_instance: Reporting Class Instance
+    :type class_instance: object
+    :param subsystem: Subsystem
+    :type subsystem: PKISubsystem
+    :param expected_trust: Known good trust flags for each system cert
+    :type expected_trust: dict
+    :return: Result objects
+    :rtype: generator
+    """
+
+    # Load all system certs with their trust flags from NSSDB at once
+    certs, error = class_instance.context.load_system_certs(
+        class_instance, subsystem)
+
+    if error:
+        yield error
+        return
+
+    # Iterate on all system certificates to check with list of expected trust flags
+    for cert in certs:
+        cert_id = cert['id']
+        cert_trust = cert.get('trust_flags')
+
+        if cert_trust != expected_trust[cert_id]:
+            yield Result(class_instance, constants.ERROR,
+                         cert_id=cert_id,
+                         nickname=cert['nickname'],
+                         token=cert['token'],
+                         cert_trust=cert_trust,
+                         msg='Incorrect NSS trust for %s. Got %s expected %s'
+                             % (cert['nickname'], cert_trust, expected_trust[cert_id]))
+        else:
+            yield Result(class_instance, constants.SUCCESS,
+                         cert_id=cert_id,
+                         nickname=cert['nickname'])
+
+
 @registry
 class CASystemCertTrustFlagCheck(CertsPlugin):
     """
@@ -28,7 +69,7 @@ class CASystemCertTrustFlagCheck(CertsPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         # Make a list of known good trust flags for ALL system certs
         expected_trust = {
@@ -45,38 +86,8 @@ class CASystemCertTrustFlagCheck(CertsPlugin):
             logger.info("No CA configured, skipping CA System Cert Trust Flag check")
             return
 
-        certs = ca.find_system_certs()
-
-        # Iterate on CA's all system certificate to check with list of expected trust flags
-        for cert in certs:
-            cert_id = cert['id']
-
-            # Load cert trust from NSSDB
-            with nssdb_connection(self.instance) as nssdb:
-                try:
-                    cert_trust = nssdb.get_trust(
-                        nickname=cert['nickname'],
-                        token=cert['token']
-                    )
-                except Exception as e:  # pylint: disable=broad-except
-                    logger.debug('Unable to load cert from NSSDB: %s', str(e))
-                    yield Result(self, constants.ERROR,
-                                 key=cert_id,
-                                 nssdbDir=self.instance.nssdb_dir,
-                                 msg='Unable to load cert from NSSDB: %s' % str(e))
-                    continue
-            if cert_trust != expected_trust[cert_id]:
-                yield Result(self, constants.ERROR,
-                             cert_id=cert_id,
-                             nickname=cert['nickname'],
-                             token=cert['token'],
-                             cert_trust=cert_trust,
-                             msg='Incorrect NSS trust for %s. Got %s expected %s'
-                             % (cert['nickname'], cert_trust, expected_trust[cert_id]))
-            else:
-                yield Result(self, constants.SUCCESS,
-                             cert_id=cert_id,
-                             nickname=cert['nickname'])
+        for result in check_system_cert_trust(self, ca, expected_trust):
+            yield result
 
 
 @registry
@@ -92,7 +103,7 @@ class KRASystemCertTrustFlagCheck(CertsPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         # Make a list of known good trust flags for ALL system certs
         expected_trust = {
@@ -109,38 +120,8 @@ class KRASystemCertTrustFlagCheck(CertsPlugin):
             logger.info("No KRA configured, skipping KRA System Cert Trust Flag check")
             return
 
-        certs = kra.find_system_certs()
-
-        # Iterate on KRA's all system certificate to check with list of expected trust flags
-        for cert in certs:
-            cert_id = cert['id']
-
-            # Load cert trust from NSSDB
-            with nssdb_connection(self.instance) as nssdb:
-                try:
-                    cert_trust = nssdb.get_trust(
-                        nickname=cert['nickname'],
-                        token=cert['token']
-                    )
-                except Exception as e:  # pylint: disable=broad-except
-                    logger.debug('Unable to load cert from NSSDB: %s', str(e))
-                    yield Result(self, constants.ERROR,
-                                 key=cert_id,
-                                 nssdbDir=self.instance.nssdb_dir,
-                                 msg='Unable to load cert from NSSDB: %s' % str(e))
-                    continue
-            if cert_trust != expected_trust[cert_id]:
-                yield Result(self, constants.ERROR,
-                             cert_id=cert_id,
-                             nickname=cert['nickname'],
-                             token=cert['token'],
-                             cert_trust=cert_trust,
-                             msg='Incorrect NSS trust for %s. Got %s expected %s'
-                                 % (cert['nickname'], cert_trust, expected_trust[cert_id]))
-            else:
-                yield Result(self, constants.SUCCESS,
-                             cert_id=cert_id,
-                             nickname=cert['nickname'])
+        for result in check_system_cert_trust(self, kra, expected_trust):
+            yield result
 
 
 @registry
@@ -156,7 +137,7 @@ class OCSPSystemCertTrustFlagCheck(CertsPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         # Make a list of known good trust flags for ALL system certs
         expected_trust = {
@@ -172,38 +153,8 @@ class OCSPSystemCertTrustFlagCheck(CertsPlugin):
             logger.info("No OCSP configured, skipping OCSP System Cert Trust Flag check")
             return
 
-        certs = ocsp.find_system_certs()
-
-        # Iterate on OCSP's all system certificate to check with list of expected trust flags
-        for cert in certs:
-            cert_id = cert['id']
-
-            # Load cert trust from NSSDB
-            with nssdb_connection(self.instance) as nssdb:
-                try:
-                    cert_trust = nssdb.get_trust(
-                        nickname=cert['nickname'],
-                        token=cert['token']
-                    )
-                except Exception as e:  # pylint: disable=broad-except
-                    logger.debug('Unable to load cert from NSSDB: %s', str(e))
-                    yield Result(self, constants.ERROR,
-                                 key=cert_id,
-                                 nssdbDir=self.instance.nssdb_dir,
-                                 msg='Unable to load cert from NSSDB: %s' % str(e))
-                    continue
-            if cert_trust != expected_trust[cert_id]:
-                yield Result(self, constants.ERROR,
-                             cert_id=cert_id,
-                             nickname=cert['nickname'],
-                             token=cert['token'],
-                             cert_trust=cert_trust,
-                             msg='Incorrect NSS trust for %s. Got %s expected %s'
-                                 % (cert['nickname'], cert_trust, expected_trust[cert_id]))
-            else:
-                yield Result(self, constants.SUCCESS,
-                             cert_id=cert_id,
-                             nickname=cert['nickname'])
+        for result in check_system_cert_trust(self, ocsp, expected_trust):
+            yield result
 
 
 @registry
@@ -219,7 +170,7 @@ class TKSSystemCertTrustFlagCheck(CertsPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         # Make a list of known good trust flags for ALL system certs
         expected_trust = {
@@ -234,38 +185,8 @@ class TKSSystemCertTrustFlagCheck(CertsPlugin):
             logger.info("No TKS configured, skipping TKS System Cert Trust Flag check")
             return
 
-        certs = tks.find_system_certs()
-
-        # Iterate on TKS's all system certificate to check with list of expected trust flags
-        for cert in certs:
-            cert_id = cert['id']
-
-            # Load cert trust from NSSDB
-            with nssdb_connection(self.instance) as nssdb:
-                try:
-                    cert_trust = nssdb.get_trust(
-                        nickname=cert['nickname'],
-                        token=cert['token']
-                    )
-                except Exception as e:  # pylint: disable=broad-except
-                    logger.debug('Unable to load cert from NSSDB: %s', str(e))
-                    yield Result(self, constants.ERROR,
-                                 key=cert_id,
-                                 nssdbDir=self.instance.nssdb_dir,
-                                 msg='Unable to load cert from NSSDB: %s' % str(e))
-                    continue
-            if cert_trust != expected_trust[cert_id]:
-                yield Result(self, constants.ERROR,
-                             cert_id=cert_id,
-                             nickname=cert['nickname'],
-                             token=cert['token'],
-                             cert_trust=cert_trust,
-                             msg='Incorrect NSS trust for %s. Got %s expected %s'
-                                 % (cert['nickname'], cert_trust, expected_trust[cert_id]))
-            else:
-                yield Result(self, constants.SUCCESS,
-                             cert_id=cert_id,
-                             nickname=cert['nickname'])
+        for result in check_system_cert_trust(self, tks, expected_trust):
+            yield result
 
 
 @registry
@@ -281,7 +202,7 @@ class TPSSystemCertTrustFlagCheck(CertsPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         # Make a list of known good trust flags for ALL system certs
         expected_trust = {
@@ -296,45 +217,5 @@ class TPSSystemCertTrustFlagCheck(CertsPlugin):
             logger.info("No TPS configured, skipping TPS System Cert Trust Flag check")
             return
 
-        certs = tps.find_system_certs()
-
-        # Iterate on TPS's all system certificate to check with list of expected trust flags
-        for cert in certs:
-            cert_id = cert['id']
-
-            # Load cert trust from NSSDB
-            with nssdb_connection(self.instance) as nssdb:
-                try:
-                    cert_trust = nssdb.get_trust(
-                        nickname=cert['nickname'],
-                        token=cert['token']
-                    )
-                except Exception as e:  # pylint: disable=broad-except
-                    logger.debug('Unable to load cert from NSSDB: %s', str(e))
-                    yield Result(self, constants.ERROR,
-                                 key=cert_id,
-                                 nssdbDir=self.instance.nssdb_dir,
-                                 msg='Unable to load cert from NSSDB: %s' % str(e))
-                    continue
-            if cert_trust != expected_trust[cert_id]:
-                yield Result(self, constants.ERROR,
-                             cert_id=cert_id,
-                             nickname=cert['nickname'],
-                             token=cert['token'],
-                             cert_trust=cert_trust,
-                             msg='Incorrect NSS trust for %s. Got %s expected %s'
-                                 % (cert['nickname'], cert_trust, expected_trust[cert_id]))
-            else:
-                yield Result(self, constants.SUCCESS,
-                             cert_id=cert_id,
-                             nickname=cert['nickname'])
-
-
-@contextmanager
-def nssdb_connection(instance):
-    """Open a connection to nssdb containing System Certificates"""
-    nssdb = instance.open_nssdb()
-    try:
-        yield nssdb
-    finally:
-        nssdb.close()
+        for result in check_system_cert_trust(self, tps, expected_trust):
+            yield result
@@ -4,10 +4,10 @@
 #
 # SPDX-License-Identifier: GPL-2.0-or-later
 #
+import functools
 import logging
 
-from pki.server.healthcheck.clones.plugin import ClonesPlugin, registry
-from pki.client import PKIConnection
+from pki.server.healthcheck.clones.plugin import CloneProbe, ClonesPlugin, registry
 from pki.cert import CertClient
 from ipahealthcheck.core.plugin import Result, duration
 from ipahealthcheck.core import constants
@@ -20,119 +20,79 @@ class ClonesConnectivyAndDataCheck(ClonesPlugin):
     """
     Assure master and clones within a  pki instance are reachable
     """
-    def check_ca_clones(self):
-        for host in self.clone_cas:
-            cur_clone_msg = ' Host: ' + host.Hostname + ' Port: ' + host.SecurePort
-            # Reach out and get some certs, to serve as a data and connectivity check
-            try:
-                connection = PKIConnection(protocol='https',
-                                           hostname=host.Hostname,
-                                           port=host.SecurePort,
-                                           verify=False)
-
-                cert_client = CertClient(connection)
-                # get the first 3 in case we cant to make a sanity check of replicated data
-                certs = cert_client.list_certs(size=3)
-
-                if certs is not None and len(certs.cert_data_info_list) == 3:
-                    logger.info('Cert data successfully obtained from clone.')
-                else:
-                    raise BaseException('CA clone problem reading data.' + cur_clone_msg)
-            except BaseException as e:
-                logger.error("Internal server error %s", e)
-                raise BaseException('Internal error testing CA clone.' + cur_clone_msg)
-
-        return
+    def probe_ca_clone(self, host, timeout=None):
+        # Reach out and get some certs, to serve as a data and connectivity check
+        connection = self.get_connection(host.Hostname, host.SecurePort)
 
-    def check_kra_clones(self):
-        for host in self.clone_kras:
-            cur_clone_msg = ' Host: ' + host.Hostname + ' Port: ' + host.SecurePort
-            # Reach out and get some keys or requests , to serve as a data and connectivity check
-            try:
-                client_nick = self.security_domain.config.get('ca.connector.KRA.nickName')
-
-                output = self.contact_subsystem_using_pki(
-                    host.SecurePort, host.Hostname, client_nick,
-                    self.passwd, self.db_dir, 'kra-key-show', ['0x01'])
-
-                # check to see if we either got a key or a key not found exception
-                # of which either will imply a successful connection
-                if output is not None:
-                    key_found = output.find('Key ID:')
-                    key_not_found = output.find('KeyNotFoundException:')
-                    if key_found >= 0:
-                        logger.info('Key material found from kra clone.')
-
-                    if key_not_found >= 0:
-                        logger.info('key not found, possibly empty kra')
-
-                    if key_not_found == -1 and key_found == -1:
-                        logger.info('Failure to get key material from kra')
-                        raise BaseException('KRA clone problem detected ' + cur_clone_msg)
-                else:
-                    raise BaseException('No data obtained from KRA clone.' + cur_clone_msg)
-
-            except BaseException as e:
-                logger.error("Internal error testing KRA clone. %s", e)
-                raise BaseException('Internal error testing KRA clone.' + cur_clone_msg)
-
-        return
+        cert_client = CertClient(connection)
+        # get the first 3 in case we cant to make a sanity check of replicated data
+        certs = cert_client.list_certs(size=3, timeout=timeout)
 
-    def check_ocsp_clones(self):
-        for host in self.clone_ocsps:
-            cur_clone_msg = ' Host: ' + host.Hostname + ' Port: ' + host.SecurePort
-            # Reach out to the ocsp clones
-            try:
-                output = self.contact_subsystem_using_sslget(
-                    host.SecurePort, host.Hostname, None,
-                    self.passwd, self.db_dir, None, '/ocsp/admin/ocsp/getStatus')
-
-                good_status = output.find('<State>1</State>')
-                if good_status == -1:
-                    raise BaseException('OCSP clone problem detected.' + cur_clone_msg)
-                logger.info('good_status %s ', good_status)
-            except BaseException as e:
-                logger.error("Internal error testing OCSP clone.  %s", e)
-                raise BaseException('Internal error testing OCSP clone.' + cur_clone_msg)
+        if certs is not None and len(certs.cert_data_info_list) == 3:
+            logger.info('Cert data successfully obtained from clone.')
+        else:
+            raise Exception('CA clone problem reading data.')
+
+    def probe_kra_clone(self, host, timeout=None):
+        # Reach out and get some keys or requests , to serve as a data and connectivity check
+        client_nick = self.security_domain.config.get('ca.connector.KRA.nickName')
+
+        output = self.contact_subsystem_using_pki(
+            host.SecurePort, host.Hostname, client_nick,
+            self.passwd, self.db_dir, 'kra-key-show', ['0x01'],
+            timeout=timeout)
+
+        # check to see if we either got a key or a key not found exception
+        # of which either will imply a successful connection
+        if output is None:
+            raise Exception('No data obtained from KRA clone.')
+
+        key_found = output.find('Key ID:')
+        key_not_found = output.find('KeyNotFoundException:')
+        if key_found >= 0:
+            logger.info('Key material found from kra clone.')
+
+        if key_not_found >= 0:
+            logger.info('key not found, possibly empty kra')
+
+        if key_not_found == -1 and key_found == -1:
+            logger.info('Failure to get key material from kra')
+            raise Exception('KRA clone problem detected.')
+
+    def probe_status(self, subsystem, host, timeout=None):
+        # Reach out to the ocsp, tks or tps clones
+        output = self.contact_subsystem_using_sslget(
+            host.SecurePort, host.Hostname, None,
+            self.passwd, self.db_dir, None,
+            '/%s/admin/%s/getStatus' % (subsystem, subsystem),
+            timeout=timeout)
+
+        good_status = output.find('<State>1</State>')
+        if good_status == -1:
+            raise Exception('%s clone problem detected.' % subsystem.upper())
+        logger.info('good_status %s ', good_status)
+
+    def get_clone_probes(self):
+        """
+        Return the probes of all clones in the security domain.
+        """
+
+        probes = []
 
-        return
+        for host in self.clone_cas:
+            probes.append((CloneProbe('CA', host), self.probe_ca_clone))
 
-    def check_tks_clones(self):
-        for host in self.clone_tkss:
-            cur_clone_msg = ' Host: ' + host.Hostname + ' Port: ' + host.SecurePort
-            # Reach out to the tks clones
-            try:
-                output = self.contact_subsystem_using_sslget(
-                    host.SecurePort, host.Hostname, None,
-                    self.passwd, self.db_dir, None, '/tks/admin/tks/getStatus')
-
-                good_status = output.find('<State>1</State>')
-                if good_status == -1:
-                    raise BaseException('TKS clone problem detected.' + cur_clone_msg)
-                logger.info('good_status %s ', good_status)
-            except BaseException as e:
-                logger.error("Internal error testing TKS clone. %s", e)
-                raise BaseException('Internal error testing TKS clone.' + cur_clone_msg)
+        for host in self.clone_kras:
+            probes.append((CloneProbe('KRA', host), self.probe_kra_clone))
 
-        return
+        for name, hosts in [('ocsp', self.clone_ocsps),
+                            ('tks', self.clone_tkss),
+                            ('tps', self.clone_tpss)]:
+            func = functools.partial(self.probe_status, name)
+            for host in hosts:
+                probes.append((CloneProbe(name.upper(), host), func))
 
-    def check_tps_clones(self):
-        for host in self.clone_tpss:
-            cur_clone_msg = ' Host: ' + host.Hostname + ' Port: ' + host.SecurePort
-            # Reach out to the tps clones
-            try:
-                output = self.contact_subsystem_using_sslget(
-                    host.SecurePort, host.Hostname, None,
-                    self.passwd, self.db_dir, None, '/tps/admin/tps/getStatus')
-
-                good_status = output.find('<State>1</State>')
-                if good_status == -1:
-                    raise BaseException('TPS clone problem detected.' + cur_clone_msg)
-                logger.info('good_status  %s ', good_status)
-            except BaseException as e:
-                logger.error("Internal error testing TPS clone. %s", e)
-                raise BaseException('Internal error testing TPS clone.' + cur_clone_msg)
-        return
+        return probes
 
     @duration
     def check(self):
@@ -142,7 +102,7 @@ class ClonesConnectivyAndDataCheck(ClonesPlugin):
             yield Result(self, constants.CRITICAL,
                          status='Invalid PKI instance: %s' % self.instance.name)
             return
-        self.instance.load()
+        self.context.load()
 
         security_domain_ca, sechost, secport = self.get_security_domain_ca()
         logger.info('security_domain_ca: %s ', security_domain_ca)
@@ -157,51 +117,37 @@ class ClonesConnectivyAndDataCheck(ClonesPlugin):
             logger.info('About to check the subsystem clones')
 
             hard_msg = ' Clones tested successfully, or not present.'
-            try:
-                self.check_ca_clones()
-                yield Result(self, constants.SUCCESS,
-                             instance_name=self.instance.name,
-                             status='CA' + hard_msg)
 
-            except BaseException as e:
-                yield Result(self, constants.ERROR,
-                             status='ERROR:  %s' % self.instance.name + ' : ' + str(e))
+            # Probe all clones concurrently, so the check takes as long
+            # as the slowest clone instead of the sum of all clones.
+            probes = self.probe_clones(
+                self.get_clone_probes(),
+                timeout=self.context.check_timeout)
 
-            try:
-                self.check_kra_clones()
-                yield Result(self, constants.SUCCESS,
-                             instance_name=self.instance.name,
-                             status='KRA' + hard_msg)
-            except BaseException as e:
-                yield Result(self, constants.ERROR,
-                             status='ERROR:  %s' % self.instance.name + ' : ' + str(e))
+            for name in ['CA', 'KRA', 'OCSP', 'TKS', 'TPS']:
 
-            try:
-                self.check_ocsp_clones()
-                yield Result(self, constants.SUCCESS,
-                             instance_name=self.instance.name,
-                             status='OCSP' + hard_msg)
-            except BaseException as e:
-                yield Result(self, constants.ERROR,
-                             status='ERROR:  %s' % self.instance.name + ' : ' + str(e))
+                subsystem_probes = [p for p in probes if p.subsystem == name]
+                failed_probes = [p for p in subsystem_probes if p.error]
 
-            try:
-                self.check_tks_clones()
-                yield Result(self, constants.SUCCESS,
-                             instance_name=self.instance.name,
-                             status='TKS' + hard_msg)
-            except BaseException as e:
-                yield Result(self, constants.ERROR,
-                             status='ERROR:  %s' % self.instance.name + ' : ' + str(e))
+                for probe in failed_probes:
+                    yield Result(self, constants.ERROR,
+                                 status='ERROR:  %s' % self.instance.name + ' : ' +
+                                 'Internal error testing %s clone. Host: %s Port: %s : %s'
+                                 % (name, probe.host.Hostname, probe.host.SecurePort,
+                                    probe.error))
+
+                if failed_probes:
+                    continue
+
+                # Latency of each clone in milliseconds
+                latency = {}
+                for probe in subsystem_probes:
+                    latency[probe.address] = int(probe.latency * 1000)
 
-            try:
-                self.check_tps_clones()
                 yield Result(self, constants.SUCCESS,
                              instance_name=self.instance.name,
-                             status="TPS Clones tested successfully, or not present.")
-            except BaseException as e:
-                yield Result(self, constants.ERROR,
-                             status='ERROR:  %s' % self.instance.name + ' : ' + str(e))
+                             latency=latency,
+                             status=name + hard_msg)
         else:
             yield Result(self, constants.SUCCESS,
                          instance_name=self.instance.name,
@@ -7,14 +7,17 @@
 #
 
 from ipahealthcheck.core.plugin import Plugin, Registry
-from pki.server.instance import PKIInstance
 from pki.client import PKIConnection
 from pki.system import SecurityDomainClient
 
+from pki.server.healthcheck.core.context import get_context
 from pki.server.healthcheck.core.main import merge_dogtag_config
 
+import concurrent.futures
 import logging
 import subprocess
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +26,26 @@ logger = logging.getLogger(__name__)
 logging.getLogger().setLevel(logging.WARNING)
 
 
+class CloneProbe(object):
+    """
+    Outcome of probing a clone.
+    """
+
+    def __init__(self, subsystem, host):
+        self.subsystem = subsystem
+        self.host = host
+        self.latency = None
+        self.error = None
+
+    @property
+    def address(self):
+        return '%s:%s' % (self.host.Hostname, self.host.SecurePort)
+
+    def __repr__(self):
+        return 'CloneProbe(%s, %s, latency=%s, error=%s)' % (
+            self.subsystem, self.address, self.latency, self.error)
+
+
 class ClonesPlugin(Plugin):
     def __init__(self, registry):
         # pylint: disable=redefined-outer-name
@@ -44,11 +67,103 @@ class ClonesPlugin(Plugin):
         self.master_tkss = []
         self.clone_tkss = []
 
-        self.instance = PKIInstance(self.config.instance_name)
+        # Connections to the clones, reused across probes
+        self.connections = {}
+        self.connections_lock = threading.Lock()
+
+        self.context = get_context(self.config)
+        self.instance = self.context.instance
+
+    def get_connection(self, hostname, port):
+        """
+        Return the connection to a clone. The connection is kept so later
+        probes of the same clone reuse the pooled connection and resume
+        the TLS session instead of doing a full handshake. The connection
+        is shared, so the timeout has to be passed to each request.
+        """
+
+        key = (hostname, port)
+
+        with self.connections_lock:
+
+            connection = self.connections.get(key)
+
+            if not connection:
+                connection = PKIConnection(protocol='https',
+                                           hostname=hostname,
+                                           port=port,
+                                           verify=False,
+                                           session_resumption=True)
+                self.connections[key] = connection
+
+        return connection
+
+    def probe_clones(self, probes, timeout=None):
+        """
+        Probe the clones concurrently within a global deadline.
+
+        Each probe is a (CloneProbe, func) tuple where func(host, timeout)
+        raises an exception if the clone is not healthy. The timeout passed
+        to func is the time left before the deadline, so the total time is
+        bounded by the slowest clone or the deadline, whichever is shorter.
+
+        :param probes: Probes to run
+        :type probes: list
+        :param timeout: Global deadline in seconds
+        :type timeout: float
+        :return: List of CloneProbe objects with the latency in seconds
+                 or the error
+        :rtype: list
+        """
+
+        deadline = time.monotonic() + timeout if timeout else None
+
+        def run(probe, func):
+
+            probe_start = time.monotonic()
+            remaining = deadline - probe_start if deadline else None
+
+            if remaining is not None and remaining <= 0:
+                raise Exception('No time left to probe clone')
+
+            func(probe.host, remaining)
+
+            return time.monotonic() - probe_start
+
+        executor = self.context.get_executor()
+
+        futures = []
+        for probe, func in probes:
+            logger.info('Probing %s clone %s', probe.subsystem, probe.address)
+            futures.append((executor.submit(run, probe, func), probe))
+
+        done, _ = concurrent.futures.wait(
+            [future for future, _ in futures], timeout=timeout)
+
+        for future, probe in futures:
+
+            if future not in done:
+                future.cancel()
+                probe.error = 'No response within %s seconds' % timeout
+
+            elif future.exception():
+                probe.error = str(future.exception())
+
+            else:
+                probe.latency = future.result()
+
+            if probe.error:
+                logger.error('Unable to probe %s clone %s: %s',
+                             probe.subsystem, probe.address, probe.error)
+            else:
+                logger.info('Probed %s clone %s in %.3fs',
+                            probe.subsystem, probe.address, probe.latency)
+
+        return [probe for _, probe in futures]
 
     def contact_subsystem_using_pki(
             self, subport, subhost, subsystemnick,
-            token_pwd, db_path, cmd, exts=None):
+            token_pwd, db_path, cmd, exts=None, timeout=None):
         command = ["/usr/bin/pki",
                    "-p", str(subport),
                    "-h", subhost,
@@ -63,7 +178,8 @@ class ClonesPlugin(Plugin):
 
         output = None
         try:
-            output = subprocess.check_output(command, stderr=subprocess.STDOUT)
+            output = subprocess.check_output(command, stderr=subprocess.STDOUT,
+                                             timeout=timeout)
         except subprocess.CalledProcessError as e:
             output = e.output.decode('utf-8')
             return output
@@ -74,7 +190,7 @@ class ClonesPlugin(Plugin):
 
     def contact_subsystem_using_sslget(
             self, port, host, subsystemnick,
-            token_pwd, db_path, params, url):
+            token_pwd, db_path, params, url, timeout=None):
 
         command = ["/usr/bin/sslget"]
 
@@ -92,7 +208,8 @@ class ClonesPlugin(Plugin):
         logger.info(' command : %s ', command)
         output = None
         try:
-            output = subprocess.check_output(command, stderr=subprocess.STDOUT)
+            output = subprocess.check_output(command, stderr=subprocess.STDOUT,
+                                             timeout=timeout)
         except subprocess.CalledProcessError as e:
             output = e.output.decode('utf-8')
             return output
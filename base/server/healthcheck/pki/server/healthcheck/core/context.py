@@ -0,0 +1,166 @@
+#
+# Copyright Red Hat, Inc.
+#
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+
+import concurrent.futures
+import logging
+import threading
+
+from ipahealthcheck.core.plugin import Result
+from ipahealthcheck.core import constants
+
+from pki.server.instance import PKIInstance
+
+logger = logging.getLogger(__name__)
+
+# Contexts shared by all plugins within a healthcheck run
+contexts = {}
+contexts_lock = threading.Lock()
+
+
+class HealthCheckContext(object):
+    """
+    Per-run state shared by the PKI healthcheck plugins.
+
+    The instance, its subsystem configs and the system certs (with
+    the NSS database metadata) are loaded once and reused by all
+    checks. Slow operations run on a shared pool of worker threads
+    and each check waits for its results at most check_timeout
+    seconds.
+    """
+
+    def __init__(self, instance_name, max_workers=None, check_timeout=None):
+
+        self.instance = PKIInstance(instance_name)
+
+        self.max_workers = max_workers
+        self.check_timeout = check_timeout
+
+        self.lock = threading.RLock()
+        self.loaded = False
+
+        self.executor = None
+        self.tasks = {}
+
+    def load(self):
+        """
+        Load the instance and the subsystem configs once, then start
+        retrieving the system certs of all subsystems in the background.
+        """
+
+        with self.lock:
+
+            if self.loaded:
+                return
+
+            self.instance.load()
+
+            for subsystem in self.instance.get_subsystems():
+
+                # Load the config before the subsystem is shared with
+                # the worker threads.
+                subsystem.config  # pylint: disable=pointless-statement
+
+                self.submit(
+                    ('system_certs', subsystem.name),
+                    self.find_system_certs, subsystem)
+
+            self.loaded = True
+
+    def get_executor(self):
+
+        with self.lock:
+
+            if not self.executor:
+                self.executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers)
+
+            return self.executor
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        Start a shared task unless a task with the same key has already
+        been started, and return its future.
+        """
+
+        with self.lock:
+
+            future = self.tasks.get(key)
+
+            if not future:
+                logger.debug('Starting task: %s', key)
+                future = self.get_executor().submit(func, *args, **kwargs)
+                self.tasks[key] = future
+
+            return future
+
+    def get(self, key, func, *args, **kwargs):
+        """
+        Return the result of a shared task. Raises TimeoutError if the
+        result is not available within the check timeout.
+        """
+
+        future = self.submit(key, func, *args, **kwargs)
+        return future.result(timeout=self.check_timeout)
+
+    @staticmethod
+    def find_system_certs(subsystem):
+        return list(subsystem.find_system_certs())
+
+    def get_system_certs(self, subsystem):
+        """
+        Return the system certs of a subsystem with the cert info from
+        the NSS database.
+        """
+
+        return self.get(
+            ('system_certs', subsystem.name),
+            self.find_system_certs, subsystem)
+
+    def load_system_certs(self, plugin, subsystem, **kwargs):
+        """
+        Return the system certs of a subsystem for a check as a
+        (certs, None) tuple. If the certs cannot be loaded from the NSS
+        database (or not within the check timeout) returns (None, result)
+        where result is an ERROR result for the check with the additional
+        arguments provided in kwargs.
+        """
+
+        try:
+            return self.get_system_certs(subsystem), None
+
+        except Exception as e:  # pylint: disable=broad-except
+            logger.debug('Unable to load certs from NSSDB: %s', str(e))
+            return None, Result(plugin, constants.ERROR,
+                                nssdbDir=self.instance.nssdb_dir,
+                                msg='Unable to load certs from NSSDB: %s' % str(e),
+                                **kwargs)
+
+
+def get_context(config):
+    """
+    Return the context shared by the plugins checking the instance
+    specified in the config.
+    """
+
+    instance_name = config.instance_name
+
+    with contexts_lock:
+
+        context = contexts.get(instance_name)
+
+        if not context:
+
+            max_workers = getattr(config, 'max_workers', None)
+            check_timeout = getattr(config, 'check_timeout', None)
+
+            context = HealthCheckContext(
+                instance_name,
+                max_workers=int(max_workers) if max_workers else None,
+                check_timeout=float(check_timeout) if check_timeout else None)
+
+            contexts[instance_name] = context
+
+        return context
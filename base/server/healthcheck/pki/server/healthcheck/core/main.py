@@ -21,6 +21,8 @@ DOGTAG_CONFIG_FILE = "/etc/pki/healthcheck.conf"
 DOGTAG_CONFIG_SECTION = "dogtag"
 DOGTAG_DEFAULT_CONFIG = {
     'instance_name': 'pki-tomcat',
+    'max_workers': 8,
+    'check_timeout': 60,
 }
 
 dogtag_config_parsed = False
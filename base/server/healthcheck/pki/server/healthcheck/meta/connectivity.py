@@ -24,7 +24,7 @@ class DogtagCACertsConnectivityCheck(MetaPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         ca = self.instance.get_subsystem('ca')
 
@@ -96,7 +96,7 @@ class DogtagKRAConnectivityCheck(MetaPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         kra = self.instance.get_subsystem('kra')
 
@@ -175,7 +175,7 @@ class DogtagOCSPConnectivityCheck(MetaPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         ocsp = self.instance.get_subsystem('ocsp')
 
@@ -223,7 +223,7 @@ class DogtagTKSConnectivityCheck(MetaPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         tks = self.instance.get_subsystem('tks')
 
@@ -271,7 +271,7 @@ class DogtagTPSConnectivityCheck(MetaPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         tps = self.instance.get_subsystem('tps')
 
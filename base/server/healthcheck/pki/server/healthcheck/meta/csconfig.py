@@ -7,9 +7,12 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 #
 
+import base64
 import logging
 from contextlib import contextmanager
 
+from cryptography.hazmat.primitives import serialization
+
 from pki.server.healthcheck.meta.plugin import MetaPlugin, registry
 from ipahealthcheck.core.plugin import Result, duration
 from ipahealthcheck.core import constants
@@ -34,26 +37,47 @@ def compare_nssdb_with_cs(class_instance, subsystem, cert_tag):
     # Generate cert_id for logging purpose
     cert_id = '{}_{}'.format(subsystem.name, cert_tag)
 
-    # Load cert from CS
-    cert = subsystem.get_cert_info(cert_tag)
-    cert_cs = cert['data']
+    # Load the system certs from CS.cfg and NSSDB once per run
+    certs, error = class_instance.context.load_system_certs(
+        class_instance, subsystem, key=cert_id)
+
+    if error:
+        return error
+
+    cert = None
+    for system_cert in certs:
+        if system_cert['id'] == cert_tag:
+            cert = system_cert
+            break
 
-    # Load cert from NSSDB
-    with nssdb_connection(subsystem.instance) as nssdb:
-        try:
-            # Retrieve the nickname and token from CS.cfg and then load
-            # the corresponding cert from NSSDB
-            cert_nssdb = nssdb.get_cert(
-                nickname=cert['nickname'],
-                token=cert['token'],
-                output_format='base64'
-            )
-        except Exception as e:  # pylint: disable=broad-except
-            logger.debug('Unable to load cert from NSSDB: %s', str(e))
-            return Result(class_instance, constants.ERROR,
-                          key=cert_id,
-                          nssdbDir=subsystem.instance.nssdb_dir,
-                          msg='Unable to load cert from NSSDB: %s' % str(e))
+    if cert:
+        # Use the cert loaded from NSSDB with the system certs
+        cert_nssdb = None
+        if cert.get('object'):
+            cert_nssdb = base64.b64encode(cert['object'].public_bytes(
+                serialization.Encoding.DER)).decode()
+
+    else:
+        # Cert is not in the system cert list, load it separately
+        cert = subsystem.get_cert_info(cert_tag)
+
+        with nssdb_connection(subsystem.instance) as nssdb:
+            try:
+                # Retrieve the nickname and token from CS.cfg and then load
+                # the corresponding cert from NSSDB
+                cert_nssdb = nssdb.get_cert(
+                    nickname=cert['nickname'],
+                    token=cert['token'],
+                    output_format='base64'
+                )
+            except Exception as e:  # pylint: disable=broad-except
+                logger.debug('Unable to load cert from NSSDB: %s', str(e))
+                return Result(class_instance, constants.ERROR,
+                              key=cert_id,
+                              nssdbDir=subsystem.instance.nssdb_dir,
+                              msg='Unable to load cert from NSSDB: %s' % str(e))
+
+    cert_cs = cert['data']
 
     # Compare whether the certs match
     if cert_nssdb != cert_cs:
@@ -87,7 +111,7 @@ class CADogtagCertsConfigCheck(MetaPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         ca = self.instance.get_subsystem('ca')
 
@@ -124,7 +148,7 @@ class KRADogtagCertsConfigCheck(MetaPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         kra = self.instance.get_subsystem('kra')
 
@@ -161,7 +185,7 @@ class OCSPDogtagCertsConfigCheck(MetaPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         ocsp = self.instance.get_subsystem('ocsp')
 
@@ -197,7 +221,7 @@ class TKSDogtagCertsConfigCheck(MetaPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         tks = self.instance.get_subsystem('tks')
 
@@ -232,7 +256,7 @@ class TPSDogtagCertsConfigCheck(MetaPlugin):
                          msg='Invalid PKI instance: %s' % self.instance.name)
             return
 
-        self.instance.load()
+        self.context.load()
 
         tps = self.instance.get_subsystem('tps')
 
@@ -21,6 +21,7 @@
 
 from __future__ import absolute_import
 
+import atexit
 import datetime
 import functools
 import getpass
@@ -35,8 +36,10 @@ import requests
 import shutil
 import subprocess
 import tempfile
+import threading
 import time
 import socket
+import zipfile
 
 import ldap
 import ldap.filter
@@ -65,11 +68,144 @@ SCHEMA_FILES = [
     '/usr/share/pki/server/conf/schema.ldif'
 ]
 
+# Delays between readiness checks in seconds
+WAIT_INITIAL_DELAY = 0.01
+WAIT_MAX_DELAY = 1
+
+# Interval (in seconds) between checks of the watched files
+WAIT_WATCH_INTERVAL = 0.1
+
+AUDIT_EVENTS_FILE = 'audit-events.properties'
+
+# Maximum number of idle connections kept per database
+DATABASE_POOL_MAX_IDLE = 4
+
+# Idle time (in seconds) after which a pooled connection is checked
+DATABASE_POOL_CHECK_INTERVAL = 30
+
 logger = logging.getLogger(__name__)
 
+# Audit event catalogs by jar file
+audit_event_catalogs = {}
+
 parser = etree.XMLParser(remove_blank_text=True)
 
 
+def get_watch_stamp(paths):
+    """
+    Return a value that changes whenever one of the files changes, or a
+    file is added to or removed from one of the directories.
+    """
+
+    stamp = []
+
+    for path in paths:
+
+        try:
+            if os.path.isdir(path):
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        st = entry.stat()
+                        stamp.append((entry.path, st.st_size, st.st_mtime_ns))
+            else:
+                st = os.stat(path)
+                stamp.append((path, st.st_size, st.st_mtime_ns))
+
+        except FileNotFoundError:
+            pass
+
+    return sorted(stamp)
+
+
+def wait_for(condition, description, max_wait=None, timeout_message=None,
+             initial_delay=WAIT_INITIAL_DELAY, max_delay=WAIT_MAX_DELAY,
+             watch=None):
+    """
+    Wait until the condition returns True.
+
+    The condition is checked with an exponential backoff from
+    initial_delay up to max_delay seconds, so a server that is
+    already up is detected within milliseconds. Retryable connection
+    errors are treated as not ready.
+
+    If watch paths are specified (e.g. the server log directory), the
+    condition is checked again as soon as a watched file changes and
+    the backoff starts over. Since the logs keep growing while the
+    server starts, the backoff starts over at most once per max_delay.
+
+    :param condition: Function that returns True when the wait is over
+    :type condition: callable
+    :param description: Description of the event for the log messages
+      (e.g. 'PKI server to start')
+    :type description: str
+    :param max_wait: Maximum time to wait in seconds (default: no limit)
+    :type max_wait: float
+    :param timeout_message: Error message if the wait times out, with
+      a %d placeholder for max_wait
+    :type timeout_message: str
+    :param watch: Files or directories to watch
+    :type watch: list
+    """
+
+    start_time = time.monotonic()
+    delay = initial_delay
+    last_log_time = start_time
+    last_reset_time = None
+
+    while True:
+        try:
+            if condition():
+                return
+
+            error = None
+
+        except requests.exceptions.SSLError as e:
+            max_retry_error = e.args[0]
+            reason = getattr(max_retry_error, 'reason')
+            raise Exception('Server unreachable due to SSL error: %s' % reason) from e
+
+        except pki.RETRYABLE_EXCEPTIONS as e:
+            error = e
+
+        now = time.monotonic()
+        counter = now - start_time
+
+        if max_wait is not None and counter >= max_wait:
+            if not timeout_message:
+                timeout_message = 'Timeout waiting for %s after %%ds' % description
+            raise Exception(timeout_message % max_wait) from error
+
+        if now - last_log_time >= 1:
+            logger.info('Waiting for %s (%ds)', description, int(round(counter)))
+            last_log_time = now
+
+        delay = min(delay, max_wait - counter) if max_wait is not None else delay
+        deadline = now + delay
+        changed = False
+
+        if watch and (last_reset_time is None or now - last_reset_time >= max_delay):
+            # sleep in short steps and wake up as soon as a watched
+            # file changes
+            stamp = get_watch_stamp(watch)
+
+            while time.monotonic() < deadline:
+                time.sleep(min(WAIT_WATCH_INTERVAL, max(0, deadline - time.monotonic())))
+
+                if get_watch_stamp(watch) != stamp:
+                    logger.debug('Watched files changed')
+                    changed = True
+                    break
+
+        else:
+            time.sleep(delay)
+
+        if changed:
+            delay = initial_delay
+            last_reset_time = time.monotonic()
+        else:
+            delay = min(delay * 2, max_delay)
+
+
 class Tomcat(object):
 
     BASE_DIR = '/var/lib/tomcats'
@@ -328,7 +464,7 @@ grant codeBase "file:%s" {
 
         self.create_catalina_policy()
 
-    def start(self, wait=False, max_wait=60, timeout=None):
+    def start(self, wait=False, max_wait=60, timeout=None, watch_logs=False):
 
         cmd = ['systemctl', 'start', '%s.service' % self.service_name]
         logger.debug('Command: %s', ' '.join(cmd))
@@ -339,32 +475,19 @@ grant codeBase "file:%s" {
 
         logger.info('Waiting for PKI server to start')
 
-        start_time = datetime.datetime.today()
-        started = False
-        counter = 0
+        connection = self.create_local_connection()
 
-        while not started:
-            try:
-                time.sleep(1)
-                started = self.is_available(timeout=timeout)
+        watch = None
+        if watch_logs:
+            watch = [self.log_dir]
 
-            except requests.exceptions.SSLError as e:
-                max_retry_error = e.args[0]
-                reason = getattr(max_retry_error, 'reason')
-                raise Exception('Server unreachable due to SSL error: %s' % reason) from e
-
-            except pki.RETRYABLE_EXCEPTIONS as e:
-
-                stop_time = datetime.datetime.today()
-                counter = (stop_time - start_time).total_seconds()
-
-                if max_wait is not None and counter >= max_wait:
-                    raise Exception('Server did not start after %ds' %
-                                    max_wait) from e
-
-                logger.info(
-                    'Waiting for PKI server to start (%ds)',
-                    int(round(counter)))
+        wait_for(
+            functools.partial(self.is_available, timeout=timeout,
+                              connection=connection),
+            'PKI server to start',
+            max_wait=max_wait,
+            timeout_message='Server did not start after %ds',
+            watch=watch)
 
         logger.info('PKI server started')
 
@@ -782,7 +905,8 @@ grant codeBase "file:%s" {
             token=token,
             password=self.get_token_password(token),
             internal_password=self.get_token_password(),
-            passwords=self.passwords)
+            passwords=self.passwords,
+            cache=True)
 
     def get_webapps(self):
 
@@ -837,7 +961,11 @@ grant codeBase "file:%s" {
 
         return os.path.exists(context_xml)
 
-    def is_available(self, path='/', timeout=None):
+    def create_local_connection(self):
+        """
+        Create a connection to this server for status requests. The
+        connection can be reused for repeated requests.
+        """
 
         server_config = self.get_server_config()
 
@@ -845,13 +973,18 @@ grant codeBase "file:%s" {
         hostname = socket.getfqdn()
         port = server_config.get_secure_port()
 
-        connection = pki.client.PKIConnection(
+        return pki.client.PKIConnection(
             protocol=protocol,
             hostname=hostname,
             port=port,
             trust_env=False,
             verify=False)
 
+    def is_available(self, path='/', timeout=None, connection=None):
+
+        if not connection:
+            connection = self.create_local_connection()
+
         try:
             connection.get(path, timeout=timeout)
             return True
@@ -920,32 +1053,14 @@ grant codeBase "file:%s" {
         else:
             path = '/' + webapp_id
 
-        start_time = datetime.datetime.today()
-        started = False
-        counter = 0
+        connection = self.create_local_connection()
 
-        while not started:
-            try:
-                time.sleep(1)
-                started = self.is_available(path, timeout=timeout)
-
-            except requests.exceptions.SSLError as e:
-                max_retry_error = e.args[0]
-                reason = getattr(max_retry_error, 'reason')
-                raise Exception('Server unreachable due to SSL error: %s' % reason) from e
-
-            except pki.RETRYABLE_EXCEPTIONS as e:
-
-                stop_time = datetime.datetime.today()
-                counter = (stop_time - start_time).total_seconds()
-
-                if max_wait is not None and counter >= max_wait:
-                    raise Exception('Web application did not start after %ds' %
-                                    max_wait) from e
-
-                logger.info(
-                    'Waiting for web application to start (%ds)',
-                    int(round(counter)))
+        wait_for(
+            functools.partial(self.is_available, path, timeout=timeout,
+                              connection=connection),
+            'web application to start',
+            max_wait=max_wait,
+            timeout_message='Web application did not start after %ds')
 
         logger.info('Web application started')
 
@@ -1105,8 +1220,9 @@ grant codeBase "file:%s" {
                 # Directory exists but it is empty
                 continue
 
+            # defer parsing the subsystem config until it is used
             subsystem = pki.server.subsystem.PKISubsystemFactory.create(self, subsystem_name)
-            subsystem.load()
+            subsystem.load(lazy=True)
             self.subsystems[subsystem_name] = subsystem
 
     def get_subsystems(self):
@@ -1445,6 +1561,37 @@ grant codeBase "file:%s" {
         with open(filename) as f:
             lines = f.read().splitlines()
 
+        return PKIServer.parse_audit_events(lines)
+
+    @staticmethod
+    def load_audit_event_catalog(jar_file):
+        '''
+        This method loads the audit events from audit-events.properties
+        in the specified jar file. The catalog is cached until the jar
+        file is modified.
+        '''
+
+        st = os.stat(jar_file)
+        stamp = (st.st_mtime_ns, st.st_size)
+
+        cached = audit_event_catalogs.get(jar_file)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+        logger.info('Loading %s from %s', AUDIT_EVENTS_FILE, jar_file)
+
+        with zipfile.ZipFile(jar_file) as jar:
+            data = jar.read(AUDIT_EVENTS_FILE)
+
+        events = PKIServer.parse_audit_events(data.decode('utf-8').splitlines())
+        catalog = AuditEventCatalog(events)
+
+        audit_event_catalogs[jar_file] = (stamp, catalog)
+        return catalog
+
+    @staticmethod
+    def parse_audit_events(lines):
+
         events = {}
 
         event_pattern = re.compile(r'# Event: (\S+)')
@@ -1501,6 +1648,30 @@ grant codeBase "file:%s" {
         return events
 
 
+class AuditEventCatalog(object):
+    '''
+    Audit events loaded from audit-events.properties with the events
+    applicable to each subsystem precomputed.
+    '''
+
+    def __init__(self, events):
+
+        self.events = events
+        self.subsystem_events = {}
+
+        for name, event in events.items():
+            for subsystem in event['subsystems']:
+                self.subsystem_events.setdefault(subsystem, {})[name] = event
+
+    def get_events(self, subsystem):
+        '''
+        This method returns the audit events applicable to the specified
+        subsystem (e.g. 'ca') as a map of objects.
+        '''
+
+        return self.subsystem_events.get(subsystem.upper(), {})
+
+
 class ExternalCert(object):
 
     def __init__(self, nickname=None, token=None):
@@ -1726,18 +1897,33 @@ class PKIDatabaseConnection(object):
         self.client_cert_nickname = None
         self.nssdb_password = None
 
+        self.autobind = False
+
         self.temp_dir = None
         self.ldap = None
 
+        # pool that owns this connection
+        self.pool = None
+        self.in_use = False
+
+    def get_key(self):
+        '''
+        Return the parameters that identify an equivalent connection.
+        '''
+        return (self.url, self.nssdb_dir, self.bind_dn, self.bind_password,
+                self.client_cert_nickname, self.autobind)
+
     def set_security_database(self, nssdb_dir=None):
         self.nssdb_dir = nssdb_dir
 
     def set_credentials(self, bind_dn=None, bind_password=None,
-                        client_cert_nickname=None, nssdb_password=None):
+                        client_cert_nickname=None, nssdb_password=None,
+                        autobind=False):
         self.bind_dn = bind_dn
         self.bind_password = bind_password
         self.client_cert_nickname = client_cert_nickname
         self.nssdb_password = nssdb_password
+        self.autobind = autobind
 
     def open(self):
 
@@ -1759,13 +1945,147 @@ class PKIDatabaseConnection(object):
         if self.bind_dn and self.bind_password:
             self.ldap.simple_bind_s(self.bind_dn, self.bind_password)
 
+        elif self.autobind:
+            # authenticate as the owner of the process over LDAPI
+            self.ldap.sasl_external_bind_s()
+
+    def is_alive(self):
+        '''
+        Check whether the connection can still be used by reading
+        the root DSE without any attributes.
+        '''
+
+        try:
+            self.ldap.search_s('', ldap.SCOPE_BASE, '(objectClass=*)', ['1.1'])
+            return True
+
+        except ldap.LDAPError as e:
+            logger.debug('Database connection to %s is broken: %s', self.url, e)
+            return False
+
     def close(self):
 
+        if self.pool:
+            self.pool.release(self)
+            return
+
         if self.ldap:
             self.ldap.unbind_s()
+            self.ldap = None
 
         if self.temp_dir:
             shutil.rmtree(self.temp_dir)
+            self.temp_dir = None
+
+
+class PKIDatabaseConnectionPool(object):
+    '''
+    Per-process pool of open database connections. Equivalent
+    connections (see PKIDatabaseConnection.get_key()) are reused
+    so that the connect, TLS handshake, and bind are only done once.
+    A connection that has been idle for more than check_interval
+    seconds is checked before it is reused.
+    '''
+
+    def __init__(self, max_idle=DATABASE_POOL_MAX_IDLE,
+                 check_interval=DATABASE_POOL_CHECK_INTERVAL):
+
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+        # idle connections: key -> list of (connection, last used time)
+        self.connections = {}
+
+    def check_process(self):
+
+        if self.pid == os.getpid():
+            return
+
+        # connections inherited from the parent process share its
+        # sockets, so drop them without unbinding
+        self.pid = os.getpid()
+        self.connections = {}
+
+    def get_connection(self, connection):
+        '''
+        Return an open connection equivalent to the specified
+        (unopened) connection. The connection will be returned
+        to the pool when it is closed.
+        '''
+
+        key = connection.get_key()
+
+        while True:
+
+            with self.lock:
+                self.check_process()
+                idle = self.connections.get(key)
+                if not idle:
+                    break
+                pooled_connection, last_used = idle.pop()
+
+            if time.time() - last_used < self.check_interval \
+                    or pooled_connection.is_alive():
+                logger.debug('Reusing database connection to %s', connection.url)
+                pooled_connection.in_use = True
+                return pooled_connection
+
+            self.discard(pooled_connection)
+
+        logger.debug('Opening database connection to %s', connection.url)
+        connection.open()
+        connection.pool = self
+        connection.in_use = True
+
+        return connection
+
+    def release(self, connection):
+
+        if not connection.in_use:
+            return
+
+        connection.in_use = False
+
+        with self.lock:
+            self.check_process()
+            idle = self.connections.setdefault(connection.get_key(), [])
+
+            if len(idle) < self.max_idle:
+                idle.append((connection, time.time()))
+                return
+
+        self.discard(connection)
+
+    def discard(self, connection):
+
+        connection.pool = None
+
+        try:
+            connection.close()
+
+        except ldap.LDAPError as e:
+            logger.debug('Unable to close database connection: %s', e)
+
+    def clear(self):
+        '''
+        Close all idle connections.
+        '''
+
+        with self.lock:
+            self.check_process()
+            connections = self.connections
+            self.connections = {}
+
+        for idle in connections.values():
+            for connection, _ in idle:
+                self.discard(connection)
+
+
+database_connection_pool = PKIDatabaseConnectionPool()
+atexit.register(database_connection_pool.clear)
 
 
 class PKIServerException(pki.PKIException):
@@ -0,0 +1,811 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (C) 2021 Red Hat, Inc.
+# All rights reserved.
+#
+
+from __future__ import absolute_import
+
+import base64
+import binascii
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import utils
+
+# Signature records are logged as AUDIT_LOG_SIGNING events. Each signature
+# covers the previous signature record and all records up to the current
+# one, with every line terminated by 0x0a regardless of the line separator
+# used in the file.
+SIGNATURE_EVENT = b'AUDIT_LOG_SIGNING'
+SIGNATURE_PREFIX = b'sig: '
+LINE_SEPARATOR = b'\n'
+
+# audit record fields stored in the index
+AUDIT_FIELD = re.compile(
+    br'\[(AuditEvent|SubjectID|Outcome|CertSerialNum|SerialNum|Serial)=([^\]]*)\]')
+
+# timestamp of an audit record, e.g. [04/Mar/2021:14:22:03 EST]
+AUDIT_TIMESTAMP = re.compile(
+    br'\[(\d{2})/([A-Za-z]{3})/(\d{4}):(\d{2}):(\d{2}):(\d{2})(?: [^\]]*)?\]')
+
+MONTHS = {
+    b'Jan': 1, b'Feb': 2, b'Mar': 3, b'Apr': 4, b'May': 5, b'Jun': 6,
+    b'Jul': 7, b'Aug': 8, b'Sep': 9, b'Oct': 10, b'Nov': 11, b'Dec': 12
+}
+
+AUDIT_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    inode INTEGER PRIMARY KEY,
+    path TEXT,
+    offset INTEGER,
+    line INTEGER,
+    head TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    inode INTEGER,
+    line INTEGER,
+    offset INTEGER,
+    timestamp TEXT,
+    event TEXT,
+    subject_id TEXT,
+    outcome TEXT,
+    serial TEXT
+);
+CREATE INDEX IF NOT EXISTS events_event ON events (event, timestamp);
+CREATE INDEX IF NOT EXISTS events_subject_id ON events (subject_id, timestamp);
+CREATE INDEX IF NOT EXISTS events_serial ON events (serial);
+CREATE INDEX IF NOT EXISTS events_timestamp ON events (timestamp);
+"""
+
+# number of bytes used to recognize a file that has been indexed
+AUDIT_INDEX_HEAD_SIZE = 256
+
+logger = logging.getLogger(__name__)
+
+
+def read_lines(filename, start=0, end=None):
+    """
+    Generator of (offset, next offset, line) tuples for the lines of a file
+    between the start and end offsets. The line separators are removed.
+    """
+
+    with open(filename, 'rb') as f:
+
+        f.seek(start)
+        offset = start
+
+        for line in f:
+
+            if end is not None and offset >= end:
+                break
+
+            next_offset = offset + len(line)
+
+            if line.endswith(b'\r\n'):
+                line = line[:-2]
+            elif line.endswith(b'\n'):
+                line = line[:-1]
+
+            yield offset, next_offset, line
+
+            offset = next_offset
+
+
+def get_signature(line):
+    """
+    Return the signature in an AUDIT_LOG_SIGNING record,
+    or None if the record has no signature.
+    """
+
+    index = line.find(SIGNATURE_PREFIX)
+    if index < 0:
+        return None
+
+    return line[index + len(SIGNATURE_PREFIX):]
+
+
+def load_public_key(cert_data):
+    """
+    Return the public key of the audit signing certificate (DER).
+    The certificate validity is not checked so that old logs can
+    still be verified.
+    """
+
+    cert = x509.load_der_x509_certificate(cert_data, default_backend())
+
+    try:
+        key_usage = cert.extensions.get_extension_for_class(x509.KeyUsage)
+    except x509.ExtensionNotFound:
+        raise Exception('Missing signing certificate key usage')
+
+    if not key_usage.value.digital_signature:
+        raise Exception('Invalid signing certificate key usage')
+
+    public_key = cert.public_key()
+
+    if not isinstance(public_key, (rsa.RSAPublicKey, ec.EllipticCurvePublicKey)):
+        raise Exception('Unknown signing certificate key type: %s' %
+                        type(public_key).__name__)
+
+    return public_key
+
+
+def verify_signature(public_key, signature, digest):
+    """
+    Verify a base64-encoded SHA-256 signature against the digest.
+    """
+
+    try:
+        signature = base64.b64decode(signature)
+    except (binascii.Error, TypeError, ValueError):
+        return False
+
+    algorithm = utils.Prehashed(hashes.SHA256())
+
+    try:
+        if isinstance(public_key, rsa.RSAPublicKey):
+            public_key.verify(signature, digest, padding.PKCS1v15(), algorithm)
+        else:
+            public_key.verify(signature, digest, ec.ECDSA(algorithm))
+
+    except InvalidSignature:
+        return False
+
+    return True
+
+
+def verify_file(cert_data, filename, start=0, start_line=0):
+    """
+    Verify the signatures that are fully contained in a log file starting
+    from the given offset. The records before the first signature and after
+    the last signature are left to the caller since they are signed together
+    with the records in the adjacent files.
+
+    This function runs in a worker process, so it returns plain data.
+    """
+
+    public_key = load_public_key(cert_data)
+
+    result = {
+        'filename': filename,
+        'start': start,
+        'end': start,
+        'lines': 0,
+        'last_line': start_line,
+        'first': None,
+        'last': None,
+        'tail_lines': 0,
+        'signatures': []
+    }
+
+    digest = None
+    linenum = start_line
+
+    for offset, next_offset, line in read_lines(filename, start):
+
+        linenum += 1
+
+        if SIGNATURE_EVENT in line:
+
+            signature = get_signature(line)
+
+            if result['last'] is None:
+                result['first'] = {
+                    'offset': offset,
+                    'line': linenum,
+                    'signature': signature
+                }
+
+            else:
+                valid = signature is not None and \
+                    verify_signature(public_key, signature, digest.digest())
+
+                result['signatures'].append({
+                    'line': linenum,
+                    'start': result['last']['line'],
+                    'stop': linenum - 1,
+                    'missing': signature is None,
+                    'valid': valid
+                })
+
+            result['last'] = {
+                'offset': offset,
+                'line': linenum
+            }
+
+            digest = hashlib.sha256()
+            result['tail_lines'] = 0
+
+        if digest:
+            digest.update(line)
+            digest.update(LINE_SEPARATOR)
+            result['tail_lines'] += 1
+
+        result['end'] = next_offset
+
+    result['lines'] = linenum - start_line
+    result['last_line'] = linenum
+
+    return result
+
+
+class AuditVerifyResult(object):
+
+    def __init__(self):
+        self.good_signatures = 0
+        self.bad_signatures = 0
+
+        # list of (filename, line number, message)
+        self.failures = []
+
+        # last signature that has been verified
+        self.resume = None
+
+    def add_failure(self, filename, linenum, message):
+        logger.debug('%s:%s: %s', filename, linenum, message)
+        self.failures.append((filename, linenum, message))
+
+
+class AuditVerifier(object):
+    """
+    Verifier for a series of signed audit log files.
+
+    The signatures inside each file are verified in parallel in a pool
+    of worker processes, and the signatures spanning adjacent files are
+    verified as the results are collected in order.
+
+    If a checkpoint file is specified, the position of the last verified
+    signature is stored in the file. The next verification skips the files
+    that have been fully verified and have not changed since, and continues
+    from that position. Content before the checkpoint is trusted.
+    """
+
+    def __init__(self, cert_data, workers=None, checkpoint_file=None):
+        """
+        :param cert_data: audit signing certificate (DER)
+        :param workers: number of worker processes (default: CPU count)
+        :param checkpoint_file: file to store the verification progress
+        """
+
+        self.cert_data = cert_data
+        self.public_key = load_public_key(cert_data)
+        self.fingerprint = hashlib.sha256(cert_data).hexdigest()
+
+        self.workers = workers
+        self.checkpoint_file = checkpoint_file
+
+    @staticmethod
+    def get_stamp(filename):
+        st = os.stat(filename)
+        return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+    def load_checkpoint(self):
+
+        if not self.checkpoint_file or not os.path.exists(self.checkpoint_file):
+            return None
+
+        logger.info('Loading checkpoint: %s', self.checkpoint_file)
+
+        try:
+            with open(self.checkpoint_file) as f:
+                checkpoint = json.load(f)
+
+        except (IOError, OSError, ValueError) as e:
+            logger.warning('Unable to load checkpoint: %s', e)
+            return None
+
+        if checkpoint.get('cert') != self.fingerprint:
+            logger.info('Checkpoint is for a different signing certificate')
+            return None
+
+        return checkpoint
+
+    def store_checkpoint(self, log_files, resume):
+
+        index = log_files.index(resume['filename'])
+
+        checkpoint = {
+            'cert': self.fingerprint,
+            'files': dict(
+                (filename, self.get_stamp(filename))
+                for filename in log_files[:index]),
+            'resume': {
+                'inode': os.stat(resume['filename']).st_ino,
+                'offset': resume['offset'],
+                'line': resume['line']
+            }
+        }
+
+        logger.info('Storing checkpoint: %s', self.checkpoint_file)
+
+        tmp_file = self.checkpoint_file + '.tmp'
+
+        with open(tmp_file, 'w') as f:
+            json.dump(checkpoint, f)
+
+        os.rename(tmp_file, self.checkpoint_file)
+
+    def find_resume_point(self, log_files, checkpoint):
+        """
+        Return the index of the first file to verify and the checkpoint
+        position in that file. If the files have changed since the
+        checkpoint, all files will be verified.
+        """
+
+        stamps = checkpoint.get('files', {})
+
+        index = 0
+        while index < len(log_files):
+            filename = log_files[index]
+            if stamps.get(filename) != self.get_stamp(filename):
+                break
+            index += 1
+
+        resume = checkpoint.get('resume')
+
+        if resume and index < len(log_files):
+            filename = log_files[index]
+            st = os.stat(filename)
+            if st.st_ino == resume['inode'] and st.st_size >= resume['offset']:
+
+                # make sure the checkpoint still points to a signature
+                for _, _, line in read_lines(filename, resume['offset']):
+                    if SIGNATURE_EVENT in line:
+                        return index, resume
+                    break
+
+        logger.info('Checkpoint does not match log files')
+
+        return 0, None
+
+    def verify_segment(self, ranges):
+        """
+        Verify the digest of the records in a list of
+        (filename, start offset, end offset) ranges.
+        """
+
+        digest = hashlib.sha256()
+
+        for filename, start, end in ranges:
+            for _, _, line in read_lines(filename, start, end):
+                digest.update(line)
+                digest.update(LINE_SEPARATOR)
+
+        return digest.digest()
+
+    def verify(self, log_files):
+        """
+        Verify a list of log files ordered from the oldest to the newest.
+        Returns an AuditVerifyResult object.
+        """
+
+        result = AuditVerifyResult()
+
+        index = 0
+        resume = None
+
+        checkpoint = self.load_checkpoint()
+        if checkpoint:
+            index, resume = self.find_resume_point(log_files, checkpoint)
+
+        if resume:
+            logger.info('Resuming from %s:%d', log_files[index], resume['line'])
+
+        # records signed by the next signature: list of ranges, start
+        # (filename, line), stop (filename, line), and number of lines
+        pending = None
+        pending_start = None
+        pending_stop = None
+        pending_lines = 0
+
+        last_signature = None
+
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+
+        try:
+            futures = []
+
+            for i, filename in enumerate(log_files[index:]):
+
+                start = 0
+                start_line = 0
+
+                if i == 0 and resume:
+                    start = resume['offset']
+                    start_line = resume['line'] - 1
+
+                futures.append(executor.submit(
+                    verify_file, self.cert_data, filename, start, start_line))
+
+            for future in futures:
+
+                file_result = future.result()
+                filename = file_result['filename']
+
+                logger.info('Verifying %s', filename)
+
+                first = file_result['first']
+
+                if not first:
+                    # no signatures in this file
+                    if pending is not None and file_result['lines']:
+                        pending.append(
+                            (filename, file_result['start'], file_result['end']))
+                        pending_stop = (filename, file_result['last_line'])
+                        pending_lines += file_result['lines']
+                    continue
+
+                if pending is None:
+                    # Ignore the first signature of the series since it signs
+                    # data we don't have access to, or it has been verified
+                    # in the previous run.
+                    if not resume:
+                        logger.info('%s:%d: Ignoring first signature of log series',
+                                    filename, first['line'])
+
+                else:
+                    pending.append((filename, file_result['start'], first['offset']))
+                    if first['line'] > 1:
+                        pending_stop = (filename, first['line'] - 1)
+
+                    if first['signature'] is None:
+                        valid = False
+                        result.add_failure(filename, first['line'], 'INVALID SIGNATURE')
+
+                    else:
+                        digest = self.verify_segment(pending)
+                        valid = verify_signature(self.public_key, first['signature'], digest)
+
+                        if not valid:
+                            result.add_failure(
+                                filename, first['line'],
+                                'VERIFICATION FAILED: signature of %s:%d to %s:%d' % (
+                                    pending_start + pending_stop))
+
+                    if valid:
+                        result.good_signatures += 1
+                    else:
+                        result.bad_signatures += 1
+
+                for signature in file_result['signatures']:
+
+                    if signature['valid']:
+                        result.good_signatures += 1
+                        continue
+
+                    result.bad_signatures += 1
+
+                    if signature['missing']:
+                        message = 'INVALID SIGNATURE'
+                    else:
+                        message = 'VERIFICATION FAILED: signature of %s:%d to %s:%d' % (
+                            filename, signature['start'], filename, signature['stop'])
+
+                    result.add_failure(filename, signature['line'], message)
+
+                last = file_result['last']
+
+                pending = [(filename, last['offset'], file_result['end'])]
+                pending_start = (filename, last['line'])
+                pending_stop = (filename, file_result['last_line'])
+                pending_lines = file_result['tail_lines']
+
+                last_signature = dict(last, filename=filename)
+
+        finally:
+            executor.shutdown(wait=False)
+
+        # don't store the checkpoint if any signature is invalid
+        store_checkpoint = self.checkpoint_file and last_signature and \
+            not result.bad_signatures
+
+        # The first signed line is the previous signature,
+        # but anything more than that is unsigned data.
+        if pending_lines > 1:
+            result.add_failure(
+                pending_start[0], pending_start[1],
+                'ERROR: log entries after %s:%d are UNSIGNED' % pending_start)
+            result.bad_signatures += 1
+
+        result.resume = last_signature
+
+        if store_checkpoint:
+            self.store_checkpoint(log_files, last_signature)
+
+        return result
+
+
+def normalize_serial(serial):
+    """
+    Return the serial number in lowercase hex with 0x prefix. Serial
+    numbers with 0x prefix are parsed as hex, otherwise as decimal.
+    """
+
+    if serial is None:
+        return None
+
+    serial = serial.strip()
+
+    try:
+        if serial.lower().startswith('0x'):
+            value = int(serial[2:], 16)
+        else:
+            value = int(serial)
+
+    except ValueError:
+        return serial
+
+    return hex(value).rstrip('L')
+
+
+def parse_audit_record(line):
+    """
+    Return the indexed fields of an audit record as a tuple of
+    (timestamp, event, subject ID, outcome, serial number),
+    or None if the line is not an audit record.
+    """
+
+    fields = {}
+    for match in AUDIT_FIELD.finditer(line):
+        fields.setdefault(match.group(1), match.group(2).decode('utf-8', 'replace'))
+
+    event = fields.get(b'AuditEvent')
+    if not event:
+        return None
+
+    timestamp = None
+    match = AUDIT_TIMESTAMP.search(line)
+    if match and match.group(2) in MONTHS:
+        day, month, year, hour, minute, second = match.groups()
+        timestamp = '%s-%02d-%s %s:%s:%s' % (
+            year.decode(), MONTHS[month], day.decode(),
+            hour.decode(), minute.decode(), second.decode())
+
+    serial = fields.get(b'CertSerialNum') or fields.get(b'SerialNum') or \
+        fields.get(b'Serial')
+
+    return (
+        timestamp,
+        event,
+        fields.get(b'SubjectID'),
+        fields.get(b'Outcome'),
+        normalize_serial(serial))
+
+
+class AuditIndex(object):
+    """
+    Incremental index of audit records stored in an SQLite database.
+
+    The index keeps the position of the last indexed record in each log
+    file, so updating the index only parses the records appended since the
+    previous update. Files are tracked by inode so that rotated files do
+    not need to be indexed again.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.connection = None
+
+    def open(self):
+
+        logger.info('Opening audit index: %s', self.filename)
+
+        self.connection = sqlite3.connect(self.filename)
+        self.connection.executescript(AUDIT_INDEX_SCHEMA)
+
+    def close(self):
+
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def get_head(filename, size):
+
+        with open(filename, 'rb') as f:
+            return hashlib.sha256(f.read(size)).hexdigest()
+
+    def remove_file(self, inode):
+
+        self.connection.execute('DELETE FROM events WHERE inode = ?', (inode,))
+        self.connection.execute('DELETE FROM files WHERE inode = ?', (inode,))
+
+    def update(self, log_files):
+        """
+        Index new records in the log files.
+        """
+
+        cursor = self.connection.cursor()
+
+        indexed = {}
+        for inode, path, offset, line, head in cursor.execute(
+                'SELECT inode, path, offset, line, head FROM files'):
+            indexed[inode] = (path, offset, line, head)
+
+        inodes = set()
+
+        with self.connection:
+
+            for filename in log_files:
+
+                st = os.stat(filename)
+                inodes.add(st.st_ino)
+
+                offset = 0
+                linenum = 0
+
+                entry = indexed.get(st.st_ino)
+                if entry:
+                    path, offset, linenum, head = entry
+
+                    if offset > st.st_size or head != self.get_head(
+                            filename, min(offset, AUDIT_INDEX_HEAD_SIZE)):
+                        # inode has been reused by another file
+                        logger.info('Reindexing %s', filename)
+                        self.remove_file(st.st_ino)
+                        offset = 0
+                        linenum = 0
+
+                    elif offset == st.st_size and path == filename:
+                        # no new records
+                        continue
+
+                logger.info('Indexing %s from line %d', filename, linenum + 1)
+
+                offset, linenum = self.index_file(
+                    st.st_ino, filename, offset, linenum)
+
+                cursor.execute(
+                    'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                    (st.st_ino, filename, offset, linenum, self.get_head(
+                        filename, min(offset, AUDIT_INDEX_HEAD_SIZE))))
+
+            # remove files that no longer exist
+            for inode in set(indexed) - inodes:
+                logger.info('Removing %s from index', indexed[inode][0])
+                self.remove_file(inode)
+
+    def index_file(self, inode, filename, offset, linenum):
+        """
+        Index the complete records in a file starting from the given
+        position. Returns the position after the last indexed record.
+        """
+
+        events = []
+
+        with open(filename, 'rb') as f:
+
+            f.seek(offset)
+
+            for line in f:
+
+                if not line.endswith(b'\n'):
+                    # record is still being written
+                    break
+
+                linenum += 1
+
+                record = parse_audit_record(line)
+                if record:
+                    events.append((inode, linenum, offset) + record)
+
+                offset += len(line)
+
+                if len(events) >= 10000:
+                    self.connection.executemany(
+                        'INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)', events)
+                    del events[:]
+
+        self.connection.executemany(
+            'INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?)', events)
+
+        return offset, linenum
+
+    def search(self, event=None, subject_id=None, outcome=None, serial=None,
+               since=None, until=None, size=None):
+        """
+        Return the audit records matching all of the specified criteria
+        ordered by time. Timestamps are in YYYY-MM-DD [HH:MM:SS] format;
+        since is inclusive and until is exclusive.
+        """
+
+        conditions = []
+        params = []
+
+        if event:
+            conditions.append('events.event = ?')
+            params.append(event)
+
+        if subject_id:
+            conditions.append('events.subject_id = ?')
+            params.append(subject_id)
+
+        if outcome:
+            conditions.append('events.outcome = ? COLLATE NOCASE')
+            params.append(outcome)
+
+        if serial:
+            conditions.append('events.serial = ?')
+            params.append(normalize_serial(serial))
+
+        if since:
+            conditions.append('events.timestamp >= ?')
+            params.append(since)
+
+        if until:
+            conditions.append('events.timestamp < ?')
+            params.append(until)
+
+        query = 'SELECT files.path, events.line, events.offset, events.timestamp, ' \
+            'events.event, events.subject_id, events.outcome, events.serial ' \
+            'FROM events JOIN files ON events.inode = files.inode'
+
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+
+        query += ' ORDER BY events.timestamp, events.inode, events.line'
+
+        if size:
+            query += ' LIMIT ?'
+            params.append(size)
+
+        records = []
+
+        for path, linenum, offset, timestamp, event_type, subject, result, \
+                serial_number in self.connection.execute(query, params):
+
+            records.append({
+                'file': path,
+                'line': linenum,
+                'offset': offset,
+                'timestamp': timestamp,
+                'event': event_type,
+                'subject_id': subject,
+                'outcome': result,
+                'serial': serial_number
+            })
+
+        return records
+
+    @staticmethod
+    def read_record(record):
+        """
+        Return the text of an audit record found by search().
+        """
+
+        with open(record['file'], 'rb') as f:
+            f.seek(record['offset'])
+            line = f.readline()
+
+        return line.rstrip(b'\r\n').decode('utf-8', 'replace')
@@ -21,19 +21,41 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+import base64
+import datetime
 import getopt
 import logging
 import os
-import shutil
-import subprocess
 import sys
-import tempfile
+
+from cryptography.hazmat.primitives import serialization
 
 import pki.cli
+import pki.server.audit
 import pki.server.instance
 
 logger = logging.getLogger(__name__)
 
+# timestamp formats accepted by audit-event-search
+SEARCH_TIMESTAMP_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d']
+
+
+def parse_search_timestamp(value):
+    """
+    Convert a YYYY-MM-DD[ HH:MM:SS] timestamp into the format of the
+    timestamps in the audit index, or raise ValueError.
+    """
+
+    for timestamp_format in SEARCH_TIMESTAMP_FORMATS:
+        try:
+            timestamp = datetime.datetime.strptime(value, timestamp_format)
+        except ValueError:
+            continue
+
+        return timestamp.strftime(timestamp_format)
+
+    raise ValueError('Invalid timestamp: %s' % value)
+
 
 class AuditCLI(pki.cli.CLI):
 
@@ -49,6 +71,7 @@ class AuditCLI(pki.cli.CLI):
         self.add_module(AuditEventEnableCLI(self))
         self.add_module(AuditEventDisableCLI(self))
         self.add_module(AuditEventUpdateCLI(self))
+        self.add_module(AuditEventSearchCLI(self))
         self.add_module(AuditFileFindCLI(self))
         self.add_module(AuditFileVerifyCLI(self))
 
@@ -762,6 +785,128 @@ class AuditEventDisableCLI(pki.cli.CLI):
         AuditCLI.print_audit_event_config(event)
 
 
+class AuditEventSearchCLI(pki.cli.CLI):
+
+    def __init__(self, parent):
+        super(AuditEventSearchCLI, self).__init__(
+            'event-search', 'Search audit log records')
+
+        self.parent = parent
+
+    def print_help(self):
+        print('Usage: pki-server %s-audit-event-search [OPTIONS]' % self.parent.parent.name)
+        print()
+        print('  -i, --instance <instance ID>       Instance ID (default: pki-tomcat).')
+        print('      --event <name>                 Event name, e.g. CERT_REQUEST_PROCESSED.')
+        print('      --subject <ID>                 Subject ID.')
+        print('      --outcome <outcome>            Outcome: Success, Failure.')
+        print('      --serial <number>              Certificate serial number.')
+        print('      --since <timestamp>            Records logged since YYYY-MM-DD[ HH:MM:SS].')
+        print('      --until <timestamp>            Records logged before YYYY-MM-DD[ HH:MM:SS].')
+        print('      --size <number>                Maximum number of records.')
+        print('      --index <path>                 Audit index file.')
+        print('  -v, --verbose                      Run in verbose mode.')
+        print('      --debug                        Run in debug mode.')
+        print('      --help                         Show help message.')
+        print()
+
+    def execute(self, argv):
+
+        try:
+            opts, _ = getopt.gnu_getopt(argv, 'i:v', [
+                'instance=',
+                'event=', 'subject=', 'outcome=', 'serial=',
+                'since=', 'until=', 'size=', 'index=',
+                'verbose', 'debug', 'help'])
+
+        except getopt.GetoptError as e:
+            logger.error(e)
+            self.print_help()
+            sys.exit(1)
+
+        instance_name = 'pki-tomcat'
+        index_file = None
+        criteria = {}
+
+        for o, a in opts:
+            if o in ('-i', '--instance'):
+                instance_name = a
+
+            elif o == '--event':
+                criteria['event'] = a
+
+            elif o == '--subject':
+                criteria['subject_id'] = a
+
+            elif o == '--outcome':
+                criteria['outcome'] = a
+
+            elif o == '--serial':
+                criteria['serial'] = a
+
+            elif o in ('--since', '--until'):
+                try:
+                    criteria[o[2:]] = parse_search_timestamp(a)
+                except ValueError:
+                    logger.error('Invalid timestamp: %s (expected YYYY-MM-DD[ HH:MM:SS])', a)
+                    self.print_help()
+                    sys.exit(1)
+
+            elif o == '--size':
+                if not a.isdigit() or int(a) < 1:
+                    logger.error('Invalid size: %s', a)
+                    self.print_help()
+                    sys.exit(1)
+                criteria['size'] = int(a)
+
+            elif o == '--index':
+                index_file = a
+
+            elif o == '--debug':
+                logging.getLogger().setLevel(logging.DEBUG)
+
+            elif o in ('-v', '--verbose'):
+                logging.getLogger().setLevel(logging.INFO)
+
+            elif o == '--help':
+                self.print_help()
+                sys.exit()
+
+            else:
+                logger.error('Unknown option: %s', o)
+                self.print_help()
+                sys.exit(1)
+
+        instance = pki.server.instance.PKIServerFactory.create(instance_name)
+        if not instance.exists():
+            logger.error('Invalid instance %s.', instance_name)
+            sys.exit(1)
+
+        instance.load()
+
+        subsystem_name = self.parent.parent.name
+        subsystem = instance.get_subsystem(subsystem_name)
+        if not subsystem:
+            logger.error('No %s subsystem in instance %s.',
+                         subsystem_name.upper(), instance_name)
+            sys.exit(1)
+
+        records = subsystem.search_audit_events(index_file=index_file, **criteria)
+
+        self.print_message('%s entries matched' % len(records))
+
+        first = True
+        for record in records:
+            if first:
+                first = False
+            else:
+                print()
+
+            print('  File name: %s' % os.path.basename(record['file']))
+            print('  Line: %s' % record['line'])
+            print('  Record: %s' % pki.server.audit.AuditIndex.read_record(record))
+
+
 class AuditFileFindCLI(pki.cli.CLI):
 
     def __init__(self, parent):
@@ -852,6 +997,8 @@ class AuditFileVerifyCLI(pki.cli.CLI):
         print('Usage: pki-server %s-audit-file-verify [OPTIONS]' % self.parent.parent.name)
         print()
         print('  -i, --instance <instance ID>       Instance ID (default: pki-tomcat).')
+        print('      --workers <number>             Number of worker processes.')
+        print('      --checkpoint <path>            File to store verification progress.')
         print('  -v, --verbose                      Run in verbose mode.')
         print('      --debug                        Run in debug mode.')
         print('      --help                         Show help message.')
@@ -861,7 +1008,7 @@ class AuditFileVerifyCLI(pki.cli.CLI):
 
         try:
             opts, _ = getopt.gnu_getopt(argv, 'i:v', [
-                'instance=',
+                'instance=', 'workers=', 'checkpoint=',
                 'verbose', 'debug', 'help'])
 
         except getopt.GetoptError as e:
@@ -870,11 +1017,23 @@ class AuditFileVerifyCLI(pki.cli.CLI):
             sys.exit(1)
 
         instance_name = 'pki-tomcat'
+        workers = None
+        checkpoint_file = None
 
         for o, a in opts:
             if o in ('-i', '--instance'):
                 instance_name = a
 
+            elif o == '--workers':
+                if not a.isdigit() or int(a) < 1:
+                    logger.error('Invalid number of workers: %s', a)
+                    self.print_help()
+                    sys.exit(1)
+                workers = int(a)
+
+            elif o == '--checkpoint':
+                checkpoint_file = a
+
             elif o == '--debug':
                 logging.getLogger().setLevel(logging.DEBUG)
 
@@ -908,29 +1067,38 @@ class AuditFileVerifyCLI(pki.cli.CLI):
         log_files = subsystem.get_audit_log_files()
         signing_cert = subsystem.get_subsystem_cert('audit_signing')
 
-        tmpdir = tempfile.mkdtemp()
+        if signing_cert.get('object'):
+            cert_data = signing_cert['object'].public_bytes(
+                serialization.Encoding.DER)
 
-        try:
-            file_list = os.path.join(tmpdir, 'audit.txt')
+        elif signing_cert.get('data'):
+            cert_data = base64.b64decode(signing_cert['data'])
 
-            with open(file_list, 'w') as f:
-                for filename in log_files:
-                    f.write(os.path.join(log_dir, filename) + '\n')
+        else:
+            logger.error('Missing audit signing certificate')
+            sys.exit(1)
 
-            cmd = ['AuditVerify']
+        verifier = pki.server.audit.AuditVerifier(
+            cert_data,
+            workers=workers,
+            checkpoint_file=checkpoint_file)
 
-            if logger.isEnabledFor(logging.INFO):
-                cmd.append('-v')
+        log_files = [os.path.join(log_dir, filename) for filename in log_files]
+        result = verifier.verify(log_files)
 
-            cmd.extend([
-                '-d', instance.nssdb_dir,
-                '-n', signing_cert['nickname'],
-                '-a', file_list])
+        current_file = None
 
-            if logger.isEnabledFor(logging.INFO):
-                print('Command: %s' % ' '.join(cmd))
+        for filename, linenum, message in result.failures:
 
-            subprocess.call(cmd)
+            if filename != current_file:
+                print('======')
+                print('File: %s' % filename)
+                print('======')
+                current_file = filename
 
-        finally:
-            shutil.rmtree(tmpdir)
+            print('Line %d: %s' % (linenum, message))
+
+        print()
+        print('Verification process complete.')
+        print('Valid signatures: %d' % result.good_signatures)
+        print('Invalid signatures: %d' % result.bad_signatures)
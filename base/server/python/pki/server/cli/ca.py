@@ -344,6 +344,11 @@ class CACertRequestFindCLI(pki.cli.CLI):
         print('  -i, --instance <instance ID>       Instance ID (default: pki-tomcat).')
         print('      --cert                         Issued certificate.')
         print('      --cert-file                    File containing issued certificate.')
+        print('      --status <status>              Request status (e.g. complete, pending).')
+        print('      --type <type>                  Request type (e.g. enrollment, renewal).')
+        print('      --created-after <date>         Created on or after date (YYYY-MM-DD).')
+        print('      --created-before <date>        Created on or before date (YYYY-MM-DD).')
+        print('      --details                      Show request details.')
         print('  -v, --verbose                      Run in verbose mode.')
         print('      --debug                        Run in debug mode.')
         print('      --help                         Show help message.')
@@ -353,7 +358,8 @@ class CACertRequestFindCLI(pki.cli.CLI):
 
         try:
             opts, _ = getopt.gnu_getopt(argv, 'i:v', [
-                'instance=', 'cert=', 'cert-file=',
+                'instance=', 'cert=', 'cert-file=', 'status=', 'type=',
+                'created-after=', 'created-before=', 'details',
                 'verbose', 'debug', 'help'])
 
         except getopt.GetoptError as e:
@@ -363,6 +369,11 @@ class CACertRequestFindCLI(pki.cli.CLI):
 
         instance_name = 'pki-tomcat'
         cert = None
+        status = None
+        request_type = None
+        created_after = None
+        created_before = None
+        details = False
 
         for o, a in opts:
             if o in ('-i', '--instance'):
@@ -375,6 +386,21 @@ class CACertRequestFindCLI(pki.cli.CLI):
                 with io.open(a, 'rb') as f:
                     cert = f.read()
 
+            elif o == '--status':
+                status = a
+
+            elif o == '--type':
+                request_type = a
+
+            elif o == '--created-after':
+                created_after = a
+
+            elif o == '--created-before':
+                created_before = a
+
+            elif o == '--details':
+                details = True
+
             elif o in ('-v', '--verbose'):
                 logging.getLogger().setLevel(logging.INFO)
 
@@ -402,18 +428,26 @@ class CACertRequestFindCLI(pki.cli.CLI):
             logger.error('No CA subsystem in instance %s', instance_name)
             sys.exit(1)
 
-        results = subsystem.find_cert_requests(cert=cert)
+        results = subsystem.iterate_cert_requests(
+            cert=cert,
+            status=status,
+            request_type=request_type,
+            created_after=created_after,
+            created_before=created_before,
+            include_request=details)
 
-        self.print_message('%s entries matched' % len(results))
-
-        first = True
+        count = 0
         for request in results:
-            if first:
-                first = False
-            else:
+            if count:
                 print()
 
-            CACertRequestCLI.print_request(request)
+            CACertRequestCLI.print_request(request, details=details)
+            count += 1
+
+        if count:
+            print()
+
+        self.print_message('%s entries matched' % count)
 
 
 class CACertRequestShowCLI(pki.cli.CLI):
@@ -516,7 +550,7 @@ class CAClonePrepareCLI(pki.cli.CLI):
         print('Usage: pki-server ca-clone-prepare [OPTIONS]')
         print()
         print('  -i, --instance <instance ID>       Instance ID (default: pki-tomcat).')
-        print('      --pkcs12-file <path>           PKCS #12 file to store certificates and keys.')
+        print('      --pkcs12-file <path>           PKCS #12 file to create or overwrite.')
         print('      --pkcs12-password <password>   Password for the PKCS #12 file.')
         print('      --pkcs12-password-file <path>  File containing the PKCS #12 password.')
         print('      --no-key                       Do not include private key.')
@@ -605,16 +639,12 @@ class CAClonePrepareCLI(pki.cli.CLI):
             with open(pkcs12_password_file, 'wb') as f:
                 f.write(pkcs12_password)
 
-            subsystem.export_system_cert(
-                'subsystem', pkcs12_file, pkcs12_password_file, no_key=no_key)
-            subsystem.export_system_cert(
-                'signing', pkcs12_file, pkcs12_password_file, no_key=no_key, append=True)
-            subsystem.export_system_cert(
-                'ocsp_signing', pkcs12_file, pkcs12_password_file, no_key=no_key, append=True)
-            subsystem.export_system_cert(
-                'audit_signing', pkcs12_file, pkcs12_password_file, no_key=no_key, append=True)
-            instance.export_external_certs(
-                pkcs12_file, pkcs12_password_file, append=True)
+            subsystem.export_system_certs(
+                ['subsystem', 'signing', 'ocsp_signing', 'audit_signing'],
+                pkcs12_file,
+                pkcs12_password_file,
+                no_key=no_key,
+                external_certs=True)
 
         finally:
             shutil.rmtree(tmpdir)
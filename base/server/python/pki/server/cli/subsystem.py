@@ -670,7 +670,7 @@ class SubsystemCertFindCLI(pki.cli.CLI):
                          subsystem_name, instance_name)
             sys.exit(1)
 
-        certs = subsystem.get_cert_infos()
+        certs = list(subsystem.find_system_certs())
 
         self.print_message('%s entries matched' % len(certs))
 
@@ -681,11 +681,6 @@ class SubsystemCertFindCLI(pki.cli.CLI):
             else:
                 print()
 
-            if cert['nickname']:
-                cert_info = subsystem.get_nssdb_cert_info(cert['id'])
-                if cert_info:
-                    cert.update(cert_info)
-
             SubsystemCertCLI.print_subsystem_cert(cert, show_all)
 
 
@@ -76,7 +76,7 @@ class TPSClonePrepareCLI(pki.cli.CLI):
         print('Usage: pki-server tps-clone-prepare [OPTIONS]')
         print()
         print('  -i, --instance <instance ID>       Instance ID (default: pki-tomcat).')
-        print('      --pkcs12-file <path>           PKCS #12 file to store certificates and keys.')
+        print('      --pkcs12-file <path>           PKCS #12 file to create or overwrite.')
         print('      --pkcs12-password <password>   Password for the PKCS #12 file.')
         print('      --pkcs12-password-file <path>  File containing the PKCS #12 password.')
         print('      --no-key                       Do not include private key.')
@@ -163,12 +163,12 @@ class TPSClonePrepareCLI(pki.cli.CLI):
             with open(pkcs12_password_file, 'wb') as f:
                 f.write(pkcs12_password)
 
-            subsystem.export_system_cert(
-                'subsystem', pkcs12_file, pkcs12_password_file, no_key=no_key)
-            subsystem.export_system_cert(
-                'audit_signing', pkcs12_file, pkcs12_password_file, no_key=no_key, append=True)
-            instance.export_external_certs(
-                pkcs12_file, pkcs12_password_file, append=True)
+            subsystem.export_system_certs(
+                ['subsystem', 'audit_signing'],
+                pkcs12_file,
+                pkcs12_password_file,
+                no_key=no_key,
+                external_certs=True)
 
         finally:
             shutil.rmtree(tmpdir)
@@ -44,6 +44,7 @@ class UpgradeCLI(pki.cli.CLI):
         print('  --validate                     Validate upgrade status.')
         print()
         print('  -i, --instance <instance>      Upgrade a specific instance only.')
+        print('      --workers <number>         Number of instances to upgrade concurrently.')
         print()
         print('  -X                             Show advanced options.')
         print('  -v, --verbose                  Run in verbose mode.')
@@ -62,7 +63,7 @@ class UpgradeCLI(pki.cli.CLI):
 
         try:
             opts, args = getopt.gnu_getopt(argv, 'hi:s:t:vX', [
-                'instance=',
+                'instance=', 'workers=',
                 'status', 'revert', 'validate',
                 'remove-tracker', 'reset-tracker', 'set-tracker=',
                 'verbose', 'debug', 'help'])
@@ -73,6 +74,7 @@ class UpgradeCLI(pki.cli.CLI):
             sys.exit(1)
 
         instance_name = None
+        workers = 1
 
         status = False
         revert = False
@@ -87,6 +89,13 @@ class UpgradeCLI(pki.cli.CLI):
             if o in ('-i', '--instance'):
                 instance_name = a
 
+            elif o == '--workers':
+                if not a.isdigit() or int(a) < 1:
+                    logger.error('Invalid number of workers: %s', a)
+                    self.usage()
+                    sys.exit(1)
+                workers = int(a)
+
             elif o == '--status':
                 status = True
 
@@ -140,6 +149,20 @@ class UpgradeCLI(pki.cli.CLI):
         else:
             instances = pki.server.instance.PKIInstance.instances()
 
+        upgrade_only = not (status or revert or validate or remove_tracker or
+                            reset_tracker or tracker_version is not None)
+
+        if upgrade_only and workers > 1 and len(instances) > 1:
+
+            failures = pki.server.upgrade.upgrade_instances(instances, workers=workers)
+
+            if failures:
+                logger.error('Unable to upgrade %s',
+                             ', '.join(sorted(str(i) for i in failures)))
+                sys.exit(1)
+
+            return
+
         for instance in instances:
             self.upgrade(
                 instance,
@@ -699,7 +699,8 @@ class PkiScriptlet(pkiscriptlet.AbstractBasePkiScriptlet):
             instance.start(
                 wait=True,
                 max_wait=deployer.startup_timeout,
-                timeout=deployer.request_timeout)
+                timeout=deployer.request_timeout,
+                watch_logs=True)
 
         elif tomcat_instance_subsystems > 1:
 
@@ -710,7 +711,10 @@ class PkiScriptlet(pkiscriptlet.AbstractBasePkiScriptlet):
                 timeout=deployer.request_timeout)
 
         logger.info('Waiting for %s subsystem', subsystem.type)
-        subsystem.wait_for_startup(deployer.startup_timeout, deployer.request_timeout)
+        subsystem.wait_for_startup(
+            deployer.startup_timeout,
+            deployer.request_timeout,
+            watch_logs=True)
 
         # Optionally wait for debugger to attach (e. g. - 'eclipse'):
         if config.str2bool(deployer.mdict['pki_enable_java_debugger']):
@@ -839,7 +843,8 @@ class PkiScriptlet(pkiscriptlet.AbstractBasePkiScriptlet):
             instance.start(
                 wait=True,
                 max_wait=deployer.startup_timeout,
-                timeout=deployer.request_timeout)
+                timeout=deployer.request_timeout,
+                watch_logs=True)
 
         elif config.str2bool(deployer.mdict['pki_restart_configured_instance']):
 
@@ -850,7 +855,10 @@ class PkiScriptlet(pkiscriptlet.AbstractBasePkiScriptlet):
                 timeout=deployer.request_timeout)
 
         logger.info('Waiting for %s subsystem', subsystem.type)
-        subsystem.wait_for_startup(deployer.startup_timeout, deployer.request_timeout)
+        subsystem.wait_for_startup(
+            deployer.startup_timeout,
+            deployer.request_timeout,
+            watch_logs=True)
 
     def destroy(self, deployer):
         pass
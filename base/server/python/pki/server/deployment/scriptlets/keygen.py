@@ -20,8 +20,12 @@
 
 from __future__ import absolute_import
 import binascii
+import concurrent.futures
 import logging
+import os
 import re
+import threading
+import time
 
 import pki.encoder
 import pki.nssdb
@@ -72,6 +76,16 @@ class PkiScriptlet(pkiscriptlet.AbstractBasePkiScriptlet):
 
         return (key_type, key_size, curve, hash_alg)
 
+    def get_token(self, deployer, subsystem, tag):
+
+        cert = subsystem.get_subsystem_cert(tag)
+        token = pki.nssdb.normalize_token(cert['token'])
+
+        if not token:
+            token = deployer.mdict['pki_token_name']
+
+        return token
+
     def generate_csr(self,
                      deployer,
                      nssdb,
@@ -150,12 +164,7 @@ class PkiScriptlet(pkiscriptlet.AbstractBasePkiScriptlet):
             generic_exts = [generic_ext]
 
         tag = 'signing'
-        cert = subsystem.get_subsystem_cert(tag)
-        token = pki.nssdb.normalize_token(cert['token'])
-
-        if not token:
-            token = deployer.mdict['pki_token_name']
-
+        token = self.get_token(deployer, subsystem, tag)
         nssdb = subsystem.instance.open_nssdb(token)
 
         try:
@@ -194,12 +203,7 @@ class PkiScriptlet(pkiscriptlet.AbstractBasePkiScriptlet):
         }
 
         tag = 'sslserver'
-        cert = subsystem.get_subsystem_cert(tag)
-        token = pki.nssdb.normalize_token(cert['token'])
-
-        if not token:
-            token = deployer.mdict['pki_token_name']
-
+        token = self.get_token(deployer, subsystem, tag)
         nssdb = subsystem.instance.open_nssdb(token)
 
         try:
@@ -236,12 +240,7 @@ class PkiScriptlet(pkiscriptlet.AbstractBasePkiScriptlet):
         }
 
         tag = 'subsystem'
-        cert = subsystem.get_subsystem_cert(tag)
-        token = pki.nssdb.normalize_token(cert['token'])
-
-        if not token:
-            token = deployer.mdict['pki_token_name']
-
+        token = self.get_token(deployer, subsystem, tag)
         nssdb = subsystem.instance.open_nssdb(token)
 
         try:
@@ -271,12 +270,7 @@ class PkiScriptlet(pkiscriptlet.AbstractBasePkiScriptlet):
         }
 
         tag = 'audit_signing'
-        cert = subsystem.get_subsystem_cert(tag)
-        token = pki.nssdb.normalize_token(cert['token'])
-
-        if not token:
-            token = deployer.mdict['pki_token_name']
-
+        token = self.get_token(deployer, subsystem, tag)
         nssdb = subsystem.instance.open_nssdb(token)
 
         try:
@@ -333,12 +327,7 @@ class PkiScriptlet(pkiscriptlet.AbstractBasePkiScriptlet):
         }
 
         tag = 'storage'
-        cert = subsystem.get_subsystem_cert(tag)
-        token = pki.nssdb.normalize_token(cert['token'])
-
-        if not token:
-            token = deployer.mdict['pki_token_name']
-
+        token = self.get_token(deployer, subsystem, tag)
         nssdb = subsystem.instance.open_nssdb(token)
 
         try:
@@ -374,12 +363,7 @@ class PkiScriptlet(pkiscriptlet.AbstractBasePkiScriptlet):
         }
 
         tag = 'transport'
-        cert = subsystem.get_subsystem_cert(tag)
-        token = pki.nssdb.normalize_token(cert['token'])
-
-        if not token:
-            token = deployer.mdict['pki_token_name']
-
+        token = self.get_token(deployer, subsystem, tag)
         nssdb = subsystem.instance.open_nssdb(token)
 
         try:
@@ -403,12 +387,7 @@ class PkiScriptlet(pkiscriptlet.AbstractBasePkiScriptlet):
             return
 
         tag = 'signing'
-        cert = subsystem.get_subsystem_cert(tag)
-        token = pki.nssdb.normalize_token(cert['token'])
-
-        if not token:
-            token = deployer.mdict['pki_token_name']
-
+        token = self.get_token(deployer, subsystem, tag)
         nssdb = subsystem.instance.open_nssdb(token)
 
         try:
@@ -423,23 +402,149 @@ class PkiScriptlet(pkiscriptlet.AbstractBasePkiScriptlet):
         finally:
             nssdb.close()
 
-    def generate_system_cert_requests(self, deployer, subsystem):
+    def get_system_cert_tasks(self, deployer, subsystem):
+        """
+        Return a list of (tag, function) tuples to generate the system
+        CSRs of the subsystem that have a CSR path.
+        """
+
+        tasks = []
 
         if subsystem.name == 'ca':
-            self.generate_ca_signing_csr(deployer, subsystem)
+            tasks.append(('signing', self.generate_ca_signing_csr))
 
         if subsystem.name in ['kra', 'ocsp']:
-            self.generate_sslserver_csr(deployer, subsystem)
-            self.generate_subsystem_csr(deployer, subsystem)
-            self.generate_audit_signing_csr(deployer, subsystem)
-            self.generate_admin_csr(deployer, subsystem)
+            tasks.append(('sslserver', self.generate_sslserver_csr))
+            tasks.append(('subsystem', self.generate_subsystem_csr))
+            tasks.append(('audit_signing', self.generate_audit_signing_csr))
+            tasks.append(('admin', self.generate_admin_csr))
 
         if subsystem.name == 'kra':
-            self.generate_kra_storage_csr(deployer, subsystem)
-            self.generate_kra_transport_csr(deployer, subsystem)
+            tasks.append(('storage', self.generate_kra_storage_csr))
+            tasks.append(('transport', self.generate_kra_transport_csr))
 
         if subsystem.name == 'ocsp':
-            self.generate_ocsp_signing_csr(deployer, subsystem)
+            tasks.append(('signing', self.generate_ocsp_signing_csr))
+
+        return [(tag, func) for tag, func in tasks
+                if deployer.mdict.get(
+                    'pki_%s_csr_path' % deployer.get_cert_id(subsystem, tag))]
+
+    def get_keygen_slot(self, deployer, subsystem, tag):
+        """
+        Return the (database, token) tuple where the key of a system
+        cert will be generated.
+        """
+
+        if tag == 'admin':
+            return (deployer.mdict['pki_client_database_dir'], None)
+
+        token = self.get_token(deployer, subsystem, tag)
+        return (subsystem.instance.nssdb_dir, pki.nssdb.normalize_token(token))
+
+    def get_positive_int(self, deployer, name, default=1):
+        """
+        Return the value of a parameter that has to be a positive integer.
+        """
+
+        value = deployer.mdict.get(name)
+
+        if not value:
+            return default
+
+        try:
+            number = int(value)
+        except ValueError:
+            number = 0
+
+        if number < 1:
+            raise ValueError('Invalid %s: %s (must be a positive integer)' % (name, value))
+
+        return number
+
+    def get_keygen_limit(self, deployer, database, token):
+        """
+        Return the maximum number of keys that can be generated
+        concurrently in a database and token.
+        """
+
+        # HSMs might not support (or license) concurrent sessions
+        if token:
+            return self.get_positive_int(deployer, 'pki_hsm_keygen_concurrency')
+
+        # DBM databases do not support concurrent access
+        if os.path.exists(os.path.join(database, 'cert8.db')) or \
+                os.environ.get('NSS_DEFAULT_DB_TYPE') == 'dbm':
+            return 1
+
+        return None
+
+    def generate_system_cert_requests(self, deployer, subsystem):
+        """
+        Generate the keys and CSRs of the system certs concurrently.
+        Keys in the same database and token are generated at most
+        pki_hsm_keygen_concurrency (for HSMs) at a time.
+        """
+
+        tasks = self.get_system_cert_tasks(deployer, subsystem)
+        if not tasks:
+            return
+
+        max_workers = self.get_positive_int(deployer, 'pki_keygen_max_workers')
+
+        semaphores = {}
+        for tag, _ in tasks:
+            slot = self.get_keygen_slot(deployer, subsystem, tag)
+            if slot in semaphores:
+                continue
+
+            limit = self.get_keygen_limit(deployer, *slot)
+            semaphores[slot] = threading.BoundedSemaphore(limit) if limit else None
+
+        def generate(tag, func):
+
+            cert_id = deployer.get_cert_id(subsystem, tag)
+            semaphore = semaphores[self.get_keygen_slot(deployer, subsystem, tag)]
+
+            if semaphore:
+                semaphore.acquire()
+
+            try:
+                start = time.time()
+                func(deployer, subsystem)
+                elapsed = time.time() - start
+
+            finally:
+                if semaphore:
+                    semaphore.release()
+
+            logger.info('Generated %s key and CSR in %.3f s', cert_id, elapsed)
+
+        start = time.time()
+        errors = []
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers) as executor:
+
+            futures = {}
+            for tag, func in tasks:
+                futures[executor.submit(generate, tag, func)] = tag
+
+            for future in concurrent.futures.as_completed(futures):
+
+                try:
+                    future.result()
+
+                except Exception as e:  # pylint: disable=broad-except
+                    cert_id = deployer.get_cert_id(subsystem, futures[future])
+                    logger.error('Unable to generate %s CSR: %s', cert_id, e)
+                    errors.append(e)
+
+        if errors:
+            raise errors[0]
+
+        logger.info(
+            'Generated %d system CSRs in %.3f s', len(tasks), time.time() - start)
 
     def spawn(self, deployer):
 
@@ -21,6 +21,7 @@
 
 from __future__ import absolute_import
 
+import concurrent.futures
 import datetime
 import functools
 import json
@@ -28,24 +29,35 @@ import logging
 import os
 import pwd
 import re
-import requests
 import shutil
 import socket
 import subprocess
 import tempfile
-import time
 
+from cryptography.hazmat.primitives import serialization
 import ldap
+import ldap.controls
 import ldap.filter
+from six.moves.urllib.parse import quote, urlparse  # pylint: disable=F0401,E0611
 
 import pki
+import pki.cli.daemon
+import pki.client
 import pki.nssdb
 import pki.util
 import pki.server
+import pki.server.audit
 import pki.system
 
 SELFTEST_CRITICAL = 'critical'
 
+# Number of entries retrieved from the database per page
+SEARCH_PAGE_SIZE = 1000
+
+# Cert request attributes used by create_request_object()
+CERT_REQUEST_ATTRS = ['cn', 'requestType', 'requestState']
+CERT_REQUEST_DATA_ATTR = 'extdata-cert--005frequest'
+
 logger = logging.getLogger(__name__)
 
 
@@ -66,11 +78,14 @@ class PKISubsystem(object):
         self.cs_conf = os.path.join(self.conf_dir, 'CS.cfg')
         self.registry_conf = os.path.join(self.conf_dir, 'registry.cfg')
 
-        self.config = {}
-        self.registry = {}
+        self._config = {}
+        self._registry = {}
 
-        self.type = None  # e.g. CA, KRA
-        self.prefix = None  # e.g. ca, kra
+        self._type = None  # e.g. CA, KRA
+        self._prefix = None  # e.g. ca, kra
+
+        # whether the config files should be loaded on first access
+        self.load_pending = False
 
         self.default_doc_base = os.path.join(
             pki.SHARE_DIR,
@@ -116,31 +131,119 @@ class PKISubsystem(object):
                 self_type < other_type)
 
     def __hash__(self):
-        return hash((self.name, self.instance, self.type))
+        # do not use the type since it would trigger a pending load
+        return hash((self.name, self.instance))
+
+    def __load_pending(self):
+        if self.load_pending:
+            self.load()
+
+    @property
+    def config(self):
+        self.__load_pending()
+        return self._config
+
+    @config.setter
+    def config(self, value):
+        self._config = value
+
+    @property
+    def registry(self):
+        self.__load_pending()
+        return self._registry
+
+    @registry.setter
+    def registry(self, value):
+        self._registry = value
+
+    @property
+    def type(self):
+        self.__load_pending()
+        return self._type
+
+    @type.setter
+    def type(self, value):
+        self._type = value
+
+    @property
+    def prefix(self):
+        self.__load_pending()
+        return self._prefix
+
+    @prefix.setter
+    def prefix(self, value):
+        self._prefix = value
+
+    def load(self, lazy=False):
+        """
+        Load subsystem config and registry. If lazy is True, the files
+        will be loaded when the config, registry, type, or prefix is
+        accessed for the first time.
+        """
+
+        if lazy:
+            self.load_pending = True
+            return
 
-    def load(self):
+        # Access the attributes directly to avoid triggering a pending
+        # load. If the files cannot be loaded the load remains pending
+        # so it will be retried on the next access.
 
-        self.config.clear()
+        self._config.clear()
 
         if os.path.exists(self.cs_conf):
             logger.info('Loading subsystem config: %s', self.cs_conf)
-            pki.util.load_properties(self.cs_conf, self.config)
+            pki.util.load_properties(self.cs_conf, self._config)
 
-            self.type = self.config['cs.type']
-            self.prefix = self.type.lower()
+            self._type = self._config['cs.type']
+            self._prefix = self._type.lower()
 
-        self.registry.clear()
+        self._registry.clear()
 
         if os.path.exists(self.registry_conf):
             logger.info('Loading subsystem registry: %s', self.registry_conf)
-            pki.util.load_properties(self.registry_conf, self.registry)
+            pki.util.load_properties(self.registry_conf, self._registry)
+
+        self.load_pending = False
 
     def find_system_certs(self):
 
         cert_ids = self.config['%s.cert.list' % self.name].split(',')
 
-        for cert_id in cert_ids:
-            yield self.get_subsystem_cert(cert_id)
+        certs = []
+
+        # cert info from NSS database per token
+        nssdb_certs = {}
+
+        nssdb = self.instance.open_nssdb()
+        try:
+            for cert_id in cert_ids:
+
+                cert = self.get_cert_info(cert_id)
+                certs.append(cert)
+
+                # If nickname is empty, then cert cannot be queried for in NSSDB
+                if not cert['nickname']:
+                    continue
+
+                token = pki.nssdb.normalize_token(cert['token'])
+
+                if token not in nssdb_certs:
+                    nssdb_certs[token] = {}
+                    for cert_info in nssdb.list_certs(token=token):
+                        nickname = cert_info.pop('nickname')
+                        del cert_info['token']
+                        nssdb_certs[token][nickname] = cert_info
+
+                cert_info = nssdb_certs[token].get(cert['nickname'])
+                if cert_info:
+                    cert.update(cert_info)
+
+        finally:
+            nssdb.close()
+
+        for cert in certs:
+            yield cert
 
     def get_cert_infos(self):
 
@@ -280,6 +383,92 @@ class PKISubsystem(object):
         finally:
             shutil.rmtree(tmpdir)
 
+    def export_system_certs(
+            self,
+            cert_ids,
+            pkcs12_file,
+            pkcs12_password_file,
+            no_key=False,
+            append=False,
+            external_certs=False):
+        '''
+        Export the specified system certificates with their keys and
+        chains into a PKCS #12 file in a single pkcs12-export command,
+        so the file is written once regardless of the number of certs.
+        If external_certs is True, the external certificates of the
+        instance are exported as well (always with their keys).
+        Unless append is True, an existing file is overwritten.
+        '''
+
+        nicknames = []
+        for cert_id in cert_ids:
+            cert = self.get_subsystem_cert(cert_id)
+            nicknames.append(self.get_full_nickname(cert['nickname'], cert['token']))
+
+        external_nicknames = []
+        if external_certs:
+            for cert in self.instance.external_certs:
+                external_nicknames.append(
+                    self.get_full_nickname(cert.nickname, cert.token))
+
+        if not no_key:
+            nicknames.extend(external_nicknames)
+            external_nicknames = []
+
+        self.run_pkcs12_export(
+            nicknames, pkcs12_file, pkcs12_password_file,
+            no_key=no_key, append=append)
+
+        if external_nicknames:
+            self.run_pkcs12_export(
+                external_nicknames, pkcs12_file, pkcs12_password_file,
+                append=True)
+
+    @staticmethod
+    def get_full_nickname(nickname, token):
+
+        token = pki.nssdb.normalize_token(token)
+
+        if token:
+            return token + ':' + nickname
+
+        return nickname
+
+    def run_pkcs12_export(
+            self,
+            nicknames,
+            pkcs12_file,
+            pkcs12_password_file,
+            no_key=False,
+            append=False):
+
+        cmd = [
+            'pki',
+            '-d', self.instance.nssdb_dir,
+            '-f', self.instance.password_conf,
+            'pkcs12-export',
+            '--pkcs12-file', pkcs12_file,
+            '--pkcs12-password-file', pkcs12_password_file,
+        ]
+
+        if no_key:
+            cmd.append('--no-key')
+
+        if append:
+            cmd.append('--append')
+
+        if logger.isEnabledFor(logging.DEBUG):
+            cmd.append('--debug')
+
+        elif logger.isEnabledFor(logging.INFO):
+            cmd.append('-v')
+
+        cmd.extend(nicknames)
+
+        logger.debug('Command: %s', ' '.join(cmd))
+
+        subprocess.check_call(cmd)
+
     def export_cert_chain(
             self,
             pkcs12_file,
@@ -364,7 +553,11 @@ class PKISubsystem(object):
     def is_enabled(self):
         return self.instance.is_deployed(self.name)
 
-    def is_ready(self, secure_connection=True, timeout=None):
+    def create_status_connection(self, secure_connection=True):
+        """
+        Create a connection for subsystem status requests. The connection
+        can be reused for repeated requests.
+        """
 
         server_config = self.instance.get_server_config()
 
@@ -378,7 +571,7 @@ class PKISubsystem(object):
 
         # When waiting for a connection to come alive, don't bother verifying
         # the certificate at this stage.
-        connection = pki.client.PKIConnection(
+        return pki.client.PKIConnection(
             protocol=protocol,
             hostname=socket.getfqdn(),
             port=port,
@@ -386,6 +579,11 @@ class PKISubsystem(object):
             trust_env=False,
             verify=False)
 
+    def is_ready(self, secure_connection=True, timeout=None, connection=None):
+
+        if not connection:
+            connection = self.create_status_connection(secure_connection)
+
         client = pki.system.SystemStatusClient(connection, subsystem=self.name)
         response = client.get_status(timeout=timeout)
         json_response = json.loads(response)
@@ -394,7 +592,8 @@ class PKISubsystem(object):
         logger.info('Subsystem status: %s', status)
         return status == 'running'
 
-    def wait_for_startup(self, startup_timeout=None, request_timeout=None):
+    def wait_for_startup(self, startup_timeout=None, request_timeout=None,
+                         watch_logs=False):
         """
         Wait for subsystem to become ready to serve requests.
 
@@ -402,6 +601,9 @@ class PKISubsystem(object):
             be retried until this timeout is exceeded. Default: None.
         :param request_timeout: Connect/receive timeout for each individual
             status request. Default: None.
+        :param watch_logs: Check the status again as soon as the server or
+            subsystem logs change instead of waiting for the next retry.
+            Default: False.
         """
 
         fips_mode = pki.FIPS.is_enabled()
@@ -409,36 +611,26 @@ class PKISubsystem(object):
         # must use 'http' protocol when FIPS mode is enabled
         secure_connection = not fips_mode
 
-        start_time = datetime.datetime.today()
-        ready = False
-        counter = 0
-
-        while not ready:
-            try:
-                time.sleep(1)
-
-                ready = self.is_ready(
-                    secure_connection=secure_connection,
-                    timeout=request_timeout)
-
-            except requests.exceptions.SSLError as exc:
-                max_retry_error = exc.args[0]
-                reason = getattr(max_retry_error, 'reason')
-                raise Exception('Server unreachable due to SSL error: %s' % reason) from exc
-
-            except pki.RETRYABLE_EXCEPTIONS as exc:
+        # reuse the connection for all status requests
+        connection = self.create_status_connection(secure_connection)
 
-                stop_time = datetime.datetime.today()
-                counter = (stop_time - start_time).total_seconds()
-
-                if startup_timeout is not None and counter >= startup_timeout:
-                    raise Exception('%s subsystem did not start after %ds' %
-                                    (self.type, startup_timeout)) from exc
+        watch = None
+        if watch_logs:
+            watch = [
+                self.instance.log_dir,
+                os.path.join(self.instance.log_dir, self.name)
+            ]
 
-                logger.info(
-                    'Waiting for %s subsystem to start (%ds)',
-                    self.type,
-                    int(round(counter)))
+        pki.server.wait_for(
+            functools.partial(
+                self.is_ready,
+                secure_connection=secure_connection,
+                timeout=request_timeout,
+                connection=connection),
+            '%s subsystem to start' % self.type,
+            max_wait=startup_timeout,
+            timeout_message='%s subsystem did not start after %%ds' % self.type,
+            watch=watch)
 
     def enable(self, wait=False, max_wait=60, timeout=None):
 
@@ -472,14 +664,29 @@ class PKISubsystem(object):
         self.enable(wait=wait, max_wait=max_wait, timeout=timeout)
 
     def open_database(self, name='internaldb', bind_dn=None,
-                      bind_password=None):
+                      bind_password=None, pooled=True):
+        '''
+        Open a connection to the database configured in the <name>.*
+        parameters. If <name>.ldapconn.ldapiSocket is set, the database
+        will be accessed over LDAPI. Client certificate authentication is
+        not available over LDAPI, so SslClientAuth requires an explicit
+        <name>.ldapauth.ldapiAutobind=true to bind with SASL EXTERNAL as
+        the owner of the process (autobind) instead.
+
+        By default the connection is taken from the per-process pool
+        (see pki.server.database_connection_pool) and close() returns
+        it to the pool.
+        '''
 
-        # TODO: add LDAPI support
         hostname = self.config['%s.ldapconn.host' % name]
         port = self.config['%s.ldapconn.port' % name]
         secure = self.config['%s.ldapconn.secureConn' % name]
+        ldapi_socket = self.config.get('%s.ldapconn.ldapiSocket' % name)
+
+        if ldapi_socket:
+            url = 'ldapi://%s' % quote(ldapi_socket, safe='')
 
-        if secure == 'true':
+        elif secure == 'true':
             url = 'ldaps://%s:%s' % (hostname, port)
 
         elif secure == 'false':
@@ -495,12 +702,27 @@ class PKISubsystem(object):
         connection.set_security_database(self.instance.nssdb_dir)
 
         auth_type = self.config['%s.ldapauth.authtype' % name]
+        autobind = self.config.get('%s.ldapauth.ldapiAutobind' % name, 'false')
+
+        if autobind not in ['true', 'false']:
+            raise Exception(
+                'Invalid parameter value in %s.ldapauth.ldapiAutobind: %s' %
+                (name, autobind))
+
+        if autobind == 'true' and not ldapi_socket:
+            raise Exception(
+                '%s.ldapauth.ldapiAutobind requires %s.ldapconn.ldapiSocket' %
+                (name, name))
+
         if (bind_dn is not None and bind_password is not None):
             # connect using the provided credentials
             connection.set_credentials(
                 bind_dn=bind_dn,
                 bind_password=bind_password
             )
+        elif autobind == 'true':
+            connection.set_credentials(autobind=True)
+
         elif auth_type == 'BasicAuth':
             connection.set_credentials(
                 bind_dn=self.config['%s.ldapauth.bindDN' % name],
@@ -508,6 +730,12 @@ class PKISubsystem(object):
             )
 
         elif auth_type == 'SslClientAuth':
+            if ldapi_socket:
+                raise Exception(
+                    'SslClientAuth is not supported over LDAPI; set '
+                    '%s.ldapauth.ldapiAutobind=true to bind as the owner '
+                    'of the process' % name)
+
             connection.set_credentials(
                 client_cert_nickname=self.config[
                     '%s.ldapauth.clientCertNickname' % name],
@@ -521,6 +749,9 @@ class PKISubsystem(object):
                 'Invalid parameter value in %s.ldapauth.authtype: %s' %
                 (name, auth_type))
 
+        if pooled:
+            return pki.server.database_connection_pool.get_connection(connection)
+
         connection.open()
 
         return connection
@@ -655,47 +886,13 @@ class PKISubsystem(object):
         as a map of objects.
         '''
 
-        # get the list of audit events from audit-events.properties
+        cmsbundle_jar = \
+            '/usr/share/pki/%s/webapps/%s/WEB-INF/lib/pki-cmsbundle.jar' \
+            % (self.name, self.name)
 
-        tmpdir = tempfile.mkdtemp()
-
-        try:
-            # export audit-events.properties from cmsbundle.jar
-            cmsbundle_jar = \
-                '/usr/share/pki/%s/webapps/%s/WEB-INF/lib/pki-cmsbundle.jar' \
-                % (self.name, self.name)
+        catalog = pki.server.PKIServer.load_audit_event_catalog(cmsbundle_jar)
 
-            cmd = [
-                'jar',
-                'xf',
-                cmsbundle_jar,
-                'audit-events.properties'
-            ]
-
-            logger.debug('Command: %s', ' '.join(cmd))
-
-            subprocess.check_output(
-                cmd,
-                cwd=tmpdir,
-                stderr=subprocess.STDOUT)
-
-            # load audit-events.properties
-            filename = os.path.join(tmpdir, 'audit-events.properties')
-            events = pki.server.PKIServer.load_audit_events(filename)
-
-        finally:
-            shutil.rmtree(tmpdir)
-
-        # get audit events for this subsystem
-        results = {}
-        subsystem = self.name.upper()
-
-        for name, event in events.items():
-            if subsystem in event['subsystems']:
-                logger.info('Returning %s', name)
-                results[name] = event
-
-        return results
+        return dict(catalog.get_events(self.name))
 
     def get_enabled_audit_events(self):
 
@@ -724,6 +921,23 @@ class PKISubsystem(object):
 
         return files
 
+    def search_audit_events(self, index_file=None, **criteria):
+        """
+        Update the audit index with new records in the audit log files
+        and return the records matching the criteria (see AuditIndex.search()).
+        """
+
+        if not index_file:
+            index_file = os.path.join(self.base_dir, 'audit-index.db')
+
+        log_dir = self.get_audit_log_dir()
+        log_files = [os.path.join(log_dir, filename)
+                     for filename in self.get_audit_log_files()]
+
+        with pki.server.audit.AuditIndex(index_file) as index:
+            index.update(log_files)
+            return index.search(**criteria)
+
     def __repr__(self):
         return str(self.instance) + '/' + self.name
 
@@ -1072,62 +1286,116 @@ class PKISubsystem(object):
 
         self.run(cmd, as_current_user=as_current_user)
 
-    def request_range(self, master_url, range_type, session_id=None, install_token=None):
+    def create_master_connection(self, master_url):
+        '''
+        Create a connection to the master subsystem that trusts the CA
+        certificates trusted for SSL in the NSS database of the instance.
+        The caller is responsible for closing the connection.
+        '''
+
+        url = urlparse(master_url)
+
+        port = url.port
+        if not port:
+            port = 443 if url.scheme == 'https' else 80
 
         tmpdir = tempfile.mkdtemp()
         try:
-            if not install_token:
-                install_token = os.path.join(tmpdir, 'install-token')
-                with open(install_token, 'w') as f:
-                    f.write(session_id)
+            nssdb = self.instance.open_nssdb()
+            try:
+                certs = nssdb.list_certs()
+            finally:
+                nssdb.close()
+
+            ca_certs = [cert for cert in certs
+                        if 'C' in cert['trust_flags'].split(',')[0]]
+
+            if url.scheme == 'https' and not ca_certs:
+                raise Exception(
+                    'No CA certificates trusted for SSL in %s to connect to %s'
+                    % (self.instance.nssdb_dir, master_url))
+
+            ca_cert = os.path.join(tmpdir, 'ca.crt')
+            with open(ca_cert, 'wb') as f:
+                for cert in ca_certs:
+                    f.write(cert['object'].public_bytes(serialization.Encoding.PEM))
+
+            # the CA certificates are loaded when the connection is created
+            return pki.client.PKIConnection(
+                protocol=url.scheme,
+                hostname=url.hostname,
+                port=str(port),
+                trust_env=False,
+                cert_paths=ca_cert)
 
-            cmd = [
-                'pki',
-                '-d', self.instance.nssdb_dir,
-                '-f', self.instance.password_conf,
-                '-U', master_url,
-                '%s-range-request' % self.name,
-                range_type,
-                '--install-token', install_token,
-                '--output-format', 'json'
-            ]
+        finally:
+            shutil.rmtree(tmpdir)
 
-            if logger.isEnabledFor(logging.DEBUG):
-                cmd.append('--debug')
+    @staticmethod
+    def get_session_id(session_id=None, install_token=None):
 
-            elif logger.isEnabledFor(logging.INFO):
-                cmd.append('--verbose')
+        if install_token:
+            with open(install_token) as f:
+                return f.read()
 
-            logger.debug('Command: %s', ' '.join(cmd))
-            output = subprocess.check_output(cmd)
+        return session_id
 
-            return json.loads(output.decode())
+    def request_range(self, master_url, range_type, session_id=None, install_token=None,
+                      connection=None):
+
+        if connection:
+            client = pki.system.CloneSetupClient(connection, self.name)
+            return client.request_range(
+                range_type,
+                self.get_session_id(session_id, install_token))
 
+        connection = self.create_master_connection(master_url)
+        try:
+            return self.request_range(
+                master_url, range_type,
+                session_id=session_id,
+                install_token=install_token,
+                connection=connection)
         finally:
-            shutil.rmtree(tmpdir)
+            connection.close()
 
     def request_ranges(self, master_url, session_id=None, install_token=None):
+        '''
+        Request the request ID, serial number, and replica ID ranges from
+        the master concurrently using a single connection.
+        '''
 
-        logger.info('Requesting request ID range')
-
-        request_range = self.request_range(
-            master_url, 'request', session_id=session_id, install_token=install_token)
-        self.config['dbs.beginRequestNumber'] = request_range['begin']
-        self.config['dbs.endRequestNumber'] = request_range['end']
+        session_id = self.get_session_id(session_id, install_token)
 
-        logger.info('Requesting serial number range')
+        range_types = {
+            'request': 'Request',
+            'serialNo': 'Serial',
+            'replicaId': 'Replica'
+        }
 
-        serial_range = self.request_range(
-            master_url, 'serialNo', session_id=session_id, install_token=install_token)
-        self.config['dbs.beginSerialNumber'] = serial_range['begin']
-        self.config['dbs.endSerialNumber'] = serial_range['end']
+        logger.info('Requesting request ID, serial number, and replica ID ranges')
 
-        logger.info('Requesting replica ID range')
+        connection = self.create_master_connection(master_url)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=len(range_types)) as executor:
+
+                futures = {}
+                for range_type in range_types:
+                    futures[range_type] = executor.submit(
+                        self.request_range,
+                        master_url,
+                        range_type,
+                        session_id=session_id,
+                        connection=connection)
+
+                for range_type, name in range_types.items():
+                    number_range = futures[range_type].result()
+                    self.config['dbs.begin%sNumber' % name] = number_range['begin']
+                    self.config['dbs.end%sNumber' % name] = number_range['end']
 
-        replica_range = self.request_range(
-            master_url, 'replicaId', session_id=session_id, install_token=install_token)
-        self.config['dbs.beginReplicaNumber'] = replica_range['begin']
-        self.config['dbs.endReplicaNumber'] = replica_range['end']
+        finally:
+            connection.close()
 
         self.config['dbs.enableSerialManagement'] = 'true'
 
@@ -1145,40 +1413,25 @@ class PKISubsystem(object):
 
         self.run(cmd, as_current_user=as_current_user)
 
-    def retrieve_config(self, master_url, names, substores, session_id=None, install_token=None):
+    def retrieve_config(self, master_url, names, substores, session_id=None, install_token=None,
+                        connection=None):
 
-        tmpdir = tempfile.mkdtemp()
-        try:
-            if not install_token:
-                install_token = os.path.join(tmpdir, 'install-token')
-                with open(install_token, 'w') as f:
-                    f.write(session_id)
-
-            cmd = [
-                'pki',
-                '-d', self.instance.nssdb_dir,
-                '-f', self.instance.password_conf,
-                '-U', master_url,
-                '%s-config-export' % self.name,
-                '--names', ','.join(names),
-                '--substores', ','.join(substores),
-                '--install-token', install_token,
-                '--output-format', 'json'
-            ]
-
-            if logger.isEnabledFor(logging.DEBUG):
-                cmd.append('--debug')
-
-            elif logger.isEnabledFor(logging.INFO):
-                cmd.append('--verbose')
-
-            logger.debug('Command: %s', ' '.join(cmd))
-            output = subprocess.check_output(cmd)
-
-            return json.loads(output.decode())
+        if connection:
+            client = pki.system.CloneSetupClient(connection, self.name)
+            return client.get_config(
+                names,
+                substores,
+                self.get_session_id(session_id, install_token))
 
+        connection = self.create_master_connection(master_url)
+        try:
+            return self.retrieve_config(
+                master_url, names, substores,
+                session_id=session_id,
+                install_token=install_token,
+                connection=connection)
         finally:
-            shutil.rmtree(tmpdir)
+            connection.close()
 
     def update_config(self, master_url, session_id=None, install_token=None):
 
@@ -1631,7 +1884,25 @@ class PKISubsystem(object):
             non_empty_opts = [opt for opt in opts if opt]
             cmd.extend(non_empty_opts)
 
-        cmd.extend(['org.dogtagpki.server.cli.PKIServerCLI'])
+        main_class = 'org.dogtagpki.server.cli.PKIServerCLI'
+
+        if pki.cli.daemon.is_enabled():
+            logger.debug('Command: %s', ' '.join(args))
+
+            try:
+                return pki.cli.daemon.run(
+                    cmd,
+                    main_class,
+                    args,
+                    input=input,
+                    capture_output=capture_output,
+                    check=True)
+
+            except KeyboardInterrupt:
+                logger.debug('Server stopped')
+                return None
+
+        cmd.extend([main_class])
 
         cmd.extend(args)
 
@@ -1714,32 +1985,121 @@ class CASubsystem(PKISubsystem):
 
         self.run(cmd, as_current_user=as_current_user)
 
-    def find_cert_requests(self, cert=None):
+    @staticmethod
+    def format_request_date(value, end_of_day=False):
+        '''
+        Convert a datetime, a YYYY-MM-DD date, or a YYYYMMDDhhmmssZ
+        string into the format of the request date attributes. A date
+        is converted into the start (or the end) of that day.
+        '''
 
-        base_dn = self.config['internaldb.basedn']
+        if isinstance(value, datetime.datetime):
+            return value.strftime('%Y%m%d%H%M%SZ')
+
+        if re.match(r'^\d{4}-\d{2}-\d{2}$', value):
+            return value.replace('-', '') + ('235959Z' if end_of_day else '000000Z')
+
+        return value
+
+    def get_cert_request_filter(self, cert=None, status=None,
+                                request_type=None, created_after=None,
+                                created_before=None):
+
+        filters = []
 
         if cert:
             escaped_value = ldap.filter.escape_filter_chars(cert)
-            search_filter = '(extdata-req--005fissued--005fcert=%s)' % escaped_value
+            filters.append('(extdata-req--005fissued--005fcert=%s)' % escaped_value)
 
-        else:
-            search_filter = '(objectClass=*)'
+        if status:
+            filters.append(
+                '(requestState=%s)' % ldap.filter.escape_filter_chars(status))
+
+        if request_type:
+            filters.append(
+                '(requestType=%s)' % ldap.filter.escape_filter_chars(request_type))
+
+        if created_after:
+            filters.append('(dateOfCreate>=%s)' % ldap.filter.escape_filter_chars(
+                self.format_request_date(created_after)))
+
+        if created_before:
+            filters.append('(dateOfCreate<=%s)' % ldap.filter.escape_filter_chars(
+                self.format_request_date(created_before, end_of_day=True)))
+
+        if not filters:
+            return '(objectClass=*)'
+
+        if len(filters) == 1:
+            return filters[0]
+
+        return '(&%s)' % ''.join(filters)
+
+    def iterate_cert_requests(self, cert=None, status=None, request_type=None,
+                              created_after=None, created_before=None,
+                              include_request=True, page_size=SEARCH_PAGE_SIZE):
+        '''
+        This method returns a generator of cert requests that match the
+        specified filters. The requests are retrieved from the database
+        page by page using the paged results control (RFC 2696), and only
+        the attributes of the returned objects are retrieved. The CSR is
+        not retrieved if include_request is False.
+        '''
+
+        base_dn = self.config['internaldb.basedn']
+
+        search_filter = self.get_cert_request_filter(
+            cert=cert,
+            status=status,
+            request_type=request_type,
+            created_after=created_after,
+            created_before=created_before)
+
+        attrs = list(CERT_REQUEST_ATTRS)
+        if include_request:
+            attrs.append(CERT_REQUEST_DATA_ATTR)
+
+        control = ldap.controls.SimplePagedResultsControl(
+            True, size=page_size, cookie='')
 
         con = self.open_database()
 
-        entries = con.ldap.search_s(
-            'ou=ca,ou=requests,%s' % base_dn,
-            ldap.SCOPE_ONELEVEL,
-            search_filter,
-            None)
+        try:
+            while True:
+                msgid = con.ldap.search_ext(
+                    'ou=ca,ou=requests,%s' % base_dn,
+                    ldap.SCOPE_ONELEVEL,
+                    search_filter,
+                    attrs,
+                    serverctrls=[control])
 
-        con.close()
+                _, entries, _, response_controls = con.ldap.result3(msgid)
+
+                for entry in entries:
+                    yield self.create_request_object(entry)
+
+                cookie = None
+                for response_control in response_controls:
+                    if response_control.controlType == control.controlType:
+                        cookie = response_control.cookie
 
-        cert_requests = []
-        for entry in entries:
-            cert_requests.append(self.create_request_object(entry))
+                if not cookie:
+                    break
 
-        return cert_requests
+                control.cookie = cookie
+
+        finally:
+            con.close()
+
+    def find_cert_requests(self, cert=None, status=None, request_type=None,
+                           created_after=None, created_before=None):
+
+        return list(self.iterate_cert_requests(
+            cert=cert,
+            status=status,
+            request_type=request_type,
+            created_after=created_after,
+            created_before=created_before))
 
     def get_cert_requests(self, request_id):
 
@@ -1766,8 +2126,11 @@ class CASubsystem(PKISubsystem):
         request['id'] = attrs['cn'][0].decode('utf-8')
         request['type'] = attrs['requestType'][0].decode('utf-8')
         request['status'] = attrs['requestState'][0].decode('utf-8')
-        request['request'] = attrs['extdata-cert--005frequest'][0] \
-            .decode('utf-8')
+
+        if CERT_REQUEST_DATA_ATTR in attrs:
+            request['request'] = attrs[CERT_REQUEST_DATA_ATTR][0].decode('utf-8')
+        else:
+            request['request'] = None
 
         return request
 
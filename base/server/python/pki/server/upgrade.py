@@ -19,6 +19,7 @@
 #
 
 from __future__ import absolute_import
+import concurrent.futures
 import logging
 
 import pki
@@ -106,3 +107,37 @@ class PKIServerUpgrader(pki.upgrade.PKIUpgrader):
 
         logger.info('Upgrading %s instance', self.instance)
         scriptlet.upgrade_instance(self.instance)
+
+
+def upgrade_instances(instances, workers=None):
+    """
+    Upgrade multiple instances concurrently. Each instance is upgraded
+    with its own upgrader and tracker, so a failure in one instance does
+    not affect the others.
+
+    Returns a dict of instances that could not be upgraded and the errors.
+    """
+
+    failures = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+
+        futures = {}
+        for instance in instances:
+            logger.info('Upgrading PKI server %s', instance)
+            upgrader = PKIServerUpgrader(instance=instance)
+            futures[executor.submit(upgrader.upgrade)] = instance
+
+        for future in concurrent.futures.as_completed(futures):
+
+            instance = futures[future]
+
+            try:
+                future.result()
+                logger.info('Upgraded PKI server %s', instance)
+
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error('Unable to upgrade %s: %s', instance, e)
+                failures[instance] = e
+
+    return failures
@@ -51,6 +51,7 @@ import org.dogtagpki.util.logging.PKILogger;
 import org.dogtagpki.util.logging.PKILogger.Level;
 import org.mozilla.jss.CryptoManager;
 import org.mozilla.jss.NotInitializedException;
+import org.mozilla.jss.crypto.AlreadyInitializedException;
 import org.mozilla.jss.crypto.CryptoToken;
 import org.mozilla.jss.ssl.SSLCertificateApprovalCallback;
 import org.mozilla.jss.ssl.SSLSocket;
@@ -85,6 +86,9 @@ public class MainCLI extends CLI {
 
     NSSDatabase nssdb;
 
+    // NSS database initialized in this JVM (see CLIDaemon)
+    static String initializedDatabase;
+
     public Collection<Integer> rejectedCertStatuses = new HashSet<>();
     public Collection<Integer> ignoredCertStatuses = new HashSet<>();
 
@@ -504,7 +508,19 @@ public class MainCLI extends CLI {
         }
 
         logger.info("Initializing NSS");
-        CryptoManager.initialize(nssdb.getPath().toString());
+        String database = nssdb.getPath().toAbsolutePath().toString();
+        try {
+            CryptoManager.initialize(database);
+            initializedDatabase = database;
+
+        } catch (AlreadyInitializedException e) {
+            // NSS has been initialized by a previous command in the
+            // same JVM (see CLIDaemon), which must use the same database
+            if (!database.equals(initializedDatabase)) {
+                throw new Exception("NSS already initialized with " + initializedDatabase, e);
+            }
+            logger.info("NSS already initialized");
+        }
 
         CryptoManager manager;
         try {
@@ -0,0 +1,329 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (C) 2021 Red Hat, Inc.
+# All rights reserved.
+#
+
+import base64
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+import pki.server.audit
+import pki.server.cli.audit
+
+
+def create_signing_cert():
+
+    key = rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend())
+
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, u'Audit Signing')])
+    now = datetime.datetime.utcnow()
+
+    cert = x509.CertificateBuilder() \
+        .subject_name(name) \
+        .issuer_name(name) \
+        .public_key(key.public_key()) \
+        .serial_number(1) \
+        .not_valid_before(now) \
+        .not_valid_after(now + datetime.timedelta(days=1)) \
+        .add_extension(x509.KeyUsage(
+            digital_signature=True, content_commitment=True,
+            key_encipherment=False, data_encipherment=False,
+            key_agreement=False, key_cert_sign=False, crl_sign=False,
+            encipher_only=False, decipher_only=False), critical=True) \
+        .sign(key, hashes.SHA256(), default_backend())
+
+    return key, cert.public_bytes(serialization.Encoding.DER)
+
+
+class AuditLogWriter(object):
+
+    def __init__(self, key):
+        self.key = key
+        self.signed = []
+
+    def sign(self):
+        data = b''.join(line + b'\n' for line in self.signed)
+        signature = self.key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+        line = b'[AuditEvent=AUDIT_LOG_SIGNING] sig: ' + base64.b64encode(signature)
+        self.signed = [line]
+        return line
+
+    def write(self, filename, count, sign=True):
+        with open(filename, 'ab') as f:
+            for i in range(count):
+                line = ('[AuditEvent=TEST] %s record %d' % (filename, i)).encode()
+                self.signed.append(line)
+                f.write(line + b'\n')
+            if sign:
+                f.write(self.sign() + b'\n')
+
+
+class AuditVerifierTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        key, self.cert_data = create_signing_cert()
+
+        self.writer = AuditLogWriter(key)
+
+        # first signature signs data from a previous log series
+        self.log_files = [os.path.join(self.tmpdir, 'audit.%d' % i) for i in range(3)]
+        with open(self.log_files[0], 'wb') as f:
+            f.write(self.writer.sign() + b'\n')
+
+        self.writer.write(self.log_files[0], 5)
+        self.writer.write(self.log_files[0], 3)
+        self.writer.write(self.log_files[1], 4, sign=False)  # no signatures
+        self.writer.write(self.log_files[2], 2)
+        self.writer.write(self.log_files[2], 6)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_verify(self):
+
+        verifier = pki.server.audit.AuditVerifier(self.cert_data, workers=2)
+        result = verifier.verify(self.log_files)
+
+        self.assertEqual(result.good_signatures, 4)
+        self.assertEqual(result.bad_signatures, 0)
+        self.assertEqual(result.failures, [])
+
+    def test_tampered_record(self):
+
+        with open(self.log_files[1], 'rb') as f:
+            content = f.read()
+
+        with open(self.log_files[1], 'wb') as f:
+            f.write(content.replace(b'record 2', b'record X'))
+
+        verifier = pki.server.audit.AuditVerifier(self.cert_data, workers=2)
+        result = verifier.verify(self.log_files)
+
+        self.assertEqual(result.good_signatures, 3)
+        self.assertEqual(result.bad_signatures, 1)
+
+        filename, linenum, message = result.failures[0]
+        self.assertEqual(filename, self.log_files[2])
+        self.assertEqual(linenum, 3)
+        self.assertIn('%s:11 to %s:2' % (self.log_files[0], self.log_files[2]), message)
+
+    def test_unsigned_records(self):
+
+        self.writer.write(self.log_files[2], 2, sign=False)
+
+        verifier = pki.server.audit.AuditVerifier(self.cert_data, workers=2)
+        result = verifier.verify(self.log_files)
+
+        self.assertEqual(result.good_signatures, 4)
+        self.assertEqual(result.bad_signatures, 1)
+        self.assertIn('UNSIGNED', result.failures[0][2])
+
+    def test_checkpoint(self):
+
+        checkpoint_file = os.path.join(self.tmpdir, 'checkpoint.json')
+
+        verifier = pki.server.audit.AuditVerifier(
+            self.cert_data, workers=2, checkpoint_file=checkpoint_file)
+        result = verifier.verify(self.log_files)
+        self.assertEqual(result.good_signatures, 4)
+
+        # only new signatures are verified in the next run
+        self.writer.write(self.log_files[2], 3)
+
+        result = verifier.verify(self.log_files)
+        self.assertEqual(result.good_signatures, 1)
+        self.assertEqual(result.bad_signatures, 0)
+
+        # records after the checkpoint are still verified
+        self.writer.write(self.log_files[2], 3)
+
+        with open(self.log_files[2], 'rb') as f:
+            content = f.read()
+
+        index = content.rfind(b'record 1')
+        with open(self.log_files[2], 'wb') as f:
+            f.write(content[:index] + b'record Y' + content[index + 8:])
+
+        result = verifier.verify(self.log_files)
+        self.assertEqual(result.good_signatures, 0)
+        self.assertEqual(result.bad_signatures, 1)
+
+
+class AuditIndexTests(unittest.TestCase):
+
+    RECORDS = [
+        '0.main - [01/Feb/2021:10:00:00 EST] [14] [6] '
+        '[AuditEvent=CERT_REQUEST_PROCESSED][SubjectID=alice][Outcome=Failure]'
+        '[ReqID=1] certificate request processed',
+        '0.main - [15/Feb/2021:11:30:00 EST] [14] [6] '
+        '[AuditEvent=CERT_REQUEST_PROCESSED][SubjectID=alice][Outcome=Success]'
+        '[ReqID=2][CertSerialNum=31] certificate request processed',
+        '0.main - [01/Mar/2021:09:00:00 EST] [14] [6] '
+        '[AuditEvent=CERT_STATUS_CHANGE_REQUEST_PROCESSED][SubjectID=bob]'
+        '[Outcome=Success][CertSerialNum=0x1F] certificate status change '
+        'request processed',
+        '0.main - [02/Mar/2021:09:00:00 EST] [14] [6] '
+        '[AuditEvent=CERT_REQUEST_PROCESSED][SubjectID=alice][Outcome=Failure]'
+        '[ReqID=3] certificate request processed',
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.tmpdir, 'ca_audit')
+        self.index_file = os.path.join(self.tmpdir, 'audit-index.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, filename, records):
+        with open(filename, 'a') as f:
+            for record in records:
+                f.write(record + '\n')
+
+    def test_search(self):
+
+        self.write(self.log_file, self.RECORDS[:3])
+
+        with pki.server.audit.AuditIndex(self.index_file) as index:
+            index.update([self.log_file])
+
+            records = index.search(
+                event='CERT_REQUEST_PROCESSED', subject_id='alice',
+                outcome='failure', since='2021-02-01', until='2021-03-01')
+
+            self.assertEqual([r['line'] for r in records], [1])
+            self.assertEqual(records[0]['timestamp'], '2021-02-01 10:00:00')
+            self.assertEqual(index.read_record(records[0]), self.RECORDS[0])
+
+            # decimal and hex serial numbers are normalized
+            records = index.search(serial='0x1f')
+            self.assertEqual([r['line'] for r in records], [2, 3])
+
+    def test_incremental_update(self):
+
+        self.write(self.log_file, self.RECORDS[:2])
+
+        with pki.server.audit.AuditIndex(self.index_file) as index:
+            index.update([self.log_file])
+            self.assertEqual(len(index.search()), 2)
+
+        # rotate log file and write new records
+        rotated_file = os.path.join(self.tmpdir, 'ca_audit.20210301000000')
+        os.rename(self.log_file, rotated_file)
+        self.write(rotated_file, self.RECORDS[2:3])
+        self.write(self.log_file, self.RECORDS[3:])
+
+        with open(self.log_file, 'a') as f:
+            f.write('incomplete record')
+
+        with pki.server.audit.AuditIndex(self.index_file) as index:
+            with mock.patch.object(index, 'index_file',
+                                   wraps=index.index_file) as index_file:
+                index.update([rotated_file, self.log_file])
+
+            # only new records are parsed
+            self.assertEqual(
+                [c[0][2:] for c in index_file.call_args_list],
+                [(len(''.join(r + '\n' for r in self.RECORDS[:2])), 2), (0, 0)])
+
+            records = index.search()
+            self.assertEqual(
+                [(os.path.basename(r['file']), r['line']) for r in records],
+                [('ca_audit.20210301000000', 1),
+                 ('ca_audit.20210301000000', 2),
+                 ('ca_audit.20210301000000', 3),
+                 ('ca_audit', 1)])
+
+            # removed files are removed from the index
+            os.remove(rotated_file)
+            index.update([self.log_file])
+            self.assertEqual(len(index.search()), 1)
+
+
+class AuditFileVerifyCLITests(unittest.TestCase):
+
+    def test_invalid_workers(self):
+        cli = pki.server.cli.audit.AuditFileVerifyCLI(mock.Mock())
+
+        for value in ['0', '-1', 'four']:
+            with mock.patch('pki.server.instance.PKIServerFactory.create') as create, \
+                    mock.patch.object(cli, 'print_help') as print_help:
+
+                with self.assertRaises(SystemExit) as e:
+                    cli.execute(['--workers', value])
+
+            self.assertEqual(e.exception.code, 1)
+            print_help.assert_called_once_with()
+            create.assert_not_called()
+
+
+class AuditEventSearchCLITests(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = pki.server.cli.audit.AuditEventSearchCLI(mock.Mock())
+
+        patcher = mock.patch('pki.server.instance.PKIServerFactory.create')
+        self.create = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.subsystem = self.create.return_value.get_subsystem.return_value
+        self.subsystem.search_audit_events.return_value = []
+
+    def test_search(self):
+        with mock.patch.object(self.cli, 'print_message'):
+            self.cli.execute([
+                '--since', '2021-03-01',
+                '--until', '2021-3-2 8:00:00',
+                '--size', '10'])
+
+        # the timestamps are passed in the format of the index
+        self.subsystem.search_audit_events.assert_called_once_with(
+            index_file=None, since='2021-03-01', until='2021-03-02 08:00:00', size=10)
+
+    def test_invalid_options(self):
+        for option, value in [('--size', '0'), ('--size', 'ten'),
+                              ('--since', '03/01/2021'), ('--until', '2021-02-30'),
+                              ('--until', '2021-03-01T08:00:00')]:
+
+            with mock.patch.object(self.cli, 'print_help') as print_help:
+                with self.assertRaises(SystemExit) as e:
+                    self.cli.execute([option, value])
+
+            self.assertEqual(e.exception.code, 1)
+            print_help.assert_called_once_with()
+
+        self.create.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
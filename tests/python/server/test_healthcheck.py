@@ -0,0 +1,211 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (C) 2021 Red Hat, Inc.
+# All rights reserved.
+#
+
+import threading
+import time
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+try:
+    from ipahealthcheck.core import constants
+except ImportError:
+    raise unittest.SkipTest('ipahealthcheck is not installed')
+
+from pki.server.healthcheck.certs import trustflags
+from pki.server.healthcheck.clones import connectivity_and_data
+from pki.server.healthcheck.clones.plugin import CloneProbe
+from pki.server.healthcheck.core import context
+
+
+class HealthCheckContextTests(unittest.TestCase):
+
+    def setUp(self):
+        self.context = context.HealthCheckContext('pki-tomcat', check_timeout=5)
+        self.context.instance = mock.Mock(nssdb_dir='/var/lib/pki/pki-tomcat/alias')
+
+        self.ca = mock.Mock()
+        self.ca.name = 'ca'
+
+    def test_shared_task(self):
+        func = mock.Mock(return_value='result')
+
+        self.assertEqual(self.context.get('key', func, 'arg'), 'result')
+        self.assertEqual(self.context.get('key', func, 'arg'), 'result')
+
+        # the task runs once for all checks
+        func.assert_called_once_with('arg')
+
+    def test_load_system_certs(self):
+        self.ca.find_system_certs.return_value = iter([{'id': 'signing'}])
+        plugin = mock.Mock()
+
+        certs, error = self.context.load_system_certs(plugin, self.ca)
+        self.assertEqual(certs, [{'id': 'signing'}])
+        self.assertIsNone(error)
+
+        certs, error = self.context.load_system_certs(plugin, self.ca)
+        self.assertEqual(certs, [{'id': 'signing'}])
+        self.ca.find_system_certs.assert_called_once_with()
+
+    def test_load_system_certs_error(self):
+        self.ca.find_system_certs.side_effect = Exception('Bad password')
+        plugin = mock.Mock()
+
+        certs, error = self.context.load_system_certs(plugin, self.ca, key='ca_signing')
+        self.assertIsNone(certs)
+        self.assertEqual(error.result, constants.ERROR)
+        self.assertEqual(error.kw['key'], 'ca_signing')
+        self.assertEqual(error.kw['msg'], 'Unable to load certs from NSSDB: Bad password')
+
+    def test_load_system_certs_timeout(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        self.ca.find_system_certs.side_effect = lambda: release.wait(5) and []
+        self.context.check_timeout = 0.1
+
+        certs, error = self.context.load_system_certs(mock.Mock(), self.ca)
+        self.assertIsNone(certs)
+        self.assertEqual(error.result, constants.ERROR)
+
+
+class TrustFlagCheckTests(unittest.TestCase):
+
+    def setUp(self):
+        config = mock.Mock(
+            instance_name='pki-tomcat',
+            max_workers=None,
+            check_timeout=5)
+        registry = mock.Mock(config=config)
+
+        patcher = mock.patch.dict(context.contexts, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.plugin = trustflags.CASystemCertTrustFlagCheck(registry)
+        self.plugin.context.load = mock.Mock()
+
+        self.ca = mock.Mock()
+        self.ca.name = 'ca'
+
+        self.instance = mock.Mock(nssdb_dir='/var/lib/pki/pki-tomcat/alias')
+        self.instance.get_subsystem.return_value = self.ca
+
+        self.plugin.instance = self.instance
+        self.plugin.context.instance = self.instance
+
+    def test_check(self):
+        self.ca.find_system_certs.return_value = [
+            {'id': 'signing', 'nickname': 'ca_signing', 'token': None,
+             'trust_flags': 'CTu,Cu,Cu'},
+            {'id': 'sslserver', 'nickname': 'sslserver', 'token': None,
+             'trust_flags': 'CTu,u,u'},
+        ]
+
+        results = list(self.plugin.check())
+
+        self.assertEqual(
+            [result.result for result in results],
+            [constants.SUCCESS, constants.ERROR])
+        self.assertEqual(results[1].kw['cert_trust'], 'CTu,u,u')
+
+    def test_check_error(self):
+        self.ca.find_system_certs.side_effect = Exception('Bad password')
+
+        results = list(self.plugin.check())
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].result, constants.ERROR)
+        self.assertEqual(results[0].kw['nssdbDir'], self.instance.nssdb_dir)
+
+
+class CloneProbeTests(unittest.TestCase):
+
+    def setUp(self):
+        config = mock.Mock(
+            instance_name='pki-tomcat',
+            max_workers=4,
+            check_timeout=5)
+        registry = mock.Mock(config=config)
+
+        patcher = mock.patch.dict(context.contexts, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.plugin = connectivity_and_data.ClonesConnectivyAndDataCheck(registry)
+
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    @staticmethod
+    def create_probe(hostname):
+        host = mock.Mock(Hostname=hostname, SecurePort='8443')
+        return CloneProbe('CA', host)
+
+    def test_deadline(self):
+        timeouts = {}
+
+        def probe(host, timeout=None):
+            timeouts[host.Hostname] = timeout
+            if host.Hostname == 'slow.example.com':
+                self.release.wait(5)
+
+        start = time.monotonic()
+
+        probes = self.plugin.probe_clones([
+            (self.create_probe('fast.example.com'), probe),
+            (self.create_probe('slow.example.com'), probe),
+        ], timeout=0.2)
+
+        # the check does not wait for the slow clone beyond the deadline
+        self.assertLess(time.monotonic() - start, 1)
+
+        self.assertIsNone(probes[0].error)
+        self.assertIsNotNone(probes[0].latency)
+        self.assertEqual(probes[1].error, 'No response within 0.2 seconds')
+
+        # each clone gets the time left before the deadline
+        self.assertLessEqual(timeouts['fast.example.com'], 0.2)
+        self.assertLessEqual(timeouts['slow.example.com'], 0.2)
+
+    def test_connection_timeout(self):
+        connection = self.plugin.get_connection('clone.example.com', '8443')
+        self.assertIs(
+            self.plugin.get_connection('clone.example.com', '8443'), connection)
+
+        probe = self.create_probe('clone.example.com')
+
+        with mock.patch.object(connection, 'post') as post:
+            post.return_value.json.return_value = {
+                'entries': [{'id': '0x%x' % i, 'Link': {}} for i in range(3)],
+                'total': 3,
+                'Link': []
+            }
+            self.plugin.probe_ca_clone(probe.host, timeout=0.5)
+
+        # the timeout is passed to the request, not set on the
+        # shared connection
+        self.assertEqual(post.call_args[1]['timeout'], 0.5)
+        self.assertIsNone(connection.timeout)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (C) 2021 Red Hat, Inc.
+# All rights reserved.
+#
+
+import collections
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from pki.server.deployment.scriptlets import keygen
+
+KRA_TAGS = ['sslserver', 'subsystem', 'audit_signing', 'admin', 'storage', 'transport']
+
+
+class SystemCertRequestsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+        self.scriptlet = keygen.PkiScriptlet()
+
+        self.deployer = mock.Mock()
+        self.deployer.mdict = {
+            'pki_token_name': 'internal',
+            'pki_client_database_dir': os.path.join(self.tmpdir, 'client'),
+            'pki_keygen_max_workers': '4',
+            'pki_hsm_keygen_concurrency': '1',
+        }
+        self.deployer.get_cert_id.side_effect = lambda subsystem, tag: tag
+
+        for tag in KRA_TAGS:
+            self.deployer.mdict['pki_%s_csr_path' % tag] = tag + '.csr'
+
+        # tag -> token
+        self.tokens = {}
+
+        self.subsystem = mock.Mock()
+        self.subsystem.name = 'kra'
+        self.subsystem.instance.nssdb_dir = os.path.join(self.tmpdir, 'alias')
+        self.subsystem.get_subsystem_cert.side_effect = \
+            lambda tag: {'token': self.tokens.get(tag)}
+
+        patcher = mock.patch.dict(os.environ, {'NSS_DEFAULT_DB_TYPE': 'sql'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def mock_generators(self, func):
+        for tag in KRA_TAGS:
+            name = 'generate_%s_csr' % tag
+            if tag in ['storage', 'transport']:
+                name = 'generate_kra_%s_csr' % tag
+            generate = mock.Mock(side_effect=lambda deployer, subsystem, tag=tag: func(tag))
+            setattr(self.scriptlet, name, generate)
+
+    def test_get_system_cert_tasks(self):
+        del self.deployer.mdict['pki_admin_csr_path']
+        self.deployer.mdict['pki_storage_csr_path'] = ''
+
+        tasks = self.scriptlet.get_system_cert_tasks(self.deployer, self.subsystem)
+
+        # only the certs with a CSR path are generated
+        self.assertEqual(
+            [tag for tag, _ in tasks],
+            ['sslserver', 'subsystem', 'audit_signing', 'transport'])
+        self.assertEqual(tasks[0][1], self.scriptlet.generate_sslserver_csr)
+
+    def test_invalid_max_workers(self):
+        for value in ['0', '-1', 'four']:
+            self.deployer.mdict['pki_keygen_max_workers'] = value
+
+            with self.assertRaisesRegex(ValueError, 'pki_keygen_max_workers: %s' % value):
+                self.scriptlet.generate_system_cert_requests(self.deployer, self.subsystem)
+
+    def test_invalid_hsm_keygen_concurrency(self):
+        self.tokens['storage'] = 'HSM'
+        self.deployer.mdict['pki_hsm_keygen_concurrency'] = '0'
+        self.mock_generators(lambda tag: None)
+
+        with self.assertRaisesRegex(ValueError, 'pki_hsm_keygen_concurrency: 0'):
+            self.scriptlet.generate_system_cert_requests(self.deployer, self.subsystem)
+
+        # no key is generated with an invalid configuration
+        self.scriptlet.generate_sslserver_csr.assert_not_called()
+
+    def test_slot_semaphores(self):
+        self.tokens['storage'] = 'HSM'
+        self.tokens['transport'] = 'HSM'
+
+        lock = threading.Lock()
+        running = collections.Counter()
+        max_running = collections.Counter()
+
+        def generate(tag):
+            slot = self.tokens.get(tag, 'internal')
+            with lock:
+                running[slot] += 1
+                max_running[slot] = max(max_running[slot], running[slot])
+            time.sleep(0.1)
+            with lock:
+                running[slot] -= 1
+
+        self.mock_generators(generate)
+
+        self.scriptlet.generate_system_cert_requests(self.deployer, self.subsystem)
+
+        # HSM keys are generated one at a time, internal keys concurrently
+        self.assertEqual(max_running['HSM'], 1)
+        self.assertGreater(max_running['internal'], 1)
+
+    def test_dbm_database(self):
+        # DBM databases do not support concurrent access
+        os.environ['NSS_DEFAULT_DB_TYPE'] = 'dbm'
+
+        self.assertEqual(
+            self.scriptlet.get_keygen_limit(self.deployer, self.tmpdir, None), 1)
+
+    def test_errors(self):
+
+        def generate(tag):
+            if tag in ['subsystem', 'storage']:
+                raise Exception('Unable to generate %s key' % tag)
+
+        self.mock_generators(generate)
+
+        with self.assertRaisesRegex(Exception, 'Unable to generate (subsystem|storage) key'):
+            self.scriptlet.generate_system_cert_requests(self.deployer, self.subsystem)
+
+        # a failure does not stop the other keys
+        self.scriptlet.generate_sslserver_csr.assert_called_once_with(
+            self.deployer, self.subsystem)
+        self.scriptlet.generate_kra_transport_csr.assert_called_once_with(
+            self.deployer, self.subsystem)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,10 +19,28 @@
 # All rights reserved.
 #
 
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+import zipfile
 
+import ldap
+import requests
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import pki.server
+import pki.server.cli.upgrade
+import pki.server.upgrade
+import pki.util
 from pki.server.instance import PKIInstance
-from pki.server.subsystem import PKISubsystem
+from pki.server.subsystem import CASubsystem, PKISubsystem
 
 
 class PKIServerTests(unittest.TestCase):
@@ -64,6 +82,572 @@ class PKIServerTests(unittest.TestCase):
         d.pop(casub)
         self.assertNotIn(casub, d)
 
+    def test_lazy_subsystem_loading(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        for name in ['ca', 'kra']:
+            conf_dir = os.path.join(tmpdir, 'pki-tomcat', name, 'conf')
+            os.makedirs(conf_dir)
+            with open(os.path.join(conf_dir, 'CS.cfg'), 'w') as f:
+                f.write('cs.type=%s\n' % name.upper())
+
+        instance = PKIInstance('pki-tomcat')
+
+        with mock.patch.object(pki.server.PKIServer, 'BASE_DIR', tmpdir), \
+                mock.patch('pki.util.load_properties',
+                           wraps=pki.util.load_properties) as load_properties:
+
+            instance.load_subsystems()
+            self.assertEqual(sorted(instance.subsystems), ['ca', 'kra'])
+            load_properties.assert_not_called()
+
+            ca = instance.get_subsystem('ca')
+            self.assertEqual(ca.type, 'CA')
+            self.assertEqual(ca.prefix, 'ca')
+            self.assertEqual(ca.config['cs.type'], 'CA')
+
+            # only the CA config has been loaded
+            load_properties.assert_called_once_with(
+                os.path.join(tmpdir, 'pki-tomcat', 'ca', 'conf', 'CS.cfg'),
+                mock.ANY)
+
+    def test_lazy_subsystem_loading_error(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        conf_dir = os.path.join(tmpdir, 'pki-tomcat', 'ca', 'conf')
+        os.makedirs(conf_dir)
+        with open(os.path.join(conf_dir, 'CS.cfg'), 'w') as f:
+            f.write('cs.type=CA\n')
+
+        instance = PKIInstance('pki-tomcat')
+
+        with mock.patch.object(pki.server.PKIServer, 'BASE_DIR', tmpdir):
+            instance.load_subsystems()
+
+        ca = instance.get_subsystem('ca')
+
+        with mock.patch('pki.util.load_properties',
+                        side_effect=IOError('Permission denied')):
+
+            # hashing does not load the config
+            self.assertIn(ca, {ca: 1})
+
+            with self.assertRaises(IOError):
+                ca.config  # pylint: disable=pointless-statement
+
+        # the load is retried on the next access
+        self.assertEqual(ca.type, 'CA')
+        self.assertFalse(ca.load_pending)
+
+
+class WaitForTests(unittest.TestCase):
+    def test_backoff(self):
+        results = [requests.exceptions.ConnectionError(), False, True]
+
+        def condition():
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        start = time.monotonic()
+        pki.server.wait_for(condition, 'test', max_wait=10)
+
+        # ready within a few short retries, not a second per retry
+        self.assertFalse(results)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_timeout(self):
+        def condition():
+            raise requests.exceptions.ConnectionError()
+
+        with self.assertRaisesRegex(Exception, 'Test did not start after 0s'):
+            pki.server.wait_for(
+                condition, 'test', max_wait=0.1,
+                timeout_message='Test did not start after %ds')
+
+    def test_watch(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        log_file = os.path.join(tmpdir, 'debug.log')
+
+        timer = threading.Timer(1.5, lambda: open(log_file, 'w').close())
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        start = time.monotonic()
+        pki.server.wait_for(
+            lambda: os.path.exists(log_file), 'test',
+            max_wait=10, initial_delay=0.01, max_delay=10, watch=[tmpdir])
+
+        # woken up by the new file instead of the next retry at 2.55s
+        self.assertLess(time.monotonic() - start, 2.2)
+
+    def test_watch_growing_log(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        log_file = os.path.join(tmpdir, 'debug.log')
+        stop = threading.Event()
+
+        def write_log():
+            with open(log_file, 'a') as f:
+                while not stop.is_set():
+                    f.write('log\n')
+                    f.flush()
+                    time.sleep(0.005)
+
+        writer = threading.Thread(target=write_log)
+        writer.start()
+        self.addCleanup(writer.join)
+        self.addCleanup(stop.set)
+
+        calls = []
+        start = time.monotonic()
+
+        def condition():
+            calls.append(time.monotonic())
+            return time.monotonic() - start >= 1
+
+        pki.server.wait_for(
+            condition, 'test', max_wait=10,
+            initial_delay=0.01, max_delay=0.2, watch=[tmpdir])
+
+        # the backoff is reset at most every max_delay, so the condition
+        # is not checked every initial_delay while the log keeps growing
+        self.assertLess(len(calls), 30)
+
+
+AUDIT_EVENTS = u'''
+# Event: CERT_REQUEST_PROCESSED
+# Applicable subsystems: CA
+# Enabled by default: Yes
+#
+CERT_REQUEST_PROCESSED=<type=CERT_REQUEST_PROCESSED>:[AuditEvent=CERT_REQUEST_PROCESSED]
+#
+# Event: CONFIG_ROLE
+# Applicable subsystems: CA, KRA, OCSP, TKS, TPS
+# Enabled by default: No
+#
+CONFIG_ROLE=<type=CONFIG_ROLE>:[AuditEvent=CONFIG_ROLE]
+'''
+
+
+class AuditEventCatalogTests(unittest.TestCase):
+    def test_load_audit_event_catalog(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        jar_file = os.path.join(tmpdir, 'pki-cmsbundle.jar')
+
+        with zipfile.ZipFile(jar_file, 'w') as jar:
+            jar.writestr('audit-events.properties', AUDIT_EVENTS)
+
+        catalog = pki.server.PKIServer.load_audit_event_catalog(jar_file)
+
+        self.assertEqual(
+            sorted(catalog.get_events('ca')),
+            ['CERT_REQUEST_PROCESSED', 'CONFIG_ROLE'])
+        self.assertEqual(list(catalog.get_events('kra')), ['CONFIG_ROLE'])
+        self.assertEqual(catalog.get_events('acme'), {})
+        self.assertTrue(
+            catalog.get_events('ca')['CERT_REQUEST_PROCESSED']['enabled_by_default'])
+
+        # cached until the jar file changes
+        self.assertIs(
+            pki.server.PKIServer.load_audit_event_catalog(jar_file), catalog)
+
+        with zipfile.ZipFile(jar_file, 'w') as jar:
+            jar.writestr('audit-events.properties', AUDIT_EVENTS.split('#\n#')[0])
+
+        catalog = pki.server.PKIServer.load_audit_event_catalog(jar_file)
+        self.assertEqual(list(catalog.get_events('ca')), ['CERT_REQUEST_PROCESSED'])
+
+
+class CertRequestSearchTests(unittest.TestCase):
+    def test_iterate_cert_requests(self):
+        subsystem = CASubsystem(PKIInstance('pki-tomcat'))
+        subsystem.config = {'internaldb.basedn': 'o=pki-tomcat-CA'}
+
+        def entry(request_id):
+            return ('cn=%s,ou=ca,ou=requests,o=pki-tomcat-CA' % request_id, {
+                'cn': [request_id.encode()],
+                'requestType': [b'enrollment'],
+                'requestState': [b'complete'],
+            })
+
+        pages = [
+            ([entry('1'), entry('2')], b'page2'),
+            ([entry('3')], b''),
+        ]
+        searches = []
+        cookies = []
+
+        def result3(msgid):
+            entries, cookie = pages[msgid]
+            control = mock.Mock(controlType=searches[-1][1]['serverctrls'][0].controlType)
+            control.cookie = cookie
+            return 101, entries, msgid, [control]
+
+        def search_ext(*args, **kwargs):
+            searches.append((args, kwargs))
+            cookies.append(kwargs['serverctrls'][0].cookie)
+            return len(searches) - 1
+
+        con = mock.Mock()
+        con.ldap.search_ext.side_effect = search_ext
+        con.ldap.result3.side_effect = result3
+        subsystem.open_database = mock.Mock(return_value=con)
+
+        requests_found = list(subsystem.iterate_cert_requests(
+            status='complete',
+            created_after='2021-01-01',
+            created_before='2021-12-31',
+            include_request=False,
+            page_size=2))
+
+        self.assertEqual([r['id'] for r in requests_found], ['1', '2', '3'])
+        self.assertIsNone(requests_found[0]['request'])
+        self.assertEqual(cookies, ['', b'page2'])
+
+        base_dn, _, search_filter, attrs = searches[0][0]
+        self.assertEqual(base_dn, 'ou=ca,ou=requests,o=pki-tomcat-CA')
+        self.assertEqual(
+            search_filter,
+            '(&(requestState=complete)'
+            '(dateOfCreate>=20210101000000Z)'
+            '(dateOfCreate<=20211231235959Z))')
+        self.assertEqual(attrs, ['cn', 'requestType', 'requestState'])
+        con.close.assert_called_once_with()
+
+
+class DatabaseConnectionPoolTests(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('ldap.initialize', side_effect=lambda url: mock.Mock())
+        self.initialize = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.pool = pki.server.PKIDatabaseConnectionPool(max_idle=1)
+        self.addCleanup(self.pool.clear)
+
+    def connect(self, url='ldap://localhost:389', bind_dn='cn=Directory Manager'):
+        connection = pki.server.PKIDatabaseConnection(url)
+        connection.set_credentials(bind_dn=bind_dn, bind_password='Secret.123')
+        return self.pool.get_connection(connection)
+
+    def test_reuse(self):
+        con1 = self.connect()
+        con1.ldap.simple_bind_s.assert_called_once_with(
+            'cn=Directory Manager', 'Secret.123')
+        con1.close()
+        con1.close()
+
+        # the idle connection is reused without a health check
+        con2 = self.connect()
+        self.assertIs(con2, con1)
+        con2.ldap.search_s.assert_not_called()
+
+        # another connection is opened while the first one is in use
+        con3 = self.connect()
+        self.assertIsNot(con3, con1)
+
+        # connections with other credentials are not shared
+        con4 = self.connect(bind_dn='uid=pkidbuser,ou=people,o=pki-tomcat-CA')
+        self.assertIsNot(con4, con1)
+        self.assertEqual(self.initialize.call_count, 3)
+
+        # only max_idle connections are kept per key
+        ldap_object = con3.ldap
+        con1.close()
+        con3.close()
+        ldap_object.unbind_s.assert_called_once_with()
+        con4.close()
+
+        self.pool.clear()
+        self.assertEqual(self.pool.connections, {})
+
+    def test_health_check(self):
+        con1 = self.connect()
+        con1.close()
+
+        self.pool.check_interval = 0
+        con1.ldap.search_s.side_effect = ldap.LDAPError('Can\'t contact LDAP server')
+
+        con2 = self.connect()
+        self.assertIsNot(con2, con1)
+        self.assertIsNone(con1.ldap)
+
+        con2.close()
+        self.assertIs(self.connect(), con2)
+        con2.ldap.search_s.assert_called_once_with(
+            '', ldap.SCOPE_BASE, '(objectClass=*)', ['1.1'])
+
+    def test_ldapi(self):
+        connection = pki.server.PKIDatabaseConnection(
+            'ldapi://%2Frun%2Fslapd-localhost.socket')
+        connection.set_credentials(autobind=True)
+        con = self.pool.get_connection(connection)
+
+        con.ldap.sasl_external_bind_s.assert_called_once_with()
+        con.ldap.simple_bind_s.assert_not_called()
+
+        # autobind is never used without an explicit request
+        con = self.connect(url='ldapi://%2Frun%2Fslapd-localhost.socket', bind_dn=None)
+        con.ldap.sasl_external_bind_s.assert_not_called()
+
+    def create_subsystem(self, **config):
+        subsystem = CASubsystem(PKIInstance('pki-tomcat'))
+        subsystem.config = {
+            'internaldb.ldapconn.host': 'localhost',
+            'internaldb.ldapconn.port': '636',
+            'internaldb.ldapconn.secureConn': 'true',
+            'internaldb.ldapconn.ldapiSocket': '/run/slapd-localhost.socket',
+            'internaldb.ldapauth.authtype': 'SslClientAuth',
+            'internaldb.ldapauth.bindDN': 'uid=pkidbuser,ou=people,o=pki-tomcat-CA',
+            'internaldb.ldapauth.clientCertNickname': 'subsystemCert cert-pki-tomcat',
+        }
+        subsystem.config.update(config)
+        subsystem.instance.get_password = mock.Mock(return_value='Secret.123')
+        subsystem.instance.get_token_password = mock.Mock(return_value='Secret.123')
+        return subsystem
+
+    def test_open_database_ldapi(self):
+        subsystem = self.create_subsystem()
+
+        # the client certificate is not silently replaced with autobind
+        with self.assertRaisesRegex(Exception, 'SslClientAuth is not supported over LDAPI'):
+            subsystem.open_database(pooled=False)
+        self.initialize.assert_not_called()
+
+        subsystem.config['internaldb.ldapauth.ldapiAutobind'] = 'true'
+        con = subsystem.open_database(pooled=False)
+
+        self.initialize.assert_called_once_with(
+            'ldapi://%2Frun%2Fslapd-localhost.socket')
+        con.ldap.sasl_external_bind_s.assert_called_once_with()
+        con.close()
+
+        subsystem.config['internaldb.ldapauth.ldapiAutobind'] = 'false'
+        subsystem.config['internaldb.ldapauth.authtype'] = 'BasicAuth'
+        con = subsystem.open_database(pooled=False)
+
+        con.ldap.simple_bind_s.assert_called_once_with(
+            'uid=pkidbuser,ou=people,o=pki-tomcat-CA', 'Secret.123')
+        con.ldap.sasl_external_bind_s.assert_not_called()
+        con.close()
+
+    def test_open_database_autobind_without_ldapi(self):
+        subsystem = self.create_subsystem(**{
+            'internaldb.ldapconn.ldapiSocket': '',
+            'internaldb.ldapauth.ldapiAutobind': 'true',
+        })
+
+        with self.assertRaisesRegex(Exception, 'ldapiAutobind requires'):
+            subsystem.open_database(pooled=False)
+
+
+class ExportSystemCertsTests(unittest.TestCase):
+    def test_export_system_certs(self):
+        instance = PKIInstance('pki-tomcat')
+        instance.external_certs = [
+            pki.server.ExternalCert('External CA', 'internal'),
+        ]
+
+        subsystem = CASubsystem(instance)
+        subsystem.get_subsystem_cert = lambda cert_id: {
+            'nickname': '%s cert' % cert_id,
+            'token': 'HSM' if cert_id == 'signing' else 'Internal Key Storage Token',
+        }
+
+        with mock.patch('subprocess.check_call') as check_call:
+            subsystem.export_system_certs(
+                ['subsystem', 'signing'], 'ca.p12', 'password.txt',
+                external_certs=True)
+
+            # one command for all certs
+            [(cmd,), _] = check_call.call_args
+            self.assertEqual(cmd[:3], ['pki', '-d', instance.nssdb_dir])
+            self.assertIn('pkcs12-export', cmd)
+            self.assertNotIn('--append', cmd)
+            self.assertEqual(
+                cmd[-3:], ['subsystem cert', 'HSM:signing cert', 'External CA'])
+
+            check_call.reset_mock()
+            subsystem.export_system_certs(
+                ['subsystem'], 'ca.p12', 'password.txt',
+                no_key=True, external_certs=True)
+
+            # external certs are exported with their keys
+            [(cmd1,), _], [(cmd2,), _] = check_call.call_args_list
+            self.assertIn('--no-key', cmd1)
+            self.assertEqual(cmd1[-1], 'subsystem cert')
+            self.assertNotIn('--no-key', cmd2)
+            self.assertIn('--append', cmd2)
+            self.assertEqual(cmd2[-1], 'External CA')
+
+
+class CloneSetupTests(unittest.TestCase):
+    def test_request_ranges(self):
+        subsystem = CASubsystem(PKIInstance('pki-tomcat'))
+        subsystem.config = {}
+        subsystem.save = mock.Mock()
+
+        ranges = {
+            'request': ('10000001', '20000000'),
+            'serialNo': ('10000001', '20000000'),
+            'replicaId': ('96', '100'),
+        }
+
+        def post(path, data):
+            self.assertEqual(path, '/ca/admin/ca/updateNumberRange')
+            self.assertEqual(data['sessionID'], 'token')
+            begin, end = ranges[data['type']]
+            return mock.Mock(text=(
+                '<XMLResponse><Status>0</Status>'
+                '<beginNumber>%s</beginNumber><endNumber>%s</endNumber>'
+                '</XMLResponse>' % (begin, end)))
+
+        connection = mock.Mock()
+        connection.post.side_effect = post
+        subsystem.create_master_connection = mock.Mock(return_value=connection)
+
+        subsystem.request_ranges('https://master.example.com:8443', session_id='token')
+
+        # one connection for all ranges
+        subsystem.create_master_connection.assert_called_once_with(
+            'https://master.example.com:8443')
+        self.assertEqual(connection.post.call_count, 3)
+
+        self.assertEqual(subsystem.config['dbs.beginReplicaNumber'], '96')
+        self.assertEqual(subsystem.config['dbs.endReplicaNumber'], '100')
+        self.assertEqual(subsystem.config['dbs.beginSerialNumber'], '10000001')
+        self.assertEqual(subsystem.config['dbs.endRequestNumber'], '20000000')
+        self.assertEqual(subsystem.config['dbs.enableSerialManagement'], 'true')
+        subsystem.save.assert_called_once_with()
+        connection.close.assert_called_once_with()
+
+    def test_create_master_connection(self):
+        subsystem = CASubsystem(PKIInstance('pki-tomcat'))
+
+        ca_cert = mock.Mock()
+        ca_cert.public_bytes.return_value = b'CA cert\n'
+        server_cert = mock.Mock()
+        certs = [
+            {'trust_flags': 'CT,C,C', 'object': ca_cert},
+            {'trust_flags': 'u,u,u', 'object': server_cert},
+        ]
+
+        nssdb = mock.Mock()
+        nssdb.list_certs.return_value = certs
+        subsystem.instance.open_nssdb = mock.Mock(return_value=nssdb)
+
+        cert_data = {}
+
+        def create_connection(**kwargs):
+            with open(kwargs['cert_paths'], 'rb') as f:
+                cert_data['ca.crt'] = f.read()
+            return mock.Mock()
+
+        with mock.patch('pki.client.PKIConnection',
+                        side_effect=create_connection) as connection:
+            subsystem.create_master_connection('https://master.example.com')
+
+        # the port defaults to the scheme's port
+        self.assertEqual(connection.call_args[1]['port'], '443')
+
+        # only the certs trusted for SSL are trusted by the connection
+        self.assertEqual(cert_data['ca.crt'], b'CA cert\n')
+        server_cert.public_bytes.assert_not_called()
+
+        nssdb.list_certs.return_value = certs[1:]
+
+        with self.assertRaisesRegex(Exception, 'No CA certificates trusted'):
+            subsystem.create_master_connection('https://master.example.com:8443')
+
+    def test_retrieve_config(self):
+        subsystem = CASubsystem(PKIInstance('pki-tomcat'))
+
+        connection = mock.Mock()
+        subsystem.create_master_connection = mock.Mock(return_value=connection)
+        connection.post.return_value = mock.Mock(text=(
+            '<XMLResponse><Status>0</Status><ConfigList>'
+            '<Config><name>internaldb.basedn</name><value>o=pki-tomcat-CA</value></Config>'
+            '<Config><name>internaldb.ldapauth.password</name><value/></Config>'
+            '</ConfigList></XMLResponse>'))
+
+        config = subsystem.retrieve_config(
+            'https://master.example.com:8443',
+            ['internaldb.ldapauth.password'],
+            ['internaldb'],
+            session_id='token',
+            connection=connection)
+
+        self.assertEqual(config['properties'], {
+            'internaldb.basedn': 'o=pki-tomcat-CA',
+            'internaldb.ldapauth.password': '',
+        })
+
+        connection.post.return_value = mock.Mock(
+            text='<XMLResponse><Status>2</Status></XMLResponse>')
+
+        with self.assertRaises(pki.UnauthorizedException):
+            subsystem.retrieve_config(
+                'https://master.example.com:8443', [], [],
+                session_id='token', connection=connection)
+
+        # a connection created for the request is closed afterwards
+        with self.assertRaises(pki.UnauthorizedException):
+            subsystem.retrieve_config(
+                'https://master.example.com:8443', [], [],
+                session_id='token')
+
+        connection.close.assert_called_once_with()
+
+
+class UpgradeInstancesTests(unittest.TestCase):
+    def test_upgrade_instances(self):
+        instances = [PKIInstance('pki-tomcat'), PKIInstance('pki-kra'), PKIInstance('pki-bad')]
+
+        # all good instances have to be upgraded at the same time
+        barrier = threading.Barrier(2, timeout=5)
+
+        def upgrade(upgrader):
+            if upgrader.instance.name == 'pki-bad':
+                raise Exception('Upgrade failed')
+            barrier.wait()
+
+        with mock.patch.object(pki.server.upgrade.PKIServerUpgrader, 'upgrade',
+                               autospec=True, side_effect=upgrade) as upgrade_instance:
+            failures = pki.server.upgrade.upgrade_instances(instances, workers=3)
+
+        # each instance has its own upgrader
+        upgraders = [call[0][0] for call in upgrade_instance.call_args_list]
+        self.assertEqual(
+            sorted(upgrader.instance.name for upgrader in upgraders),
+            ['pki-bad', 'pki-kra', 'pki-tomcat'])
+        self.assertEqual(len(set(map(id, upgraders))), 3)
+
+        # a failure does not stop the other upgrades
+        self.assertEqual(list(failures), [instances[2]])
+        self.assertEqual(str(failures[instances[2]]), 'Upgrade failed')
+
+    def test_invalid_workers(self):
+        cli = pki.server.cli.upgrade.UpgradeCLI()
+
+        for value in ['0', 'two']:
+            with mock.patch.object(pki.server.upgrade, 'upgrade_instances') as upgrade, \
+                    mock.patch.object(cli, 'usage') as usage:
+
+                with self.assertRaises(SystemExit) as e:
+                    cli.execute(['--workers', value])
+
+            self.assertEqual(e.exception.code, 1)
+            usage.assert_called_once_with()
+            upgrade.assert_not_called()
+
 
 if __name__ == '__main__':
     unittest.main()
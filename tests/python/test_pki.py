@@ -19,12 +19,25 @@
 # All rights reserved.
 #
 
+import base64
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 
 import pki
+import pki.cert
+import pki.key
 import requests
 import json
 
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
 
 class HTTPTestError(requests.exceptions.HTTPError):
     def __init__(self, body):
@@ -82,6 +95,311 @@ class PKITests(unittest.TestCase):
         with self.assertRaises(HTTPTestError) as e:
             raiser(b'no json body')
 
+    def test_iterate_pages(self):
+
+        pages = {
+            None: ([1, 2], 'https://localhost/ca/rest/certs/search?start=2&size=2'),
+            '2': ([3, 4], 'https://localhost/ca/rest/certs/search?start=4&size=2'),
+            '4': ([5], None),
+        }
+        requested = []
+
+        class Page(list):
+            pass
+
+        def fetch_page(params):
+            requested.append(params)
+            entries, href = pages[params.get('start')]
+            page = Page(entries)
+            page.links = []
+            if href:
+                page.links.append(pki.Link.from_json({
+                    'relationship': 'next',
+                    'href': href
+                }))
+            return page
+
+        for prefetch in (True, False):
+            del requested[:]
+            entries = list(pki.iterate_pages(fetch_page, prefetch=prefetch))
+            self.assertEqual(entries, [1, 2, 3, 4, 5])
+            self.assertEqual(requested, [
+                {},
+                {'start': '2', 'size': '2'},
+                {'start': '4', 'size': '2'},
+            ])
+
+    def test_parse_links(self):
+
+        link = {'relationship': 'next', 'href': '/ca/rest/certs?start=2'}
+
+        self.assertEqual(pki.parse_links({}), [])
+        self.assertEqual(pki.parse_links({'Link': []}), [])
+
+        [single] = pki.parse_links({'Link': link})
+        self.assertEqual(single.relationship, 'next')
+
+        links = pki.parse_links({'Link': [link, link]})
+        self.assertEqual(
+            [item.href for item in links],
+            ['/ca/rest/certs?start=2'] * 2)
+
+    def test_record_collections(self):
+
+        json_value = {
+            'entries': [{
+                'id': '0x1',
+                'SubjectDN': 'CN=Test 1',
+                'Status': 'VALID',
+                'Link': {'relationship': 'self', 'href': '/ca/rest/certs/0x1'},
+                'Custom': 'value',
+            }, {
+                'id': '0x2',
+                'SubjectDN': 'CN=Test 2',
+            }],
+            'Link': {'relationship': 'next', 'href': '/ca/rest/certs?start=2'},
+        }
+
+        for lazy in (False, True):
+            certs = pki.cert.CertDataInfoCollection.from_json(
+                json_value, lazy=lazy)
+            cert1, cert2 = certs
+
+            self.assertEqual(cert1.serial_number, '0x1')
+            self.assertEqual(cert1.subject_dn, 'CN=Test 1')
+            self.assertEqual(cert1.link.href, '/ca/rest/certs/0x1')
+            self.assertEqual(cert1.Custom, 'value')
+            self.assertEqual(cert2.subject_dn, 'CN=Test 2')
+            self.assertIsNone(cert2.status)
+            self.assertIsNone(cert2.link)
+            self.assertEqual(len(certs.links), 1)
+
+            self.assertFalse(hasattr(cert1, '__dict__'))
+            with self.assertRaises(AttributeError):
+                cert1.unknown  # pylint: disable=pointless-statement
+
+            cert2.status = 'REVOKED'
+            self.assertEqual(cert2.status, 'REVOKED')
+
+        cert_requests = pki.cert.CertRequestInfoCollection.from_json({
+            'entries': {
+                'requestURL': 'https://localhost/ca/rest/certrequests/7',
+                'requestStatus': 'complete',
+            },
+            'Link': [],
+        }, lazy=True)
+        [request] = cert_requests
+        self.assertEqual(request.request_id, '7')
+        self.assertEqual(request.request_status, 'complete')
+
+        keys = pki.key.KeyInfoCollection.from_json({
+            'entries': [{'keyURL': '/kra/rest/agent/keys/5', 'status': 'active'}],
+        })
+        [key] = keys
+        self.assertEqual(key.get_key_id(), '5')
+        self.assertEqual(key.status, 'active')
+        self.assertIsNone(key.public_key)
+
+    def test_enroll_many(self):
+
+        client = pki.cert.CertClient(mock.Mock(subsystem='ca'))
+        client.get_enrollment_template = mock.Mock()
+
+        def enroll_cert(profile_id, inputs, authority=None):
+            if inputs['cert_request'] == 'bad':
+                raise pki.BadRequestException('Invalid request')
+            return [inputs['cert_request']]
+
+        client.enroll_cert = mock.Mock(side_effect=enroll_cert)
+
+        csrs = ['csr%d' % i for i in range(20)] + ['bad']
+        stats = pki.cert.CertEnrollmentStats()
+
+        results = list(client.enroll_many(
+            'caUserCert', iter(csrs), concurrency=4, stats=stats))
+
+        client.get_enrollment_template.assert_called_once_with('caUserCert')
+
+        results.sort(key=lambda r: r.index)
+        self.assertEqual([r.index for r in results], list(range(21)))
+
+        for result in results[:20]:
+            self.assertIsNone(result.error)
+            self.assertEqual(result.results, [result.inputs['cert_request']])
+            self.assertEqual(result.inputs['cert_request_type'], 'pkcs10')
+
+        self.assertIsInstance(results[20].error, pki.BadRequestException)
+        self.assertIsNone(results[20].results)
+
+        self.assertEqual(stats.count, 21)
+        self.assertEqual(stats.errors, 1)
+        self.assertGreater(stats.throughput, 0)
+        self.assertLessEqual(stats.percentile(50), stats.percentile(99))
+
+    def test_enroll_many_invalid_concurrency(self):
+
+        client = pki.cert.CertClient(mock.Mock(subsystem='ca'))
+        client.get_enrollment_template = mock.Mock()
+
+        # the error is raised by the call, not by the first next()
+        with self.assertRaisesRegex(ValueError, 'Concurrency must be at least 1'):
+            client.enroll_many('caUserCert', ['csr'], concurrency=0)
+
+        client.get_enrollment_template.assert_not_called()
+
+    def test_enroll_many_close(self):
+
+        client = pki.cert.CertClient(mock.Mock(subsystem='ca'))
+        client.get_enrollment_template = mock.Mock()
+
+        started = threading.Event()
+        release = threading.Event()
+
+        def enroll_cert(profile_id, inputs, authority=None):
+            if inputs['cert_request'] != 'csr0':
+                started.set()
+                release.wait(5)
+            return [inputs['cert_request']]
+
+        client.enroll_cert = mock.Mock(side_effect=enroll_cert)
+
+        csrs = ['csr%d' % i for i in range(20)]
+        results = client.enroll_many('caUserCert', iter(csrs), concurrency=2)
+
+        # stop after the first result while the other enrollments are
+        # still queued
+        self.assertEqual(next(results).results, ['csr0'])
+        started.wait(5)
+        results.close()
+        release.set()
+        time.sleep(0.2)
+
+        # only the enrollments that were already running are submitted
+        self.assertLessEqual(client.enroll_cert.call_count, 3)
+
+    def test_archive_keys(self):
+
+        crypto = mock.Mock()
+        crypto.generate_session_key.side_effect = \
+            lambda: 'key%d' % crypto.generate_session_key.call_count
+        crypto.asymmetric_wrap.side_effect = \
+            lambda key, cert: ('wrapped-' + key).encode()
+        crypto.symmetric_wrap.side_effect = \
+            lambda data, key, nonce_iv=None: (data + ':' + key).encode()
+        crypto.generate_nonce_iv.return_value = b'iv'
+
+        with mock.patch.object(pki.key.KeyClient, 'set_crypto_algorithms'):
+            client = pki.key.KeyClient(mock.Mock(subsystem='kra'), crypto)
+            client.encrypt_alg_oid = pki.crypto.AES_128_CBC_OID
+
+        failures = {'secret3'}
+
+        def submit_request(request):
+            if request.get_attribute_value('clientKeyID') in failures:
+                raise pki.BadRequestException('Invalid request')
+            return pki.key.KeyRequestResponse.from_json({
+                'RequestInfo': {
+                    'requestURL': 'https://localhost/kra/rest/agent/keyrequests/1',
+                    'keyURL': 'https://localhost/kra/rest/agent/keys/1',
+                    'requestStatus': 'complete'
+                }
+            })
+
+        client.submit_request = mock.Mock(side_effect=submit_request)
+
+        items = [{
+            'client_key_id': 'secret%d' % i,
+            'data_type': pki.key.KeyClient.PASS_PHRASE_TYPE,
+            'private_data': 'data%d' % i
+        } for i in range(10)]
+
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        checkpoint_file = os.path.join(tmpdir, 'checkpoint')
+
+        results = list(client.archive_keys(
+            iter(items), concurrency=3, batch_size=4,
+            checkpoint_file=checkpoint_file))
+
+        results.sort(key=lambda r: r.index)
+        self.assertEqual([r.item_id for r in results],
+                         [item['client_key_id'] for item in items])
+        self.assertEqual([r.status for r in results].count('failed'), 1)
+        self.assertIsInstance(results[3].error, pki.BadRequestException)
+
+        # one transport wrap per batch of 4 items
+        self.assertEqual(crypto.asymmetric_wrap.call_count, 3)
+
+        for request in [c[0][0] for c in client.submit_request.call_args_list]:
+            index = int(request.get_attribute_value('clientKeyID')[6:])
+            session_key = 'key%d' % (index // 4 + 1)
+            self.assertEqual(
+                base64.b64decode(request.get_attribute_value('transWrappedSessionKey')),
+                b'wrapped-' + session_key.encode())
+
+        # resume the batch: only the failed item is archived again
+        failures.clear()
+        client.submit_request.reset_mock()
+
+        results = list(client.archive_keys(
+            iter(items), concurrency=3, batch_size=4,
+            checkpoint_file=checkpoint_file))
+
+        self.assertEqual([r.item_id for r in results], ['secret3'])
+        self.assertEqual(results[0].status, 'complete')
+        client.submit_request.assert_called_once()
+
+        # invalid items fail without being submitted or recorded
+        client.submit_request.reset_mock()
+
+        invalid_items = [{
+            'data_type': pki.key.KeyClient.PASS_PHRASE_TYPE,
+            'private_data': 'data'
+        }, {
+            'client_key_id': 'symkey',
+            'data_type': pki.key.KeyClient.SYMMETRIC_KEY_TYPE,
+            'private_data': 'data'
+        }] * 2
+
+        results = list(client.archive_keys(
+            iter(invalid_items), checkpoint_file=checkpoint_file))
+
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertIsInstance(result.error, TypeError)
+        client.submit_request.assert_not_called()
+
+    def test_archive_keys_invalid_arguments(self):
+
+        crypto = mock.Mock()
+        crypto.asymmetric_wrap.return_value = b'wrapped-key'
+        crypto.symmetric_wrap.return_value = b'data'
+        crypto.generate_nonce_iv.return_value = b'iv'
+
+        with mock.patch.object(pki.key.KeyClient, 'set_crypto_algorithms'):
+            client = pki.key.KeyClient(mock.Mock(subsystem='kra'), crypto)
+            client.encrypt_alg_oid = pki.crypto.AES_128_CBC_OID
+
+        # the errors are raised by the call, not by the first next()
+        with self.assertRaisesRegex(ValueError, 'Concurrency must be at least 1'):
+            client.archive_keys([], concurrency=0)
+
+        with self.assertRaisesRegex(ValueError, 'Batch size must be at least 1'):
+            client.archive_keys([], batch_size=0)
+
+        with self.assertRaisesRegex(TypeError, 'No data provided'):
+            client.archive_key('key1', pki.key.KeyClient.PASS_PHRASE_TYPE, None)
+
+        with mock.patch.object(
+                pki.key.KeyClient, 'check_archival_params',
+                wraps=pki.key.KeyClient.check_archival_params) as check:
+            client.submit_request = mock.Mock()
+            client.archive_key('key1', pki.key.KeyClient.PASS_PHRASE_TYPE, 'data')
+
+        # the parameters are checked once
+        check.assert_called_once_with(
+            'key1', pki.key.KeyClient.PASS_PHRASE_TYPE, 'data', None, None)
+
 
 if __name__ == '__main__':
     unittest.main()
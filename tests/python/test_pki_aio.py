@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (C) 2021 Red Hat, Inc.
+# All rights reserved.
+#
+
+import asyncio
+import threading
+import time
+import unittest
+
+from six.moves import BaseHTTPServer, socketserver  # pylint: disable=F0401
+
+import pki.aio
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class CountingHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+
+    def do_GET(self):
+        cls = CountingHandler
+        with cls.lock:
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+
+        time.sleep(0.05)
+
+        with cls.lock:
+            cls.active -= 1
+
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class AsyncPKIConnectionTests(unittest.TestCase):
+    def setUp(self):
+        CountingHandler.max_active = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), CountingHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_bounded_concurrency(self):
+
+        async def run():
+            async with pki.aio.AsyncPKIConnection(
+                    hostname='127.0.0.1',
+                    port=str(self.server.server_address[1]),
+                    max_concurrency=4) as connection:
+
+                responses = await asyncio.gather(*[
+                    connection.get('/') for _ in range(20)])
+
+                return connection, responses
+
+        loop = asyncio.new_event_loop()
+        try:
+            connection, responses = loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+        self.assertEqual(len(responses), 20)
+        self.assertTrue(all(r.json() == {} for r in responses))
+        self.assertLessEqual(CountingHandler.max_active, 4)
+
+        # connections are reused across requests
+        self.assertLessEqual(connection.connection.pool_stats.misses, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,219 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (C) 2021 Red Hat, Inc.
+# All rights reserved.
+#
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import pki.cli.daemon
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+# Implements the protocol of org.dogtagpki.cli.CLIDaemon. The command
+# prints its arguments and the process ID, writes the input into the
+# standard error, and fails if the first argument is "fail".
+FAKE_JVM = '''
+import os
+import struct
+import sys
+
+def read(size):
+    data = sys.stdin.buffer.read(size)
+    if len(data) < size:
+        sys.exit(0)
+    return data
+
+def read_int():
+    return struct.unpack('>i', read(4))[0]
+
+while True:
+    args = [read(read_int()).decode('utf-8') for _ in range(read_int())]
+    size = read_int()
+    stdin = read(size) if size >= 0 else b''
+
+    stdout = ('%s %s %d' % (sys.argv[2], ' '.join(args), os.getpid())).encode('utf-8')
+
+    out = sys.stdout.buffer
+    out.write(struct.pack('>i', 3 if args[0] == 'fail' else 0))
+    out.write(struct.pack('>i', len(stdout)) + stdout)
+    out.write(struct.pack('>i', len(stdin)) + stdin)
+    out.flush()
+'''
+
+
+class CLIDaemonTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.chmod(self.tmpdir, 0o700)
+
+        patcher = mock.patch.dict(os.environ, {'XDG_RUNTIME_DIR': self.tmpdir})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.daemon = pki.cli.daemon.CLIDaemon(
+            pki.cli.daemon.get_daemon_dir(), idle_timeout=1)
+
+        self.thread = threading.Thread(target=self.daemon.serve)
+        self.thread.start()
+
+        socket_path = self.daemon.socket_path
+        while not os.path.exists(socket_path):
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.thread.join()
+        shutil.rmtree(self.tmpdir)
+
+    def run_command(self, args, **kwargs):
+        return pki.cli.daemon.run(
+            [sys.executable, '-c', FAKE_JVM], 'TestCLI', args, **kwargs)
+
+    def test_run(self):
+
+        result = self.run_command(['cert-find'], capture_output=True)
+        self.assertEqual(result.returncode, 0)
+
+        main_class, command, pid = result.stdout.decode('utf-8').split()
+        self.assertEqual(main_class, 'TestCLI')
+        self.assertEqual(command, 'cert-find')
+
+        # the same process runs the next command
+        result = self.run_command(['cert-show'], capture_output=True)
+        self.assertEqual(result.stdout.decode('utf-8').split()[2], pid)
+        self.assertEqual(len(self.daemon.processes), 1)
+
+        with self.assertRaises(subprocess.CalledProcessError) as e:
+            self.run_command(['fail'], capture_output=True, check=True)
+        self.assertEqual(e.exception.returncode, 3)
+
+        # the process and the daemon stop when idle
+        self.thread.join(timeout=10)
+        self.assertFalse(self.thread.is_alive())
+        self.assertEqual(self.daemon.processes, {})
+        self.assertFalse(os.path.exists(self.daemon.socket_path))
+
+    def test_session_args(self):
+
+        result = self.run_command(
+            ['cert-find'], capture_output=True, session_args=['-d', 'db1'])
+        _, option, database, command, pid = result.stdout.decode('utf-8').split()
+        self.assertEqual([option, database, command], ['-d', 'db1', 'cert-find'])
+
+        # the same NSS database uses the same process
+        result = self.run_command(
+            ['cert-show'], capture_output=True, session_args=['-d', 'db1'])
+        self.assertEqual(result.stdout.decode('utf-8').split()[4], pid)
+
+        # another NSS database uses another process
+        result = self.run_command(
+            ['cert-find'], capture_output=True, session_args=['-d', 'db2'])
+        self.assertNotEqual(result.stdout.decode('utf-8').split()[4], pid)
+        self.assertEqual(len(self.daemon.processes), 2)
+
+    def test_insecure_dir(self):
+
+        self.run_command(['cert-find'], capture_output=True)
+
+        os.chmod(self.tmpdir, 0o755)
+        os.chmod(self.daemon.daemon_dir, 0o755)
+
+        with self.assertRaises(Exception):
+            pki.cli.daemon.get_daemon_dir()
+
+    def test_unsupported_jvm(self):
+
+        # the command runs without the daemon if the JVM cannot be started
+        cmd = [sys.executable, '-c', 'import sys; print(" ".join(sys.argv[1:]))']
+
+        with mock.patch.object(
+                pki.cli.daemon, 'get_daemon_cmd',
+                side_effect=Exception('CLI daemon is not supported on Java 25')):
+            result = pki.cli.daemon.run(
+                cmd, 'TestCLI', ['cert-find'], capture_output=True,
+                session_args=['-d', 'db1'])
+
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout.decode('utf-8').split(),
+                         ['TestCLI', '-d', 'db1', 'cert-find'])
+        self.assertFalse(any(p.is_running() for p in self.daemon.processes.values()))
+
+
+FAKE_JAVA = '''#!/bin/sh
+echo 'openjdk version "%s" 2022-01-18' >&2
+'''
+
+
+class DaemonCommandTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+        patcher = mock.patch.dict(pki.cli.daemon.java_versions, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_java(self, version):
+        java = os.path.join(self.tmpdir, version, 'java')
+        os.makedirs(os.path.dirname(java))
+
+        with open(java, 'w') as f:
+            f.write(FAKE_JAVA % version)
+        os.chmod(java, 0o755)
+
+        return java
+
+    def get_daemon_cmd(self, version):
+        java = self.create_java(version)
+        cmd = [java, '-cp', '/usr/share/pki/lib/*',
+               pki.cli.daemon.DAEMON_CLASS, 'TestCLI']
+        return pki.cli.daemon.get_daemon_cmd(cmd)
+
+    def test_get_java_version(self):
+        for version, major in [('1.8.0_292', 8), ('11.0.13', 11), ('17', 17)]:
+            java = self.create_java(version)
+            self.assertEqual(pki.cli.daemon.get_java_version([java]), major)
+
+        self.assertIsNone(pki.cli.daemon.get_java_version(
+            [os.path.join(self.tmpdir, 'missing', 'java')]))
+
+    def test_security_manager_option(self):
+
+        # Java 11 does not need the option and would not accept it
+        self.assertNotIn(
+            pki.cli.daemon.SECURITY_MANAGER_OPTION, self.get_daemon_cmd('11.0.13'))
+
+        self.assertEqual(
+            self.get_daemon_cmd('17.0.2')[-3:],
+            [pki.cli.daemon.SECURITY_MANAGER_OPTION,
+             pki.cli.daemon.DAEMON_CLASS, 'TestCLI'])
+
+        with self.assertRaisesRegex(Exception, 'not supported on Java 25'):
+            self.get_daemon_cmd('25.0.2')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (C) 2021 Red Hat, Inc.
+# All rights reserved.
+#
+
+import threading
+import time
+import unittest
+
+import requests
+from six.moves import BaseHTTPServer  # pylint: disable=F0401
+from six.moves import socketserver  # pylint: disable=F0401
+
+import pki.client
+
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(0.5)
+
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class PKIConnectionTests(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_connection(self, **kwargs):
+        return pki.client.PKIConnection(
+            hostname='127.0.0.1',
+            port=str(self.server.server_address[1]),
+            **kwargs)
+
+    def test_pool_stats(self):
+        connection = self.create_connection()
+
+        for _ in range(3):
+            connection.get('/')
+
+        self.assertEqual(connection.pool_stats.misses, 1)
+        self.assertEqual(connection.pool_stats.hits, 2)
+
+        connection.pool_stats.reset()
+        self.assertEqual(connection.pool_stats.requests, 0)
+
+    def test_no_keep_alive(self):
+        connection = self.create_connection(keep_alive=False)
+
+        for _ in range(3):
+            connection.get('/')
+
+        self.assertEqual(connection.pool_stats.misses, 3)
+        self.assertEqual(connection.pool_stats.hits, 0)
+
+    def test_pool_settings(self):
+        connection = self.create_connection(
+            pool_maxsize=50,
+            max_retries=3,
+            backoff_factor=0.5)
+
+        adapter = connection.session.get_adapter(connection.rootURI)
+        self.assertEqual(adapter.poolmanager.connection_pool_kw['maxsize'], 50)
+        self.assertEqual(adapter.max_retries.total, 3)
+        self.assertEqual(adapter.max_retries.backoff_factor, 0.5)
+
+    def test_timeout(self):
+        connection = self.create_connection(timeout=0.1)
+
+        with self.assertRaises(requests.exceptions.Timeout):
+            connection.get('/slow')
+
+        # per-request timeout overrides the default
+        connection.get('/slow', timeout=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
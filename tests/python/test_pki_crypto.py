@@ -0,0 +1,123 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (C) 2021 Red Hat, Inc.
+# All rights reserved.
+#
+
+import datetime
+import unittest
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+import pki.crypto
+
+
+def create_transport_cert():
+
+    key = rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend())
+
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, u'Transport')])
+    now = datetime.datetime.utcnow()
+
+    cert = x509.CertificateBuilder() \
+        .subject_name(name) \
+        .issuer_name(name) \
+        .public_key(key.public_key()) \
+        .serial_number(1) \
+        .not_valid_before(now) \
+        .not_valid_after(now + datetime.timedelta(days=1)) \
+        .sign(key, hashes.SHA256(), default_backend())
+
+    return key, cert
+
+
+class CryptographyCryptoProviderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.key, cert = create_transport_cert()
+        self.crypto = pki.crypto.CryptographyCryptoProvider('transport', cert)
+        self.cert = self.crypto.get_cert('transport')
+
+    def test_asymmetric_wrap(self):
+        session_key = self.crypto.generate_session_key()
+
+        public_keys = []
+        for _ in range(3):
+            wrapped = self.crypto.asymmetric_wrap(session_key, self.cert)
+            self.assertEqual(
+                self.key.decrypt(wrapped, padding.PKCS1v15()),
+                session_key)
+            public_keys.append(self.crypto.public_keys[self.cert])
+
+        # the public key is parsed once
+        self.assertEqual(len(self.crypto.public_keys), 1)
+        self.assertIs(public_keys[0], public_keys[2])
+
+    def test_symmetric_wrap_many(self):
+        session_key = self.crypto.generate_session_key()
+        data_list = [b'secret%d' % i * (i + 1) for i in range(5)]
+
+        results = self.crypto.symmetric_wrap_many(data_list, session_key)
+        self.assertEqual(len(results), 5)
+
+        nonce_ivs = [nonce_iv for nonce_iv, _ in results]
+        self.assertEqual(len(set(nonce_ivs)), 5)
+
+        for data, (nonce_iv, wrapped) in zip(data_list, results):
+
+            # same output as wrapping one payload at a time
+            self.assertEqual(
+                wrapped,
+                self.crypto.symmetric_wrap(data, session_key, nonce_iv=nonce_iv))
+
+            self.assertEqual(
+                self.crypto.symmetric_unwrap(wrapped, session_key, nonce_iv=nonce_iv),
+                data)
+
+    def test_symmetric_wrap_many_3des(self):
+        self.crypto.set_algorithm_keyset(0)
+
+        session_key = self.crypto.generate_session_key()
+        nonce_iv = self.crypto.generate_nonce_iv()
+
+        [(_, wrapped)] = self.crypto.symmetric_wrap_many(
+            [b'secret'], session_key, nonce_ivs=[nonce_iv])
+
+        self.assertEqual(
+            self.crypto.symmetric_unwrap(wrapped, session_key, nonce_iv=nonce_iv),
+            b'secret')
+
+    def test_symmetric_wrap_many_nonce_ivs(self):
+        session_key = self.crypto.generate_session_key()
+        nonce_iv = self.crypto.generate_nonce_iv()
+
+        with self.assertRaises(ValueError):
+            self.crypto.symmetric_wrap_many(
+                [b'secret1', b'secret2'], session_key, nonce_ivs=[nonce_iv])
+
+        # the base class checks the nonce IVs the same way
+        with self.assertRaises(ValueError):
+            pki.crypto.CryptoProvider.symmetric_wrap_many(
+                self.crypto, [b'secret1', b'secret2'], session_key,
+                nonce_ivs=[nonce_iv])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,12 +20,23 @@
 #
 
 import binascii
+import datetime
 import os
 import shutil
 import subprocess
 import tempfile
 import unittest
 
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
 from pki import nssdb
 
 
@@ -164,6 +175,225 @@ class PKINSSDBTests(unittest.TestCase):
         self.assertIn(b'X509v3 Subject Alternative Name: critical', out)
         self.assertIn(b'DNS:example.org', out)
 
+    def create_cert(self, nickname, trust_attributes='CT,C,C'):
+        noise_file = os.path.join(self.tmpdir, 'noise.bin')
+        with open(noise_file, 'wb') as f:
+            f.write(os.urandom(2048))
+        subprocess.check_call([
+            'certutil',
+            '-S',
+            '-d', self.tmpdir,
+            '-f', self.password_file,
+            '-z', noise_file,
+            '-n', nickname,
+            '-s', 'CN={}'.format(nickname),
+            '-x',
+            '-t', trust_attributes,
+        ])
+
+    def test_cert_info_cache(self):
+        self.create_db('sql')
+        self.create_cert('testcert')
+        db = nssdb.NSSDatabase(
+            self.tmpdir,
+            password_file=self.password_file,
+            cache=True)
+
+        cert = db.get_cert_info('testcert')
+        self.assertEqual(cert['subject'], 'CN=testcert')
+        self.assertEqual(cert['trust_flags'], 'CTu,Cu,Cu')
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.tmpdir, nssdb.CERT_INFO_CACHE_FILE)))
+
+        # repeat lookups are served from the cache, even by a new instance
+        db = nssdb.NSSDatabase(
+            self.tmpdir,
+            password_file=self.password_file,
+            cache=True)
+        with mock.patch.object(db, 'get_cert') as get_cert:
+            cached = db.get_cert_info('testcert')
+            get_cert.assert_not_called()
+
+        self.assertEqual(cached['serial_number'], cert['serial_number'])
+        self.assertEqual(cached['subject'], cert['subject'])
+        self.assertEqual(cached['not_after'], cert['not_after'])
+        self.assertEqual(cached['object'], cert['object'])
+
+        # changing the database invalidates the cache
+        db.modify_cert('testcert', 'P,,')
+        cert = db.get_cert_info('testcert')
+        self.assertEqual(cert['trust_flags'], 'Pu,u,u')
+
+    def test_cert_info_cache_disabled(self):
+        self.create_db('sql')
+        self.create_cert('testcert')
+
+        # the cache is disabled by default
+        db = nssdb.NSSDatabase(self.tmpdir, password_file=self.password_file)
+
+        cert = db.get_cert_info('testcert')
+        self.assertEqual(cert['subject'], 'CN=testcert')
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tmpdir, nssdb.CERT_INFO_CACHE_FILE)))
+
+    def test_list_certs(self):
+        self.create_db('sql')
+        self.create_cert('cert1')
+        self.create_cert('cert2 with spaces', trust_attributes='P,,')
+        db = nssdb.NSSDatabase(self.tmpdir, password_file=self.password_file)
+
+        certs = db.list_certs()
+        certs = dict((cert['nickname'], cert) for cert in certs)
+
+        self.assertEqual(sorted(certs), ['cert1', 'cert2 with spaces'])
+        self.assertEqual(certs['cert1']['subject'], 'CN=cert1')
+        self.assertEqual(certs['cert1']['trust_flags'], 'CTu,Cu,Cu')
+        self.assertIsNone(certs['cert1']['token'])
+        self.assertEqual(certs['cert2 with spaces']['trust_flags'], 'Pu,u,u')
+
+        # certs are exported in a single certutil call
+        db = nssdb.NSSDatabase(
+            self.tmpdir,
+            password_file=self.password_file,
+            cache=False)
+        with mock.patch.object(db, 'get_cert') as get_cert:
+            self.assertEqual(len(db.list_certs()), 2)
+            get_cert.assert_not_called()
+
+
+class CertInfoCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+        with open(os.path.join(self.tmpdir, 'cert9.db'), 'w') as f:
+            f.write('certs')
+
+        self.pem = ExportCertsTests.create_pem('testcert')
+
+    def test_store(self):
+        cache = nssdb.CertInfoCache(self.tmpdir)
+        cache.put('testcert', {'data': self.pem.decode('ascii')}, cache.load())
+
+        # the temp file is replaced atomically
+        self.assertEqual(
+            sorted(os.listdir(self.tmpdir)),
+            sorted(['cert9.db', nssdb.CERT_INFO_CACHE_FILE]))
+
+        cache = nssdb.CertInfoCache(self.tmpdir)
+        self.assertEqual(cache.get('testcert'), {'data': self.pem.decode('ascii')})
+
+    def test_store_error(self):
+        cache = nssdb.CertInfoCache(self.tmpdir)
+
+        with mock.patch('os.replace', side_effect=OSError('Read-only')):
+            cache.put('testcert', {'data': self.pem.decode('ascii')}, cache.load())
+
+        # the temp file is removed
+        self.assertEqual(os.listdir(self.tmpdir), ['cert9.db'])
+
+    def test_get_object(self):
+        cache = nssdb.CertInfoCache(self.tmpdir)
+        cache.put('testcert', {'data': self.pem.decode('ascii')}, cache.load())
+
+        cache = nssdb.CertInfoCache(self.tmpdir)
+
+        with mock.patch('cryptography.x509.load_pem_x509_certificate',
+                        wraps=x509.load_pem_x509_certificate) as load:
+            cert_obj = cache.get_object('testcert')
+            self.assertIs(cache.get_object('testcert'), cert_obj)
+
+        # the PEM data is parsed once
+        load.assert_called_once()
+
+        # changing the database invalidates the parsed certs
+        with open(os.path.join(self.tmpdir, 'cert9.db'), 'a') as f:
+            f.write('more certs')
+
+        self.assertIsNone(cache.get_object('testcert'))
+
+
+class ExportCertsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+        self.db = nssdb.NSSDatabase(self.tmpdir, cache=False)
+        self.pems = {
+            'cert1': self.create_pem('cert1'),
+            'cert2': self.create_pem('cert2'),
+        }
+
+    @staticmethod
+    def create_pem(name):
+        key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+        subject = x509.Name([x509.NameAttribute(x509.OID_COMMON_NAME, name)])
+        now = datetime.datetime.utcnow()
+        cert = x509.CertificateBuilder() \
+            .subject_name(subject) \
+            .issuer_name(subject) \
+            .public_key(key.public_key()) \
+            .serial_number(x509.random_serial_number()) \
+            .not_valid_before(now) \
+            .not_valid_after(now + datetime.timedelta(days=1)) \
+            .sign(key, hashes.SHA256(), default_backend())
+        return cert.public_bytes(serialization.Encoding.PEM)
+
+    def list_certs(self, trust_table, output, error=b''):
+
+        process = mock.Mock(returncode=0)
+        process.communicate.return_value = (output, error)
+
+        get_trust_table = '_NSSDatabase__get_trust_table'
+
+        with mock.patch.object(self.db, get_trust_table, return_value=trust_table), \
+                mock.patch.object(self.db, 'get_cert',
+                                  side_effect=lambda nickname, token: self.pems[nickname]) \
+                as get_cert, \
+                mock.patch('subprocess.Popen', return_value=process) as popen:
+            certs = self.db.list_certs()
+
+        certs = dict((cert['nickname'], cert['subject']) for cert in certs)
+        return certs, get_cert, popen
+
+    def test_batch(self):
+        certs, get_cert, _ = self.list_certs(
+            [('cert1', 'CT,C,C'), ('cert2', 'P,,')],
+            self.pems['cert1'] + self.pems['cert2'])
+
+        self.assertEqual(certs, {'cert1': 'CN=cert1', 'cert2': 'CN=cert2'})
+        get_cert.assert_not_called()
+
+    def test_batch_mismatch(self):
+        # batch output cannot be matched to the nicknames
+        certs, get_cert, _ = self.list_certs(
+            [('cert1', 'CT,C,C'), ('cert2', 'P,,')],
+            self.pems['cert2'] + self.pems['cert2'])
+
+        self.assertEqual(certs, {'cert1': 'CN=cert1', 'cert2': 'CN=cert2'})
+        self.assertEqual(get_cert.call_count, 2)
+
+    def test_batch_error(self):
+        certs, get_cert, _ = self.list_certs(
+            [('cert1', 'CT,C,C'), ('cert2', 'P,,')],
+            self.pems['cert2'] + self.pems['cert1'],
+            error=b'certutil: Could not find cert: cert1')
+
+        self.assertEqual(certs, {'cert1': 'CN=cert1', 'cert2': 'CN=cert2'})
+        self.assertEqual(get_cert.call_count, 2)
+
+    def test_shared_nickname(self):
+        # a shared nickname is exported individually, the rest in batch
+        certs, get_cert, popen = self.list_certs(
+            [('cert1', 'CT,C,C'), ('cert2', 'P,,'), ('cert1', 'CT,C,C')],
+            self.pems['cert2'])
+
+        self.assertEqual(certs, {'cert1': 'CN=cert1', 'cert2': 'CN=cert2'})
+        get_cert.assert_called_once_with(nickname='cert1', token=None)
+        popen.assert_called_once()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,322 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (C) 2021 Red Hat, Inc.
+# All rights reserved.
+#
+
+import errno
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import pki.upgrade
+import pki.util
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+
+class BackupScriptlet(pki.upgrade.PKIUpgradeScriptlet):
+
+    def __init__(self, backup_dir):
+        super(BackupScriptlet, self).__init__()
+        self.backup_dir = backup_dir
+
+    def get_backup_dir(self):
+        return self.backup_dir
+
+
+class PKIUpgraderBackupTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+        self.conf_dir = os.path.join(self.tmpdir, 'conf')
+        os.makedirs(os.path.join(self.conf_dir, 'certs'))
+
+        self.cs_cfg = os.path.join(self.conf_dir, 'CS.cfg')
+        self.write(self.cs_cfg, 'a=1\n')
+        os.chmod(self.cs_cfg, 0o640)
+
+        self.cert = os.path.join(self.conf_dir, 'certs', 'ca.crt')
+        self.write(self.cert, 'cert\n')
+
+        os.symlink('CS.cfg', os.path.join(self.conf_dir, 'link.cfg'))
+
+        self.upgrader = pki.upgrade.PKIUpgrader(upgrade_dir=self.tmpdir)
+        self.scriptlet = BackupScriptlet(os.path.join(self.tmpdir, 'backup'))
+        self.scriptlet.upgrader = self.upgrader
+
+    @staticmethod
+    def write(path, content):
+        # modify the file in place
+        with io.open(path, 'w') as f:
+            f.write(content)
+
+    @staticmethod
+    def read(path):
+        with io.open(path) as f:
+            return f.read()
+
+    def read_manifest(self):
+        manifest = os.path.join(self.scriptlet.get_backup_dir(), 'manifest')
+        with open(manifest) as f:
+            return {entry['path']: entry for entry in map(json.loads, f)}
+
+    def test_manifest(self):
+        self.scriptlet.backup(self.conf_dir)
+
+        entries = self.read_manifest()
+
+        self.assertEqual(entries[self.conf_dir]['type'], 'dir')
+        self.assertEqual(entries[self.cs_cfg]['type'], 'file')
+        self.assertEqual(entries[self.cs_cfg]['mode'], 0o640)
+        self.assertEqual(entries[self.cert]['type'], 'file')
+
+        link = os.path.join(self.conf_dir, 'link.cfg')
+        self.assertEqual(entries[link]['type'], 'link')
+        self.assertEqual(entries[link]['target'], 'CS.cfg')
+
+    def test_backup_not_linked(self):
+        os.chmod(self.cs_cfg, 0o440)
+        self.scriptlet.backup(self.cs_cfg)
+
+        # files modified in place are never hard linked, even if read-only
+        backup_file = os.path.join(
+            self.scriptlet.get_backup_dir(), 'oldfiles') + self.cs_cfg
+        self.assertFalse(os.path.samefile(backup_file, self.cs_cfg))
+
+        self.write(self.cs_cfg, 'a=2\n')
+        self.assertEqual(self.read(backup_file), 'a=1\n')
+
+    def test_reflink_fallback(self):
+        error = OSError(errno.EOPNOTSUPP, 'Operation not supported')
+
+        with mock.patch('fcntl.ioctl', side_effect=error) as ioctl:
+            self.scriptlet.backup(self.cs_cfg)
+
+        ioctl.assert_called_once_with(mock.ANY, pki.upgrade.FICLONE, mock.ANY)
+
+        backup_file = os.path.join(
+            self.scriptlet.get_backup_dir(), 'oldfiles') + self.cs_cfg
+        self.assertEqual(self.read(backup_file), 'a=1\n')
+        self.assertFalse(os.path.samefile(backup_file, self.cs_cfg))
+
+    @mock.patch('pki.upgrade.reflink', return_value=False)
+    def test_restore_files(self, _):
+        # the cert will be replaced, so it can be hard linked
+        self.scriptlet.backup(self.cert, replaced=True)
+        self.scriptlet.backup(self.conf_dir)
+
+        backup_cert = os.path.join(
+            self.scriptlet.get_backup_dir(), 'oldfiles') + self.cert
+        self.assertTrue(os.path.samefile(backup_cert, self.cert))
+
+        # modify a file in place, replace another one, and add a new one
+        self.write(self.cs_cfg, 'a=2\n')
+        os.chmod(self.cs_cfg, 0o600)
+
+        new_cert = self.cert + '.new'
+        self.write(new_cert, 'new cert\n')
+        os.rename(new_cert, self.cert)
+
+        new_file = os.path.join(self.conf_dir, 'new.cfg')
+        self.scriptlet.backup(new_file)
+        self.write(new_file, 'b=1\n')
+
+        self.upgrader.revert_scriptlet(self.scriptlet)
+
+        self.assertEqual(self.read(self.cs_cfg), 'a=1\n')
+        self.assertEqual(os.stat(self.cs_cfg).st_mode & 0o777, 0o640)
+        self.assertEqual(self.read(self.cert), 'cert\n')
+        self.assertFalse(os.path.exists(new_file))
+
+    def create_scriptlet(self, name):
+        scriptlet = BackupScriptlet(os.path.join(self.tmpdir, 'backup', name))
+        scriptlet.upgrader = self.upgrader
+        return scriptlet
+
+    @mock.patch('pki.upgrade.reflink', return_value=False)
+    def test_replaced_then_modified(self, _):
+        scriptlet1 = self.create_scriptlet('1')
+        scriptlet2 = self.create_scriptlet('2')
+
+        # the first scriptlet replaces the file, so its backup is the
+        # original file itself
+        scriptlet1.backup(self.cs_cfg, replaced=True)
+
+        # the second scriptlet modifies the file in place, so it cannot
+        # share the first backup
+        scriptlet2.backup(self.cs_cfg)
+        self.write(self.cs_cfg, 'a=2\n')
+
+        backup_file = os.path.join(
+            scriptlet2.get_backup_dir(), 'oldfiles') + self.cs_cfg
+        self.assertEqual(self.read(backup_file), 'a=1\n')
+
+        self.upgrader.revert_scriptlet(scriptlet2)
+
+        self.assertEqual(self.read(self.cs_cfg), 'a=1\n')
+
+    @mock.patch('pki.upgrade.reflink', return_value=False)
+    def test_modified_same_size(self, _):
+        scriptlet1 = self.create_scriptlet('1')
+        scriptlet2 = self.create_scriptlet('2')
+
+        scriptlet1.backup(self.cs_cfg)
+
+        # modify the file in place without changing the size
+        # or the timestamp
+        st = os.stat(self.cs_cfg)
+        self.write(self.cs_cfg, 'a=2\n')
+        os.utime(self.cs_cfg, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        scriptlet2.backup(self.cs_cfg)
+
+        backup_file1 = os.path.join(
+            scriptlet1.get_backup_dir(), 'oldfiles') + self.cs_cfg
+        backup_file2 = os.path.join(
+            scriptlet2.get_backup_dir(), 'oldfiles') + self.cs_cfg
+
+        self.assertEqual(self.read(backup_file1), 'a=1\n')
+        self.assertEqual(self.read(backup_file2), 'a=2\n')
+
+    @mock.patch('pki.upgrade.reflink', return_value=False)
+    def test_shared_backup(self, _):
+        scriptlet1 = self.create_scriptlet('1')
+        scriptlet2 = self.create_scriptlet('2')
+
+        scriptlet1.backup(self.cs_cfg)
+        scriptlet2.backup(self.cs_cfg)
+
+        # an unchanged file is stored once
+        backup_file1 = os.path.join(
+            scriptlet1.get_backup_dir(), 'oldfiles') + self.cs_cfg
+        backup_file2 = os.path.join(
+            scriptlet2.get_backup_dir(), 'oldfiles') + self.cs_cfg
+
+        self.assertTrue(os.path.samefile(backup_file1, backup_file2))
+        self.assertFalse(os.path.samefile(backup_file1, self.cs_cfg))
+
+
+SCRIPTLET = u'''
+import io
+
+import pki.upgrade
+
+
+class ChangeConfig(pki.upgrade.PKIUpgradeScriptlet):
+
+    def __init__(self):
+        super(ChangeConfig, self).__init__()
+        self.message = 'Change config'
+
+    def upgrade_system(self):
+        self.backup(%(path)r)
+        with io.open(%(path)r, 'w') as f:
+            f.write(u'a=2\\n')
+        %(error)s
+'''
+
+
+class PKIUpgraderScriptletTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+        self.config = os.path.join(self.tmpdir, 'CS.cfg')
+        with io.open(self.config, 'w') as f:
+            f.write(u'a=1\n')
+
+        self.upgrade_dir = os.path.join(self.tmpdir, 'upgrade')
+        self.version = pki.util.Version('10.11.0')
+        self.version.next = pki.util.Version('10.11.1')
+
+        # scriptlet classes are cached per file
+        patcher = mock.patch.dict(pki.upgrade.scriptlet_classes, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        backup_dir = os.path.join(self.tmpdir, 'backup')
+        patcher = mock.patch.object(
+            pki.upgrade.PKIUpgradeScriptlet, 'get_backup_dir',
+            lambda scriptlet: '%s/%s/%s' % (backup_dir, scriptlet.version, scriptlet.index))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_scriptlet(self, error=''):
+        version_dir = os.path.join(self.upgrade_dir, str(self.version))
+        os.makedirs(version_dir)
+
+        with io.open(os.path.join(version_dir, '01-ChangeConfig.py'), 'w') as f:
+            f.write(SCRIPTLET % {'path': self.config, 'error': error})
+
+    def create_upgrader(self):
+        upgrader = pki.upgrade.PKIUpgrader(upgrade_dir=self.upgrade_dir)
+        upgrader.tracker = mock.Mock(filename=os.path.join(self.tmpdir, 'tracker'))
+        return upgrader
+
+    def test_scriptlet_class_cache(self):
+        self.create_scriptlet()
+
+        with mock.patch.object(pki.upgrade, 'compile', create=True,
+                               wraps=compile) as compile_scriptlet:
+            scriptlets1 = self.create_upgrader().scriptlets(self.version)
+            scriptlets2 = self.create_upgrader().scriptlets(self.version)
+
+        # the file is compiled once but each upgrader gets its own objects
+        compile_scriptlet.assert_called_once()
+        self.assertIs(type(scriptlets1[0]), type(scriptlets2[0]))
+        self.assertIsNot(scriptlets1[0], scriptlets2[0])
+
+        self.assertEqual(scriptlets1[0].index, 1)
+        self.assertEqual(scriptlets1[0].message, 'Change config')
+        self.assertTrue(scriptlets1[0].last)
+
+    def test_upgrade_version(self):
+        self.create_scriptlet()
+        upgrader = self.create_upgrader()
+
+        upgrader.upgrade_version(self.version)
+
+        with io.open(self.config) as f:
+            self.assertEqual(f.read(), u'a=2\n')
+
+        upgrader.tracker.set_version.assert_called_once_with(self.version.next)
+
+    def test_upgrade_version_failure(self):
+        self.create_scriptlet(error='raise Exception("Upgrade failed")')
+        upgrader = self.create_upgrader()
+
+        with self.assertRaisesRegex(Exception, 'Upgrade failed'):
+            upgrader.upgrade_version(self.version)
+
+        # the changes of the failed scriptlet are reverted
+        with io.open(self.config) as f:
+            self.assertEqual(f.read(), u'a=1\n')
+
+        # the tracker still points to the last completed scriptlet
+        upgrader.tracker.set_index.assert_not_called()
+        upgrader.tracker.set_version.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
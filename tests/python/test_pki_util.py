@@ -0,0 +1,194 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# Copyright (C) 2021 Red Hat, Inc.
+# All rights reserved.
+#
+
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import pki.util
+
+CONFIG = u'''# header comment
+a.name=value a
+b.name=multi \\
+line
+
+# comment for d
+d.name=value d
+e.name=
+'''
+
+
+class PropertiesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'CS.cfg')
+
+        with open(self.filename, 'w') as f:
+            f.write(CONFIG)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self):
+        with open(self.filename) as f:
+            return f.read()
+
+    def test_load_properties(self):
+
+        properties = {}
+        pki.util.load_properties(self.filename, properties)
+
+        self.assertEqual(properties, {
+            'a.name': 'value a',
+            'b.name': 'multi line',
+            'd.name': 'value d',
+            'e.name': ''
+        })
+
+        # cached snapshot is not shared with the caller
+        properties['a.name'] = 'changed'
+
+        properties = {}
+        pki.util.load_properties(self.filename, properties)
+        self.assertEqual(properties['a.name'], 'value a')
+
+    def test_store_unchanged_properties(self):
+
+        properties = {}
+        pki.util.load_properties(self.filename, properties)
+
+        stamp = pki.util.get_properties_stamp(self.filename)
+        pki.util.store_properties(self.filename, properties)
+
+        self.assertEqual(pki.util.get_properties_stamp(self.filename), stamp)
+        self.assertEqual(self.read(), CONFIG)
+
+    def test_store_changed_properties(self):
+
+        properties = {}
+        pki.util.load_properties(self.filename, properties)
+
+        properties['b.name'] = 'single line'
+        properties['c.name'] = 'value c'
+        properties['f.name'] = 10
+        del properties['e.name']
+
+        pki.util.store_properties(self.filename, properties)
+
+        self.assertEqual(self.read(), u'''# header comment
+a.name=value a
+b.name=single line
+c.name=value c
+
+# comment for d
+d.name=value d
+f.name=10
+''')
+
+        reloaded = {}
+        pki.util.load_properties(self.filename, reloaded)
+        properties['f.name'] = '10'
+        self.assertEqual(reloaded, properties)
+
+    def test_store_externally_modified_properties(self):
+
+        properties = {}
+        pki.util.load_properties(self.filename, properties)
+
+        with open(self.filename, 'a') as f:
+            f.write(u'z.name=value z\n')
+
+        properties['a.name'] = 'new value'
+        pki.util.store_properties(self.filename, properties)
+
+        # file is rewritten with the given properties only
+        self.assertEqual(self.read(), u'''a.name=new value
+b.name=multi line
+d.name=value d
+e.name=
+''')
+
+    def test_store_modified_properties_same_stamp(self):
+
+        properties = {}
+        pki.util.load_properties(self.filename, properties)
+
+        # modify the file without changing its size or timestamp
+        st = os.stat(self.filename)
+        with open(self.filename, 'r+') as f:
+            f.write(u'# HEADER')
+        os.utime(self.filename, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        self.assertEqual(
+            pki.util.get_properties_stamp(self.filename),
+            pki.util.properties_snapshots[os.path.realpath(self.filename)].stamp)
+
+        properties['a.name'] = 'new value'
+        pki.util.store_properties(self.filename, properties)
+
+        # the change is detected, so the file is rewritten
+        self.assertEqual(self.read(), u'''a.name=new value
+b.name=multi line
+d.name=value d
+e.name=
+''')
+
+    def test_store_properties_replaces_file(self):
+
+        os.chmod(self.filename, 0o640)
+
+        properties = {}
+        pki.util.load_properties(self.filename, properties)
+
+        inode = os.stat(self.filename).st_ino
+
+        properties['a.name'] = 'new value'
+        pki.util.store_properties(self.filename, properties)
+
+        st = os.stat(self.filename)
+        self.assertNotEqual(st.st_ino, inode)
+        self.assertEqual(st.st_mode & 0o777, 0o640)
+        self.assertEqual(os.listdir(self.tmpdir), ['CS.cfg'])
+        self.assertIn(u'a.name=new value\n', self.read())
+
+    def test_store_properties_in_place(self):
+
+        properties = {}
+        pki.util.load_properties(self.filename, properties)
+
+        inode = os.stat(self.filename).st_ino
+
+        # the directory is not writable
+        with mock.patch('tempfile.mkstemp',
+                        side_effect=OSError(errno.EACCES, 'Permission denied')):
+            properties['a.name'] = 'new value'
+            pki.util.store_properties(self.filename, properties)
+
+        self.assertEqual(os.stat(self.filename).st_ino, inode)
+        self.assertIn(u'a.name=new value\n', self.read())
+
+
+if __name__ == '__main__':
+    unittest.main()